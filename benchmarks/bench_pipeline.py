@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Benchmark the pipeline stages on a synthetic question bank.
+
+Generates a bank with generate_qbank.py, extracts it once, then times
+each stage into fresh output directories:
+
+    python benchmarks/bench_pipeline.py                      # 120 questions, compare with the baseline
+    python benchmarks/bench_pipeline.py --save-baseline      # record this run as the new baseline
+    python benchmarks/bench_pipeline.py --questions 1000 --figures 4 mdbook sheet
+
+Every run is written to benchmarks/results/run-<timestamp>.json. If a
+baseline exists (benchmarks/results/baseline.json by default, or any
+earlier run given with --baseline) each stage is compared with it, and
+stages slower by more than --threshold are reported as regressions and
+make the command exit with status 1.
+
+The Anki deck stages and extraction only handle questions 1-120, so their
+time stops growing beyond that bank size.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import progress  # noqa: E402
+from generate_qbank import add_bank_arguments, generate_bank  # noqa: E402
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_FILE = os.path.join(RESULTS_DIR, "baseline.json")
+DEFAULT_THRESHOLD = 0.2
+
+
+def _extract(bank, out_dir):
+    import extract_and_normalize
+    extract_and_normalize.ZIPS_DIR = os.path.join(bank, "zips")
+    extract_and_normalize.EXTRACT_DIR = out_dir
+    extract_and_normalize.BASE_DIR = bank
+    extract_and_normalize.process_zip_files()
+
+
+def _anki_deck_markdown(bank, out_dir):
+    import generate_anki_deck
+    # Question folders are looked up in BASE_DIR before any zip is extracted
+    generate_anki_deck.BASE_DIR = os.path.join(bank, "normalized_questions")
+    generate_anki_deck.EXTRACT_DIR = os.path.join(out_dir, "extracted")
+    generate_anki_deck.ZIPS_DIR = os.path.join(out_dir, "zips")
+    generate_anki_deck.generate_markdown(os.path.join(out_dir, "anki_deck.md"), os.path.join(out_dir, "media"))
+
+
+def _md2anki_markdown(bank, out_dir):
+    import generate_anki_with_md2anki
+    generate_anki_with_md2anki.QUESTIONS_DIR = Path(bank) / "normalized_questions"
+    generate_anki_with_md2anki.generate_markdown(Path(out_dir))
+
+
+def _mdbook(bank, out_dir):
+    import create_mdbook
+    create_mdbook.build_book(os.path.join(bank, "normalized_questions"), out_dir)
+
+
+def _mkdoc(bank, out_dir):
+    from to_mkdoc import MkdocConverter
+    MkdocConverter(os.path.join(bank, "normalized_questions"), out_dir).convert_all()
+
+
+def _sheet(bank, out_dir):
+    import to_sheets
+    to_sheets.export_sheet(Path(bank) / "normalized_questions", Path(out_dir) / "questions_sheet.xlsx")
+
+
+# Stage name -> function(bank dir, fresh output dir)
+STAGES = {
+    "extract": _extract,
+    "anki-deck": _anki_deck_markdown,
+    "md2anki": _md2anki_markdown,
+    "mdbook": _mdbook,
+    "mkdoc": _mkdoc,
+    "sheet": _sheet,
+}
+
+
+def time_stage(build, bank, repeat):
+    """Run a stage repeat times into fresh directories. Returns the wall times in seconds."""
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="bench_out_") as tmp:
+        for run in range(repeat):
+            out_dir = os.path.join(tmp, str(run))
+            os.makedirs(out_dir)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                build(bank, out_dir)
+                runs.append(time.perf_counter() - start)
+    return runs
+
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bank_options(args):
+    return {
+        "questions": args.questions,
+        "figures": args.figures,
+        "figure_size": list(args.figure_size),
+        "nested": args.nested,
+        "rar": args.rar,
+        "cjk": args.cjk,
+        "seed": args.seed,
+    }
+
+
+def run_benchmarks(args, stage_names):
+    """Generate the bank, time every stage and return the results dict."""
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "bank": bank_options(args),
+        "repeat": args.repeat,
+        "stages": {},
+    }
+    reporter = progress.reporter
+    saved = reporter.verbosity, reporter.log_file, reporter.warnings
+    with tempfile.TemporaryDirectory(prefix="bench_bank_") as bank:
+        # Keep the stages' status lines out of the timings and their
+        # warnings out of the repository's warnings.jsonl
+        reporter.configure(progress.QUIET, os.path.join(bank, "warnings.jsonl"))
+        try:
+            print(f"Generating {args.questions} questions...")
+            generate_bank(bank, args)
+            # The export stages all read the same extracted bank
+            with contextlib.redirect_stdout(io.StringIO()):
+                _extract(bank, os.path.join(bank, "normalized_questions"))
+
+            for name in stage_names:
+                try:
+                    runs = time_stage(STAGES[name], bank, args.repeat)
+                except ImportError as e:
+                    print(f"- {name}: skipped ({e})")
+                    continue
+                results["stages"][name] = {
+                    "min": min(runs),
+                    "median": statistics.median(runs),
+                    "runs": runs,
+                }
+                print(f"  {name:<10} {min(runs):8.3f} s (median {statistics.median(runs):.3f} s)")
+        finally:
+            if reporter.warnings > saved[2]:
+                print(f"{reporter.warnings - saved[2]} warning(s) from the benchmarked stages were not logged")
+            reporter.verbosity, reporter.log_file, reporter.warnings = saved
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print each stage against the baseline. Returns the names of the regressed stages."""
+    if baseline["bank"] != results["bank"]:
+        print("Warning: the baseline was measured on a different bank, timings are not comparable")
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'} ({baseline['timestamp']}):")
+    regressions = []
+    for name, stage in results["stages"].items():
+        before = baseline["stages"].get(name)
+        if not before:
+            print(f"  {name:<10} (not in baseline)")
+            continue
+        # The fastest run is the least noisy estimate of the stage's cost
+        change = stage["min"] / before["min"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"  {name:<10} {before['min']:8.3f} s -> {stage['min']:8.3f} s  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on a synthetic bank")
+    parser.add_argument("stages", nargs="*", help=f"stages to run (default: all of {', '.join(STAGES)})")
+    add_bank_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (default: 3)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="results file to compare with (default: results/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"slowdown reported as a regression (default: {DEFAULT_THRESHOLD:.0%})")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    results = run_benchmarks(args, args.stages or list(STAGES))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    run_file = os.path.join(RESULTS_DIR, f"run-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(run_file, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults: {run_file}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
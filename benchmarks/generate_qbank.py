@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic question bank for benchmarks.
+
+Writes <root>/zips/NNN.zip (or .rar) archives laid out like real exports,
+so extract_and_normalize.py can process them:
+
+    python benchmarks/generate_qbank.py /tmp/qbank --questions 500
+    python benchmarks/generate_qbank.py /tmp/qbank --questions 120 --figures 3 \\
+        --figure-size 800x600 --nested 0.5 --rar 0.2 --cjk 0.7
+
+Figures are PNGs of random pixels, so their size on disk is roughly
+width * height * 3 bytes. RAR archives need the `rar` command; without it
+every archive is written as a ZIP.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import zipfile
+import zlib
+
+OPTION_LETTERS = ("A", "B", "C", "D", "E")
+
+ENGLISH_WORDS = (
+    "patient", "tumor", "metastasis", "chemotherapy", "radiotherapy", "biopsy", "stage", "grade",
+    "survival", "dose", "toxicity", "mutation", "receptor", "lymph", "node", "response", "trial",
+    "median", "progression", "adjuvant", "neoadjuvant", "carcinoma", "lymphoma", "leukemia",
+)
+CJK_WORDS = (
+    "病人", "腫瘤", "轉移", "化學治療", "放射治療", "切片", "分期", "存活率", "劑量", "毒性",
+    "突變", "受體", "淋巴結", "反應", "臨床試驗", "中位數", "惡化", "輔助治療", "癌症", "白血病",
+)
+
+
+def png_bytes(width, height, rng):
+    """Return a valid RGB PNG of random pixels."""
+    row_size = width * 3
+    noise = rng.randbytes(row_size * height)
+    raw = b"".join(b"\x00" + noise[y * row_size:(y + 1) * row_size] for y in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+def sentence(rng, cjk, words=(6, 20)):
+    """Return a random sentence; each word is CJK with probability cjk."""
+    count = rng.randint(*words)
+    parts = [rng.choice(CJK_WORDS) if rng.random() < cjk else rng.choice(ENGLISH_WORDS) for _ in range(count)]
+    return " ".join(parts)
+
+
+def question_files(number, rng, args):
+    """Return {relative path: bytes} of one question folder."""
+    files = {
+        "question.txt": "\n".join(sentence(rng, args.cjk) for _ in range(rng.randint(1, 4))),
+        "correct_answer.txt": rng.choice(OPTION_LETTERS),
+        "explain.txt": "\n".join(sentence(rng, args.cjk, (10, 40)) for _ in range(rng.randint(2, 8))),
+    }
+    for letter in OPTION_LETTERS:
+        files[f"option_{letter}.txt"] = sentence(rng, args.cjk, (2, 10))
+    # Real banks contain headings, which extraction turns into dashes
+    files["explain.txt"] = f"## Question {number}\n" + files["explain.txt"]
+    files = {name: text.encode("utf-8") for name, text in files.items()}
+
+    width, height = args.figure_size
+    for idx in range(args.figures):
+        figures = "question_figures" if idx % 2 == 0 else "explain_figures"
+        # Some names contain spaces, which extraction normalizes
+        name = f"figure {idx + 1}.png" if rng.random() < 0.3 else f"figure{idx + 1}.png"
+        files[f"{figures}/{name}"] = png_bytes(width, height, rng)
+    for figures in ("question_figures", "explain_figures"):
+        files.setdefault(f"{figures}/", b"")
+    return files
+
+
+def write_zip(archive_path, prefix, files):
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in sorted(files.items()):
+            archive.writestr(prefix + name, data)
+
+
+def write_rar(archive_path, prefix, files):
+    """Write files with the rar command; return False when it is not available."""
+    rar = shutil.which("rar")
+    if not rar:
+        return False
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, data in files.items():
+            path = os.path.join(tmp, prefix + name)
+            if name.endswith("/"):
+                os.makedirs(path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        top = prefix.split("/")[0] if prefix else "."
+        result = subprocess.run([rar, "a", "-r", "-idq", os.path.abspath(archive_path), top],
+                                cwd=tmp, capture_output=True)
+    return result.returncode == 0
+
+
+def generate_bank(root, args):
+    """Write the synthetic archives under root/zips. Returns the number of archives per type."""
+    rng = random.Random(args.seed)
+    zips_dir = os.path.join(root, "zips")
+    os.makedirs(zips_dir, exist_ok=True)
+    counts = {"zip": 0, "rar": 0, "nested": 0}
+    rar_missing = False
+
+    for number in range(1, args.questions + 1):
+        folder = f"{number:03d}"
+        files = question_files(number, rng, args)
+        # Flat archives hold NNN/..., nested ones NNN/NNN/...
+        nested = rng.random() < args.nested
+        prefix = f"{folder}/{folder}/" if nested else f"{folder}/"
+        counts["nested"] += nested
+
+        if rng.random() < args.rar and not rar_missing:
+            if write_rar(os.path.join(zips_dir, f"{folder}.rar"), prefix, files):
+                counts["rar"] += 1
+                continue
+            rar_missing = True
+            print("Warning: rar is not available, writing ZIP archives instead")
+        write_zip(os.path.join(zips_dir, f"{folder}.zip"), prefix, files)
+        counts["zip"] += 1
+    return counts
+
+
+def parse_size(value):
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value!r}")
+    return width, height
+
+
+def add_bank_arguments(parser):
+    """Add the bank shape options to an argparse parser."""
+    parser.add_argument("--questions", type=int, default=120, help="number of questions (default: 120)")
+    parser.add_argument("--figures", type=int, default=2, help="figures per question (default: 2)")
+    parser.add_argument("--figure-size", type=parse_size, default=(400, 300),
+                        help="figure size as WIDTHxHEIGHT (default: 400x300)")
+    parser.add_argument("--nested", type=float, default=0.3,
+                        help="fraction of archives with a nested NNN/NNN layout (default: 0.3)")
+    parser.add_argument("--rar", type=float, default=0.0, help="fraction of RAR archives (default: 0)")
+    parser.add_argument("--cjk", type=float, default=0.5, help="fraction of CJK words in the text (default: 0.5)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    return parser
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic question bank")
+    parser.add_argument("root", help="directory to create the bank in (zips/ is written inside)")
+    add_bank_arguments(parser)
+    args = parser.parse_args()
+
+    counts = generate_bank(args.root, args)
+    print(f"Wrote {counts['zip']} ZIP and {counts['rar']} RAR archives "
+          f"({counts['nested']} nested) to {os.path.join(args.root, 'zips')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
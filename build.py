@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Rebuild only what changed: an input-hash-aware build of the pipeline stages.
+只重建有變更的部分：依輸入雜湊決定要執行的步驟與題目
+
+    python build.py                      # extract, deck, mdbook, mkdoc (make all)
+    python build.py mdbook sheet html
+    python build.py --dry-run            # only show what would be rebuilt
+    python build.py --force              # rebuild everything
+
+Every stage knows its inputs per question: the archive (or NNN folder)
+of each question for extract and anki-deck, and the files under
+normalized_questions/NNN for the other exporters. Inputs are hashed
+(SHA-256, with the digests of unchanged files kept in .build/ so they are
+not re-read), and each stage also hashes its own scripts and options.
+The hashes of the last successful run are stored in .build/state.json.
+
+A stage whose scripts, options and question hashes are unchanged and
+whose outputs exist is skipped. Otherwise extract re-extracts only the
+changed archives, and deck, mdbook, mkdoc and mkdocs rewrite only the
+changed questions (as watch.py does); a changed script or option, an
+added or removed question, or a missing output rebuilds the stage in
+full. html, sheet, columnar, anki-deck and md2anki have no per-question
+updates and are rebuilt in full when any of their questions changed.
+The exporters only depend on extract, so they run concurrently on a
+process pool once extraction is done.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import progress
+from media_utils import add_media_arguments, file_sha256, load_digest_index, save_digest_index
+from output_utils import write_if_changed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ZIPS_DIR = os.path.join(BASE_DIR, "zips")
+NORMALIZED_DIR = os.path.join(BASE_DIR, "normalized_questions")
+BUILD_DIR = os.path.join(BASE_DIR, ".build")
+STATE_FILE = os.path.join(BUILD_DIR, "state.json")
+DIGEST_INDEX = os.path.join(BUILD_DIR, "digests.json")
+STATE_VERSION = 1
+
+DEFAULT_STAGES = ("extract", "deck", "mdbook", "mkdoc")
+
+# Scripts whose changes invalidate every output
+SHARED_SOURCES = ("media_utils.py", "output_utils.py", "question_loader.py", "reproducible.py", "watch.py")
+
+# Stage -> scripts that produce its outputs
+STAGE_SOURCES = {
+    "extract": ("extract_and_normalize.py",),
+    "deck": ("convert_to_mdankideck.py",),
+    "anki-deck": ("generate_anki_deck.py",),
+    "md2anki": ("generate_anki_with_md2anki.py",),
+    "mdbook": ("create_mdbook.py",),
+    "mkdoc": ("to_mkdoc.py", "mkdocs_index.py"),
+    "mkdocs": ("txt2md.py", "mkdocs_index.py"),
+    "html": ("to_html.py",),
+    "sheet": ("to_sheets.py",),
+    "columnar": ("to_columnar.py", "to_sheets.py"),
+}
+
+# Stage -> outputs that must exist for the stage to be skipped
+STAGE_OUTPUTS = {
+    "deck": ("anki_markdown_decks/medical_questions.md", "medical_questions.apkg"),
+    "anki-deck": ("md_input/anki_deck.md",),
+    "md2anki": ("markdown_input/anki_deck.md",),
+    "mdbook": ("mdbook/book.toml", "mdbook/src/SUMMARY.md"),
+    "mkdoc": ("mkdoc.yml", "mkdoc"),
+    "mkdocs": ("mkdocs.yml", "mkdocs"),
+    "html": ("html_bundle/questions.html",),
+    "sheet": ("questions_sheet.xlsx",),
+    "columnar": ("columnar/questions.jsonl",),
+}
+
+# Stages that read the archives rather than normalized_questions
+ARCHIVE_STAGES = ("extract", "anki-deck")
+
+# Question folders in the project root are used for questions without an archive
+ROOT_QUESTIONS = range(1, 121)
+
+
+def tree_hash(directory):
+    """Hash the names and contents of the files under directory, skipping dotfiles."""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, directory).encode("utf-8") + b"\0")
+            digest.update(file_sha256(path).encode("ascii"))
+    return digest.hexdigest()
+
+
+def archive_sources():
+    """Return {question number: archive or NNN folder} the way process_zip_files picks them."""
+    from extract_and_normalize import archive_question_number
+
+    sources = {}
+    if os.path.isdir(ZIPS_DIR):
+        names = sorted(name for name in os.listdir(ZIPS_DIR)
+                       if not name.startswith(".") and name.endswith((".zip", ".rar")))
+        for name in names:
+            question_num = archive_question_number(name)
+            if question_num is not None:
+                # The first archive of a question wins, later ones are skipped
+                sources.setdefault(question_num, os.path.join(ZIPS_DIR, name))
+    for question_num in ROOT_QUESTIONS:
+        source_dir = os.path.join(BASE_DIR, f"{question_num:03d}")
+        if question_num not in sources and os.path.isdir(source_dir):
+            sources[question_num] = source_dir
+    return sources
+
+
+def archive_hashes(sources):
+    """Return {NNN: hash} of the archive or folder of every question."""
+    return {
+        f"{num:03d}": tree_hash(path) if os.path.isdir(path) else file_sha256(path)
+        for num, path in sorted(sources.items())
+    }
+
+
+def question_hashes(normalized_dir=NORMALIZED_DIR):
+    """Return {NNN: hash} of every question folder in normalized_dir."""
+    if not os.path.isdir(normalized_dir):
+        return {}
+    return {
+        name: tree_hash(os.path.join(normalized_dir, name))
+        for name in sorted(os.listdir(normalized_dir), key=lambda name: (len(name), name))
+        if name.isdigit() and os.path.isdir(os.path.join(normalized_dir, name))
+    }
+
+
+def config_hash(stage, options):
+    """Hash the scripts of stage together with the options that change its outputs."""
+    digest = hashlib.sha256()
+    for name in SHARED_SOURCES + STAGE_SOURCES[stage]:
+        path = os.path.join(BASE_DIR, name)
+        digest.update(name.encode("utf-8") + b"\0")
+        digest.update(file_sha256(path).encode("ascii") if os.path.exists(path) else b"-")
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def media_options(args):
+    """The media options that change the exported figures (not how fast they are made)."""
+    names = ("media_mode", "optimize_images", "jpeg_quality", "max_dimension", "webp", "thumbnails",
+             "thumbnail_widths")
+    options = {name: getattr(args, name) for name in names if hasattr(args, name)}
+    options["SOURCE_DATE_EPOCH"] = os.environ.get("SOURCE_DATE_EPOCH")
+    return options
+
+
+def load_state(state_file=STATE_FILE):
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {"version": STATE_VERSION, "stages": {}}
+    if state.get("version") != STATE_VERSION:
+        return {"version": STATE_VERSION, "stages": {}}
+    return state
+
+
+def save_state(state, state_file=STATE_FILE):
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    write_if_changed(state_file, json.dumps(state, indent=1, sort_keys=True) + "\n")
+
+
+def outputs_exist(stage):
+    return all(os.path.exists(os.path.join(BASE_DIR, path)) for path in STAGE_OUTPUTS.get(stage, ()))
+
+
+class Plan:
+    """What one stage has to do: nothing, update some questions, or rebuild."""
+
+    def __init__(self, stage, config, hashes, previous, force=False):
+        self.stage = stage
+        self.config = config
+        self.hashes = hashes
+        previous = previous or {}
+        old = previous.get("questions", {})
+        self.changed = sorted((name for name in hashes if old.get(name) != hashes[name]), key=int)
+        self.removed = sorted((name for name in old if name not in hashes), key=int)
+        if force:
+            self.reason = "forced"
+        elif not previous:
+            self.reason = "first build"
+        elif previous.get("config") != config:
+            self.reason = "scripts or options changed"
+        elif stage != "extract" and not outputs_exist(stage):
+            self.reason = "outputs missing"
+        elif stage != "extract" and (self.removed or set(hashes) - set(old)):
+            self.reason = "questions added or removed"
+        else:
+            self.reason = None
+
+    @property
+    def full(self):
+        return self.reason is not None
+
+    @property
+    def up_to_date(self):
+        return not self.full and not self.changed
+
+    def describe(self):
+        if self.up_to_date:
+            return f"{self.stage}: up to date"
+        if self.full:
+            return f"{self.stage}: rebuild ({self.reason})"
+        return f"{self.stage}: update {len(self.changed)} question(s) ({', '.join(self.changed[:10])}" \
+               f"{', ...' if len(self.changed) > 10 else ''})"
+
+    def record(self):
+        return {"config": self.config, "questions": self.hashes}
+
+
+def run_extract(plan, sources):
+    """Extract the archives (or copy the folders) of the planned questions."""
+    import extract_and_normalize
+
+    if plan.full:
+        # The extraction code changed: redo every question
+        names = sorted(plan.hashes, key=int)
+    else:
+        names = plan.changed
+    os.makedirs(NORMALIZED_DIR, exist_ok=True)
+    failed = []
+    for name in progress.track(names, "extract"):
+        source = sources[int(name)]
+        if os.path.isdir(source):
+            progress.item(f"從主目錄處理問題 {name}")
+            extract_and_normalize.normalize_folder_structure(source, int(name))
+        elif not extract_and_normalize.extract_archive(source, int(name)):
+            failed.append(name)
+    return failed
+
+
+def run_exporter(stage, plan, args):
+    """Bring one exporter up to date. Runs in a worker process; returns (stage, error, seconds)."""
+    from watch import INCREMENTAL_EXPORTERS, make_exporters
+    from media_utils import media_from_args
+    from question_loader import list_question_dirs, load_question
+
+    start = time.perf_counter()
+    try:
+        exporter = make_exporters([stage], media_from_args(args), package=True, normalized_dir=NORMALIZED_DIR)[0]
+        question_dirs = list_question_dirs(NORMALIZED_DIR)
+        records = [load_question(question_dir) for question_dir in question_dirs]
+        if plan.full or stage not in INCREMENTAL_EXPORTERS:
+            exporter.build(records)
+        else:
+            changed = set(plan.changed)
+            exporter.update([d for d in question_dirs if d.name in changed], records)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return stage, error, time.perf_counter() - start
+
+
+def run_exporters(plans, args, jobs=None):
+    """Run the planned exporters, concurrently unless jobs is 1. Yields their results as they finish."""
+    if len(plans) == 1 or jobs == 1:
+        for plan in plans:
+            yield run_exporter(plan.stage, plan, args)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=min(len(plans), jobs or os.cpu_count() or 1)) as executor:
+        futures = [executor.submit(run_exporter, plan.stage, plan, args) for plan in plans]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def build(stages, args):
+    """Run the stages that are out of date. Returns the names of the stages that failed."""
+    load_digest_index(DIGEST_INDEX)
+    state = load_state()
+    failed = []
+    try:
+        options = media_options(args)
+        stage_state = state["stages"]
+
+        if "extract" in stages or "anki-deck" in stages:
+            sources = archive_sources()
+            inputs = archive_hashes(sources)
+        if "extract" in stages:
+            plan = Plan("extract", config_hash("extract", {}), inputs, stage_state.get("extract"), args.force)
+            print(plan.describe())
+            if not plan.up_to_date and not args.dry_run:
+                errors = run_extract(plan, sources)
+                # Failed questions are retried on the next build
+                record = plan.record()
+                for name in errors:
+                    record["questions"].pop(name, None)
+                    progress.warn(f"extract: question {name} failed")
+                stage_state["extract"] = record
+                save_state(state)
+                if errors:
+                    failed.append("extract")
+
+        exporters = [stage for stage in stages if stage != "extract"]
+        if not exporters:
+            return failed
+        normalized = question_hashes()
+        plans = []
+        for stage in exporters:
+            hashes = inputs if stage in ARCHIVE_STAGES else normalized
+            plan = Plan(stage, config_hash(stage, options), hashes, stage_state.get(stage), args.force)
+            print(plan.describe())
+            if not plan.up_to_date:
+                plans.append(plan)
+        if not plans or args.dry_run:
+            return failed
+
+        by_stage = {plan.stage: plan for plan in plans}
+        for stage, error, seconds in run_exporters(plans, args, args.jobs):
+            if error:
+                # Left out of the state, so the stage is retried on the next build
+                progress.warn(f"{stage}: {error}")
+                stage_state.pop(stage, None)
+                failed.append(stage)
+            else:
+                print(f"{stage}: done in {seconds:.1f} s")
+                stage_state[stage] = by_stage[stage].record()
+            save_state(state)
+    finally:
+        os.makedirs(BUILD_DIR, exist_ok=True)
+        save_digest_index(DIGEST_INDEX)
+    return failed
+
+
+def main():
+    from watch import FULL_EXPORTERS, INCREMENTAL_EXPORTERS
+
+    known = ("extract",) + tuple(INCREMENTAL_EXPORTERS) + FULL_EXPORTERS
+    parser = argparse.ArgumentParser(description="Rebuild the stages and questions whose inputs changed")
+    parser.add_argument("stages", nargs="*", metavar="STAGE",
+                        help=f"stages to bring up to date: {', '.join(known)} (default: {' '.join(DEFAULT_STAGES)})")
+    parser.add_argument("--force", action="store_true", help="rebuild every stage in full")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would be rebuilt")
+    parser.add_argument("-j", "--jobs", type=int, help="number of exporters run at the same time (default: one per CPU)")
+    add_media_arguments(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+
+    unknown = [stage for stage in args.stages if stage not in known]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    # Every exporter reads what extract writes, so extract always comes first
+    stages = ["extract"] + [stage for stage in known if stage in (args.stages or DEFAULT_STAGES) and stage != "extract"]
+
+    start = time.perf_counter()
+    failed = build(stages, args)
+    print(f"Build finished in {time.perf_counter() - start:.2f} s" + (f"; failed: {', '.join(failed)}" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,20 @@
 #!/usr/bin/env python3
 
-import os
+import argparse
+import re
+import shutil
+import sys
 from pathlib import Path
 
+import instrumentation
+import progress
+import sharding
+from reproducible import ANKI_REWRITE, normalize_zip
+
+QUESTIONS_DIR = Path("normalized_questions")
+OUTPUT_DIR = Path("anki_markdown_decks")
+DECK_TITLE = "Medical Questions"
+
 
 def read_file(filepath):
     """Read and return the content of a file."""
@@ -53,32 +65,29 @@ def create_anki_card(question_dir, question_num):
     return card
 
 
-def main():
-    # Path to normalized questions directory
-    questions_dir = Path("normalized_questions")
-
-    # Create output directory for markdown files
-    output_dir = Path("anki_markdown_decks")
-    output_dir.mkdir(exist_ok=True)
-
-    # Get all question directories and sort them numerically
+def list_question_dirs(questions_dir):
+    """Return the question directories sorted numerically."""
     question_dirs = [d for d in questions_dir.iterdir() if d.is_dir()]
     question_dirs.sort(key=lambda x: int(x.name))
+    return question_dirs
+
 
+def write_single_deck(question_dirs, output_dir):
+    """Write every card into one medical_questions.md deck."""
     # Create markdown content
     cards = []
 
     # Add deck title
-    cards.append("# Medical Questions\n")
+    cards.append(f"# {DECK_TITLE}\n")
 
-    for q_dir in question_dirs:
+    for q_dir in instrumentation.questions(progress.track(question_dirs, "deck")):
         try:
             question_num = int(q_dir.name)
             card = create_anki_card(q_dir, question_num)
             cards.append(card)
-            print(f"Processed question {q_dir.name}")
+            progress.item(f"Processed question {q_dir.name}")
         except Exception as e:
-            print(f"Error processing question {q_dir.name}: {e}")
+            progress.warn(f"Error processing question {q_dir.name}: {e}")
             continue
 
     # Join all cards
@@ -89,14 +98,177 @@ def main():
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(markdown_content)
 
-    print(f"\nSuccessfully created {output_path} with {len(cards) - 1} cards")
+    return output_path, len(cards) - 1
+
+
+def normalize_package(apkg_path):
+    """Pin zip timestamps, member order and collection ids of a generated .apkg."""
+    if apkg_path.exists():
+        normalize_zip(apkg_path, rewrite=ANKI_REWRITE)
+
+
+def parse_size(value):
+    """Parse a byte size such as 500000, 200K, 50M or 1G."""
+    match = re.fullmatch(r"\s*(\d+)\s*([KMG]?)B?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size: {value}")
+    number, unit = match.groups()
+    return int(number) * 1024 ** " KMG".index(unit.upper() or " ")
+
+
+def question_size(question_dir):
+    """Return the bytes a question adds to a package.
+
+    The cards carry only the question's text (figures are not embedded),
+    so this is the size of its text files.
+    """
+    return sum(path.stat().st_size for path in question_dir.glob("*.txt"))
+
+
+def split_into_chunks(question_dirs, max_cards=None, max_bytes=None):
+    """Group consecutive question directories into chunks.
+
+    A chunk is closed when adding the next question would exceed max_cards
+    cards or max_bytes bytes of question text. A question larger than the
+    byte budget still gets a chunk of its own.
+    """
+    chunks = []
+    current = []
+    current_bytes = 0
+    for q_dir in question_dirs:
+        size = question_size(q_dir) if max_bytes else 0
+        too_many = max_cards and len(current) >= max_cards
+        too_big = max_bytes and current and current_bytes + size > max_bytes
+        if too_many or too_big:
+            chunks.append(current)
+            current = []
+            current_bytes = 0
+        current.append(q_dir)
+        current_bytes += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def render_deck(title, question_dirs):
+    """Render a deck title and its cards as markdown-anki-decks markdown."""
+    cards = [f"# {title}\n"]
+    for q_dir in instrumentation.questions(progress.track(question_dirs, title)):
+        try:
+            question_num = int(q_dir.name)
+            cards.append(create_anki_card(q_dir, question_num))
+        except Exception as e:
+            progress.warn(f"Error processing question {q_dir.name}: {e}")
+    return "\n\n".join(cards), len(cards) - 1
+
+
+def package_deck(markdown_dir, package_dir):
+    """Run mdankideck on a directory of markdown decks.
+
+    Returns True when it succeeded and wrote an .apkg for every deck;
+    packages left from an earlier run are removed first, so they do not
+    count as output.
+    """
+    packages = [Path(package_dir) / f"{path.stem}.apkg" for path in sorted(Path(markdown_dir).glob("*.md"))]
+    for package in packages:
+        if package.exists():
+            package.unlink()
+    result = instrumentation.run_subprocess(
+        "mdankideck",
+        f"source .venv/bin/activate && mdankideck {markdown_dir} {package_dir}",
+        shell=True,
+        executable="/bin/bash",
+    )
+    return result.returncode == 0 and bool(packages) and all(package.exists() for package in packages)
+
+
+def build_chunk(title, stem, question_dirs, chunk_dir, package_dir):
+    """Render one chunk into its own directory and package it."""
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    markdown_content, card_count = render_deck(title, question_dirs)
+    with open(chunk_dir / f"{stem}.md", "w", encoding="utf-8") as f:
+        f.write(markdown_content)
+    ok = package_deck(chunk_dir, package_dir)
+    if ok:
+        normalize_package(Path(package_dir) / f"{stem}.apkg")
+    return stem, card_count, ok
+
+
+def build_split_decks(chunks, output_dir, package_dir=".", workers=None):
+    """Render and package every chunk as a sub-deck on its own worker.
+
+    Each chunk becomes "Medical Questions::NNN-NNN", so Anki places all
+    packages under the same parent deck.
+    """
+    split_dir = output_dir / "split"
+    if split_dir.exists():
+        shutil.rmtree(split_dir)
+
+    jobs = []
+    for index, chunk in enumerate(chunks, 1):
+        title = f"{DECK_TITLE}::{chunk[0].name}-{chunk[-1].name}"
+        stem = f"medical_questions_{index:02d}"
+        jobs.append((title, stem, chunk, split_dir / stem, package_dir))
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(build_chunk, *job) for job in jobs]
+        for future in futures:
+            stem, card_count, ok = future.result()
+            if ok:
+                progress.item(f"{stem}: {card_count} cards, packaged")
+            else:
+                progress.warn(f"{stem}: {card_count} cards, FAILED to package")
+            results.append((stem, card_count, ok))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert normalized questions to Anki decks")
+    parser.add_argument("--max-cards", type=int, help="split into sub-decks of at most this many cards")
+    parser.add_argument("--max-bytes", type=parse_size, help="split into sub-decks of at most this much question text (e.g. 100M)")
+    parser.add_argument("--workers", type=int, help="number of parallel packaging workers")
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+    if args.shard and (args.max_cards or args.max_bytes):
+        parser.error("--shard cannot be combined with --max-cards or --max-bytes")
+
+    # Create output directory for markdown files
+    output_dir = args.shard.output_path(OUTPUT_DIR) if args.shard else OUTPUT_DIR
+    package_dir = Path(args.shard.dir) if args.shard else Path(".")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Get all question directories and sort them numerically
+    question_dirs = sharding.select_questions(list_question_dirs(QUESTIONS_DIR), args.shard)
+
+    if args.max_cards or args.max_bytes:
+        chunks = split_into_chunks(question_dirs, args.max_cards, args.max_bytes)
+        print(f"Splitting {len(question_dirs)} questions into {len(chunks)} sub-decks...")
+        results = build_split_decks(chunks, output_dir, ".", args.workers)
+        failed = [stem for stem, _, ok in results if not ok]
+        if failed:
+            print(f"\nFailed to package: {', '.join(failed)}")
+            return 1
+        print(f"\nCreated {len(results)} packages under the '{DECK_TITLE}' deck")
+        return 0
+
+    output_path, card_count = write_single_deck(question_dirs, output_dir)
+    print(f"\nSuccessfully created {output_path} with {card_count} cards")
 
     # Now convert to Anki deck using markdown-anki-decks
     print("\nConverting to Anki deck...")
-    os.system(f"source .venv/bin/activate && mdankideck {output_dir} .")
+    if not package_deck(output_dir, package_dir):
+        print("\nFailed to package the deck")
+        return 1
+    normalize_package(package_dir / "medical_questions.apkg")
 
-    print("\nAnki deck should be created as medical_questions.apkg")
+    print(f"\nAnki deck should be created as {package_dir / 'medical_questions.apkg'}")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -4,19 +4,34 @@ Script to create an mdBook structure from normalized questions.
 Each question becomes a separate chapter in the mdBook.
 """
 
+import argparse
+import html
 import os
 import re
 import shutil
 import glob
 from pathlib import Path
-import natsort  # For natural sorting of filenames
+
+import instrumentation
+import progress
+import sharding
+from output_utils import WriteReport, write_if_changed
+from media_utils import MediaPipeline, SyncReport, add_media_arguments, iter_figure_paths, media_from_args
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NORMALIZED_DIR = os.path.join(BASE_DIR, "normalized_questions")
+BOOK_DIR = os.path.join(BASE_DIR, "mdbook")
+BOOK_TITLE = "Normalized Questions Collection"
 
 def ensure_dir(directory):
     """Ensure that a directory exists, creating it if necessary."""
     os.makedirs(directory, exist_ok=True)
 
-def create_book_toml(book_dir, title="Question Collection"):
-    """Create the book.toml configuration file for mdBook."""
+def create_book_toml(book_dir, title="Question Collection", fold=False):
+    """Create the book.toml configuration file for mdBook.
+
+    fold=True collapses nested sidebar sections by default.
+    """
     toml_content = f"""[book]
 title = "{title}"
 authors = ["Generated"]
@@ -29,15 +44,45 @@ preferred-dark-theme = "navy"
 curly-quotes = true
 mathjax-support = true
 """
-    with open(os.path.join(book_dir, "book.toml"), "w", encoding="utf-8") as f:
-        f.write(toml_content)
+    if fold:
+        toml_content += """
+[output.html.fold]
+enable = true
+level = 0
+"""
+    write_if_changed(os.path.join(book_dir, "book.toml"), toml_content)
+
+def natural_sort_key(s):
+    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
+
+def natural_sorted(names):
+    """Sort file names in natural order, with natsort when it is installed."""
+    try:
+        import natsort
+    except ImportError:
+        # Fallback sorting method if natsort is not available
+        return sorted(names, key=natural_sort_key)
+    return natsort.natsorted(names)
+
+def list_question_dirs(normalized_dir):
+    """Return the question directories in normalized_dir, sorted by name."""
+    return [d for d in sorted(glob.glob(os.path.join(normalized_dir, "*"))) if os.path.isdir(d)]
 
-def read_normalized_questions(normalized_dir):
-    """Read questions from the normalized_questions directory."""
+def read_normalized_questions(normalized_dir, media=None, question_dirs=None, track=True):
+    """Read questions from the normalized_questions directory.
+
+    With a MediaPipeline, figure links use the names figures get in the output.
+    question_dirs restricts reading to a subset of the question directories.
+    track=False reads without the progress line (e.g. for single previews).
+    """
+    media = media or MediaPipeline()
     questions = []
-    question_dirs = sorted(glob.glob(os.path.join(normalized_dir, "*")))
+    if question_dirs is None:
+        question_dirs = list_question_dirs(normalized_dir)
+    if track:
+        question_dirs = progress.track(question_dirs, "mdbook")
     
-    for question_dir in question_dirs:
+    for question_dir in instrumentation.questions(question_dirs):
         if not os.path.isdir(question_dir):
             continue
             
@@ -82,13 +127,7 @@ def read_normalized_questions(normalized_dir):
             question_figures = [f for f in os.listdir(question_figures_dir) 
                               if os.path.isfile(os.path.join(question_figures_dir, f))]
             # Sort figures in natural numerical order (figure1, figure9, figure12, etc.)
-            try:
-                question_figures = natsort.natsorted(question_figures)
-            except ImportError:
-                # Fallback sorting method if natsort is not available
-                def natural_sort_key(s):
-                    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
-                question_figures.sort(key=natural_sort_key)
+            question_figures = natural_sorted(question_figures)
             
         explain_figures = []
         explain_figures_dir = os.path.join(question_dir, "explain_figures")
@@ -96,13 +135,7 @@ def read_normalized_questions(normalized_dir):
             explain_figures = [f for f in os.listdir(explain_figures_dir) 
                              if os.path.isfile(os.path.join(explain_figures_dir, f))]
             # Sort figures in natural numerical order (figure1, figure9, figure12, etc.)
-            try:
-                explain_figures = natsort.natsorted(explain_figures)
-            except ImportError:
-                # Fallback sorting method if natsort is not available
-                def natural_sort_key(s):
-                    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)]
-                explain_figures.sort(key=natural_sort_key)
+            explain_figures = natural_sorted(explain_figures)
         
         # Format the question content for mdBook
         formatted_question = f"## Question {question_num}\n\n{question_content}\n\n"
@@ -112,9 +145,10 @@ def read_normalized_questions(normalized_dir):
             formatted_question += "\n**Question Figures:**\n\n"
             for fig in question_figures:
                 # Create a relative path for the image that will work in mdBook
-                fig_path = f"../normalized_questions/{question_num}/question_figures/{fig}"
-                # Add image filename as level 4 header before the image reference
-                formatted_question += f"#### {fig}\n\n![{fig}]({fig_path})\n\n"
+                fig_url = f"../normalized_questions/{question_num}/question_figures/"
+                fig_html = media.figure_html(os.path.join(question_figures_dir, fig), fig_url, fig)
+                # Add image filename as level 4 header before the image
+                formatted_question += f"#### {fig}\n\n{fig_html}\n\n"
         
         # Add options
         formatted_question += "\n**Options:**\n\n"
@@ -134,30 +168,63 @@ def read_normalized_questions(normalized_dir):
             formatted_question += "\n**Explanation Figures:**\n\n"
             for fig in explain_figures:
                 # Create a relative path for the image that will work in mdBook
-                fig_path = f"../normalized_questions/{question_num}/explain_figures/{fig}"
-                # Add image filename as level 4 header before the image reference
-                formatted_question += f"#### {fig}\n\n![{fig}]({fig_path})\n\n"
+                fig_url = f"../normalized_questions/{question_num}/explain_figures/"
+                fig_html = media.figure_html(os.path.join(explain_figures_dir, fig), fig_url, fig)
+                # Add image filename as level 4 header before the image
+                formatted_question += f"#### {fig}\n\n{fig_html}\n\n"
         
         questions.append(formatted_question)
     
     return "", questions  # Empty header, list of formatted questions
 
-def create_summary_md(book_src_dir, questions):
-    """Create the SUMMARY.md file that defines the book's structure."""
-    summary_content = "# Summary\n\n"
-    
+def create_summary_md(book_src_dir, questions, section_size=None):
+    """Create the SUMMARY.md file that defines the book's structure.
+
+    With section_size, questions are nested under one section page per
+    section_size questions, which keeps the sidebar short for large banks.
+    """
+    question_nums = []
     for i, question in enumerate(questions, 1):
         # Extract the question number from the header
         match = re.search(r'## Question (\d+)', question)
         if match:
-            question_num = match.group(1).zfill(3)  # Ensure 3-digit format
+            question_nums.append(match.group(1).zfill(3))  # Ensure 3-digit format
         else:
-            question_num = str(i).zfill(3)
-        
-        summary_content += f"- [Question {int(question_num)}](question_{question_num}.md)\n"
+            question_nums.append(str(i).zfill(3))
+    write_summary(book_src_dir, question_nums, section_size)
+
+def write_summary(book_src_dir, question_nums, section_size=None):
+    """Write SUMMARY.md (and section pages) for the chapters of question_nums, in order."""
+    summary_content = "# Summary\n\n"
+    entries = [
+        (question_num, f"[Question {int(question_num)}](question_{question_num}.md)")
+        for question_num in question_nums
+    ]
     
-    with open(os.path.join(book_src_dir, "SUMMARY.md"), "w", encoding="utf-8") as f:
-        f.write(summary_content)
+    written = set()
+    if section_size:
+        for start in range(0, len(entries), section_size):
+            section = entries[start:start + section_size]
+            first, last = section[0][0], section[-1][0]
+            section_file = f"section_{first}-{last}.md"
+            section_title = f"Questions {int(first)}–{int(last)}"
+            
+            # The section page lists its questions; SUMMARY nests them under it
+            section_content = f"# {section_title}\n\n" + "".join(f"- {entry}\n" for _, entry in section)
+            write_if_changed(os.path.join(book_src_dir, section_file), section_content)
+            written.add(section_file)
+            
+            summary_content += f"- [{section_title}]({section_file})\n"
+            summary_content += "".join(f"    - {entry}\n" for _, entry in section)
+    else:
+        summary_content += "".join(f"- {entry}\n" for _, entry in entries)
+    
+    # Remove section pages from an earlier partitioning
+    for section_file in sorted(glob.glob(os.path.join(book_src_dir, "section_*.md"))):
+        if os.path.basename(section_file) not in written:
+            os.remove(section_file)
+    
+    write_if_changed(os.path.join(book_src_dir, "SUMMARY.md"), summary_content)
 
 def create_readme_md(book_src_dir, header):
     """Create the README.md file that serves as the introduction."""
@@ -166,107 +233,267 @@ def create_readme_md(book_src_dir, header):
         readme_content += header + "\n\n"
     readme_content += "This is a collection of questions organized as an mdBook."
     
-    with open(os.path.join(book_src_dir, "README.md"), "w", encoding="utf-8") as f:
-        f.write(readme_content)
+    write_if_changed(os.path.join(book_src_dir, "README.md"), readme_content)
+
+def chapter_for_question(book_src_dir, question):
+    """Return the chapter file name and content of a formatted question."""
+    # Extract the question number from the header
+    match = re.search(r'## Question (\d+)', question)
+    if match:
+        question_num = match.group(1).zfill(3)  # Ensure 3-digit format
+        # Replace the original header with a level 1 header for the mdBook chapter
+        question_content = re.sub(r'## Question \d+.*?(\n|$)', f'# Question {int(question_num)}\n', question, 1)
+    else:
+        # If no question number is found, use a sequential number
+        question_num = str(len(os.listdir(book_src_dir)) + 1).zfill(3)
+        question_content = f'# Question {int(question_num)}\n\n{question}'
+    return f"question_{question_num}.md", question_content
 
 def write_question_files(book_src_dir, questions):
-    """Write each question to its own markdown file."""
+    """Write each question to its own markdown file.
+
+    Only chapters whose rendered content differs from the file on disk are
+    written, and chapters of questions that no longer exist are removed, so
+    `mdbook serve` rebuilds only for real changes. Returns a WriteReport.
+    """
+    report = WriteReport("chapters")
+    written = set()
     for question in questions:
-        # Extract the question number from the header
-        match = re.search(r'## Question (\d+)', question)
-        if match:
-            question_num = match.group(1).zfill(3)  # Ensure 3-digit format
-            # Replace the original header with a level 1 header for the mdBook chapter
-            question_content = re.sub(r'## Question \d+.*?(\n|$)', f'# Question {int(question_num)}\n', question, 1)
-        else:
-            # If no question number is found, use a sequential number
-            question_num = str(len(os.listdir(book_src_dir)) + 1).zfill(3)
-            question_content = f'# Question {int(question_num)}\n\n{question}'
-        
-        # Write the question to its own file
-        with open(os.path.join(book_src_dir, f"question_{question_num}.md"), "w", encoding="utf-8") as f:
-            f.write(question_content)
+        # Write the question to its own file if it changed
+        chapter_file, question_content = chapter_for_question(book_src_dir, question)
+        report.record(write_if_changed(os.path.join(book_src_dir, chapter_file), question_content))
+        written.add(chapter_file)
+    
+    # Remove chapters of questions that no longer exist
+    for chapter_file in sorted(glob.glob(os.path.join(book_src_dir, "question_*.md"))):
+        if os.path.basename(chapter_file) not in written:
+            os.remove(chapter_file)
+            report.removed += 1
+    
+    return report
 
-def main():
-    # Define paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    normalized_dir = os.path.join(base_dir, "normalized_questions")
-    book_dir = os.path.join(base_dir, "mdbook")
-    book_src_dir = os.path.join(book_dir, "src")
+def list_figures(figures_dir):
+    """Return the figure files in figures_dir, sorted by name."""
+    if not os.path.isdir(figures_dir):
+        return []
+    return [
+        os.path.join(figures_dir, figure)
+        for figure in sorted(os.listdir(figures_dir))
+        if os.path.isfile(os.path.join(figures_dir, figure))
+    ]
+
+def sync_question_figures(question_dir, normalized_dest, media, report):
+    """Sync the question and explanation figures of one question into normalized_dest."""
+    dest_question_dir = os.path.join(normalized_dest, os.path.basename(question_dir))
+    for figures in ("question_figures", "explain_figures"):
+        media.sync_dir(
+            list_figures(os.path.join(question_dir, figures)),
+            os.path.join(dest_question_dir, figures),
+            report
+        )
+
+def sync_figures(normalized_dir, normalized_dest, media=None, question_dirs=None):
+    """Bring the book's copy of every question's figure directories up to date.
+
+    Only new or changed figures are placed (see MediaPipeline.sync_dir);
+    figures and question directories that no longer exist upstream (or are
+    not in question_dirs) are removed. Returns a SyncReport.
+    """
+    media = media or MediaPipeline()
+    report = SyncReport()
+    ensure_dir(normalized_dest)
+    if question_dirs is None:
+        question_dirs = list_question_dirs(normalized_dir)
     
-    # Try to install natsort if not available
-    try:
-        import natsort
-    except ImportError:
-        print("Installing natsort package for better filename sorting...")
-        try:
-            import subprocess
-            subprocess.check_call(["uv", "pip", "install", "natsort"])
-            import natsort
-            print("Successfully installed natsort")
-        except Exception as e:
-            print(f"Could not install natsort: {e}")
-            print("Will use fallback sorting method")
+    question_nums = set()
+    for question_dir in question_dirs:
+        question_nums.add(os.path.basename(question_dir))
+        sync_question_figures(question_dir, normalized_dest, media, report)
+    
+    # Remove questions that were deleted upstream
+    for question_num in sorted(os.listdir(normalized_dest)):
+        dest_question_dir = os.path.join(normalized_dest, question_num)
+        if question_num not in question_nums and os.path.isdir(dest_question_dir):
+            for figures in ("question_figures", "explain_figures"):
+                media.sync_dir([], os.path.join(dest_question_dir, figures), report)
+            shutil.rmtree(dest_question_dir)
+    
+    return report
+
+def build_book(normalized_dir=NORMALIZED_DIR, book_dir=BOOK_DIR, media=None,
+               question_dirs=None, title=BOOK_TITLE, section_size=None):
+    """Build the mdBook source tree for normalized_dir in book_dir.
+
+    question_dirs limits the book to a subset of questions and section_size
+    nests the sidebar in sections of that many questions.
+    """
+    book_src_dir = os.path.join(book_dir, "src")
     
     # Ensure the mdBook directory structure exists
     ensure_dir(book_dir)
     ensure_dir(book_src_dir)
     
     # Read questions from the normalized_questions directory
-    header, questions = read_normalized_questions(normalized_dir)
+    media = media or MediaPipeline()
+    if question_dirs is None:
+        question_dirs = list_question_dirs(normalized_dir)
+    # Optimize all figures on a process pool first; reading the questions
+    # would otherwise optimize them one by one for the figure links
+    media.warm(iter_figure_paths(question_dirs))
+    header, questions = read_normalized_questions(normalized_dir, media, question_dirs)
     
     # Create the mdBook files
-    create_book_toml(book_dir, title="Normalized Questions Collection")
-    create_summary_md(book_src_dir, questions)
+    create_book_toml(book_dir, title=title, fold=bool(section_size))
+    create_summary_md(book_src_dir, questions, section_size)
     create_readme_md(book_src_dir, header)
-    write_question_files(book_src_dir, questions)
+    chapter_report = write_question_files(book_src_dir, questions)
     
     print(f"mdBook structure created at {book_dir}")
+    print(f"Chapters: {chapter_report.summary()}")
     print(f"Total questions processed: {len(questions)}")
     print("Run 'mdbook serve' in the mdbook directory to view the book.")
     
-    # Copy the normalized_questions directory for images
+    # Sync the normalized_questions figures used by the chapters
     normalized_dest = os.path.join(book_src_dir, "normalized_questions")
+    print(f"Syncing images from normalized_questions...")
+    report = sync_figures(normalized_dir, normalized_dest, media, question_dirs)
     
-    # Remove existing directory if it exists to ensure fresh copy
-    if os.path.exists(normalized_dest):
-        print(f"Removing existing normalized_questions directory...")
-        shutil.rmtree(normalized_dest)
+    print(f"Images: {report.summary()}")
+    return len(questions)
+
+def update_questions(normalized_dir, book_dir, question_dirs, media=None):
+    """Rewrite the chapters and figures of question_dirs in an existing book.
+
+    Used for edits to questions that are already in the book; adding or
+    removing questions changes SUMMARY.md and needs build_book. Returns
+    the chapter WriteReport and the figure SyncReport.
+    """
+    media = media or MediaPipeline()
+    book_src_dir = os.path.join(book_dir, "src")
+    media.warm(iter_figure_paths(question_dirs))
+    _, questions = read_normalized_questions(normalized_dir, media, question_dirs)
+    report = WriteReport("chapters")
+    for question in questions:
+        chapter_file, question_content = chapter_for_question(book_src_dir, question)
+        report.record(write_if_changed(os.path.join(book_src_dir, chapter_file), question_content))
     
-    # Create the directory structure
-    ensure_dir(normalized_dest)
+    figure_report = SyncReport()
+    normalized_dest = os.path.join(book_src_dir, "normalized_questions")
+    for question_dir in question_dirs:
+        sync_question_figures(question_dir, normalized_dest, media, figure_report)
+    return report, figure_report
+
+def create_landing_page(book_dir, part_names):
+    """Create an index.html that links to every partitioned book."""
+    items = "\n".join(
+        f'    <li><a href="parts/{name}/book/index.html">Questions {html.escape(name)}</a></li>'
+        for name in part_names
+    )
+    page = f"""<!DOCTYPE html>
+<html lang="zh-TW">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>{BOOK_TITLE}</title>
+</head>
+<body>
+  <h1>{BOOK_TITLE}</h1>
+  <ul>
+{items}
+  </ul>
+</body>
+</html>
+"""
+    write_if_changed(os.path.join(book_dir, "index.html"), page)
+
+def build_partitioned_books(normalized_dir=NORMALIZED_DIR, book_dir=BOOK_DIR, media=None,
+                            book_size=500, section_size=None, workers=None):
+    """Split the bank into separate books of book_size questions.
+
+    Each book lives in book_dir/parts/<first>-<last> with its own
+    book.toml, chapters and figures, and is generated on its own worker
+    process. A landing page in book_dir links them. Returns the book dirs.
+    """
+    question_dirs = list_question_dirs(normalized_dir)
+    partitions = [question_dirs[i:i + book_size] for i in range(0, len(question_dirs), book_size)]
+    names = [f"{os.path.basename(part[0])}-{os.path.basename(part[-1])}" for part in partitions]
     
-    # Copy all question directories with their images
-    print(f"Copying images from normalized_questions...")
-    for question_dir in glob.glob(os.path.join(normalized_dir, "*")):
-        if not os.path.isdir(question_dir):
-            continue
-            
-        question_num = os.path.basename(question_dir)
-        dest_question_dir = os.path.join(normalized_dest, question_num)
-        ensure_dir(dest_question_dir)
-        
-        # Copy question figures
-        question_figures_dir = os.path.join(question_dir, "question_figures")
-        if os.path.exists(question_figures_dir) and os.path.isdir(question_figures_dir):
-            dest_figures_dir = os.path.join(dest_question_dir, "question_figures")
-            ensure_dir(dest_figures_dir)
-            for figure in os.listdir(question_figures_dir):
-                src_figure = os.path.join(question_figures_dir, figure)
-                if os.path.isfile(src_figure):
-                    shutil.copy2(src_figure, os.path.join(dest_figures_dir, figure))
-        
-        # Copy explanation figures
-        explain_figures_dir = os.path.join(question_dir, "explain_figures")
-        if os.path.exists(explain_figures_dir) and os.path.isdir(explain_figures_dir):
-            dest_figures_dir = os.path.join(dest_question_dir, "explain_figures")
-            ensure_dir(dest_figures_dir)
-            for figure in os.listdir(explain_figures_dir):
-                src_figure = os.path.join(explain_figures_dir, figure)
-                if os.path.isfile(src_figure):
-                    shutil.copy2(src_figure, os.path.join(dest_figures_dir, figure))
+    # Remove books from an earlier partitioning
+    parts_dir = os.path.join(book_dir, "parts")
+    ensure_dir(parts_dir)
+    for name in sorted(os.listdir(parts_dir)):
+        if name not in names:
+            shutil.rmtree(os.path.join(parts_dir, name))
+    
+    # Optimize all figures once, before the workers start
+    media = media or MediaPipeline()
+    media.warm(iter_figure_paths(question_dirs))
+    
+    part_dirs = [os.path.join(parts_dir, name) for name in names]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                build_book, normalized_dir, part_dir, media, part,
+                f"{BOOK_TITLE} ({name})", section_size
+            )
+            for name, part, part_dir in zip(names, partitions, part_dirs)
+        ]
+        for future in futures:
+            future.result()
+    
+    create_landing_page(book_dir, names)
+    print(f"Created {len(part_dirs)} books with a landing page at {os.path.join(book_dir, 'index.html')}")
+    return part_dirs
+
+def run_mdbook_builds(book_dirs, workers=None):
+    """Run `mdbook build` for each book directory in parallel."""
+    if not shutil.which("mdbook"):
+        print("mdbook is not installed, skipping the build")
+        return False
+    
+    def build(book_dir):
+        return book_dir, instrumentation.run_subprocess("mdbook", ["mdbook", "build", book_dir], capture_output=True, text=True)
+    
+    from concurrent.futures import ThreadPoolExecutor
+    ok = True
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for book_dir, result in executor.map(build, book_dirs):
+            if result.returncode != 0:
+                ok = False
+                progress.warn(f"mdbook build failed for {book_dir}: {result.stderr.strip()}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Create an mdBook from normalized questions")
+    parser.add_argument("--section-size", type=int, help="nest the sidebar in sections of this many questions")
+    parser.add_argument("--split-books", type=int, metavar="N", help="create separate books of N questions with a shared landing page")
+    parser.add_argument("--build", action="store_true", help="run 'mdbook build' for every book afterwards")
+    parser.add_argument("--workers", type=int, help="number of parallel book workers")
+    add_media_arguments(parser)
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+    if args.shard and args.split_books:
+        parser.error("--shard cannot be combined with --split-books")
+    
+    media = media_from_args(args)
+    if args.shard:
+        book_dir = args.shard.output_path(BOOK_DIR)
+        question_dirs = sharding.select_questions(list_question_dirs(NORMALIZED_DIR), args.shard)
+        build_book(NORMALIZED_DIR, book_dir, media, question_dirs, section_size=args.section_size)
+        book_dirs = [book_dir]
+    elif args.split_books:
+        book_dirs = build_partitioned_books(
+            NORMALIZED_DIR, BOOK_DIR, media, args.split_books, args.section_size, args.workers
+        )
+    else:
+        build_book(NORMALIZED_DIR, BOOK_DIR, media, section_size=args.section_size)
+        book_dirs = [BOOK_DIR]
     
-    print(f"Successfully copied all images to mdbook structure")
+    if args.build:
+        run_mdbook_builds(book_dirs, args.workers)
 
 if __name__ == "__main__":
     main()
@@ -4,22 +4,23 @@
 確保所有問題資料夾都有正確的結構和檔案名稱
 """
 
+import argparse
 import os
 import shutil
 import zipfile
 import re
 import glob
-import subprocess
 from pathlib import Path
 
+import instrumentation
+import progress
+import sharding
+
 # 配置路徑
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # 使用當前腳本所在目錄
 ZIPS_DIR = os.path.join(BASE_DIR, "zips")
 EXTRACT_DIR = os.path.join(BASE_DIR, "normalized_questions")
 
-# 確保輸出目錄存在
-os.makedirs(EXTRACT_DIR, exist_ok=True)
-
 def normalize_filename(filename):
     """
     標準化檔案名稱，將空格替換為底線
@@ -28,6 +29,29 @@ def normalize_filename(filename):
     filename = filename.replace(' ', '_')
     return filename
 
+def normalize_text(content):
+    """
+    標準化文字內容：將 # 替換為 -，並確保連續的非空行之間有空行
+    """
+    # 替換所有 # 為 -
+    content = content.replace('#', '-')
+    
+    # 處理連續的行，確保它們之間有空行
+    # 首先將內容分割成行
+    lines = content.split('\n')
+    normalized_lines = []
+    
+    # 遍歷每一行，確保連續的非空行之間有空行
+    for i, line in enumerate(lines):
+        normalized_lines.append(line)
+        
+        # 如果當前行和下一行都不是空行，則添加一個空行
+        if i < len(lines) - 1 and line.strip() and lines[i+1].strip():
+            normalized_lines.append('')
+    
+    # 將處理後的行重新組合成文本
+    return '\n'.join(normalized_lines)
+
 def process_text_file(src_path, dst_path):
     """
     處理文字檔案，將 # 替換為 -，並確保連續的行之間有空行
@@ -36,30 +60,13 @@ def process_text_file(src_path, dst_path):
         with open(src_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        # 替換所有 # 為 -
-        content = content.replace('#', '-')
-        
-        # 處理連續的行，確保它們之間有空行
-        # 首先將內容分割成行
-        lines = content.split('\n')
-        normalized_lines = []
-        
-        # 遍歷每一行，確保連續的非空行之間有空行
-        for i, line in enumerate(lines):
-            normalized_lines.append(line)
-            
-            # 如果當前行和下一行都不是空行，則添加一個空行
-            if i < len(lines) - 1 and line.strip() and lines[i+1].strip():
-                normalized_lines.append('')
-        
-        # 將處理後的行重新組合成文本
-        normalized_content = '\n'.join(normalized_lines)
+        normalized_content = normalize_text(content)
         
         with open(dst_path, 'w', encoding='utf-8') as f:
             f.write(normalized_content)
         return True
     except Exception as e:
-        print(f"處理文字檔案 {src_path} 時出錯: {e}")
+        progress.warn(f"處理文字檔案 {src_path} 時出錯: {e}")
         # 如果處理失敗，直接複製原檔案
         shutil.copy2(src_path, dst_path)
         return False
@@ -72,21 +79,21 @@ def extract_zip_file(zip_path, extract_to):
                 zip_ref.extractall(extract_to)
             return True
         except Exception as e:
-            print(f"解壓縮 ZIP 檔案 {zip_path} 時出錯: {e}")
+            progress.warn(f"解壓縮 ZIP 檔案 {zip_path} 時出錯: {e}")
             return False
     elif zip_path.endswith('.rar'):
         try:
             # 使用 unar 命令解壓縮 RAR 檔案
-            result = subprocess.run(['unar', '-d', '-o', extract_to, zip_path], 
-                                   capture_output=True, text=True)
+            result = instrumentation.run_subprocess('unar', ['unar', '-d', '-o', extract_to, zip_path],
+                                    capture_output=True, text=True)
             if result.returncode == 0:
-                print(f"成功使用 unar 解壓縮 {zip_path}")
+                progress.item(f"成功使用 unar 解壓縮 {zip_path}")
                 return True
             else:
-                print(f"使用 unar 解壓縮 {zip_path} 時出錯: {result.stderr}")
+                progress.warn(f"使用 unar 解壓縮 {zip_path} 時出錯: {result.stderr}")
                 return False
         except Exception as e:
-            print(f"執行 unar 命令時出錯: {e}")
+            progress.warn(f"執行 unar 命令時出錯: {e}")
             return False
     return False
 
@@ -108,14 +115,14 @@ def normalize_folder_structure(temp_dir, question_num):
     # 尋找包含 question.txt 的資料夾
     for root, dirs, files in os.walk(temp_dir):
         # 移除隱藏目錄 (點檔案)
-        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
         if "question.txt" in files:
             nested_dir = root
             break
     
     if nested_dir:
         # 找到包含問題檔案的資料夾，將其內容複製到標準化目錄
-        for item in os.listdir(nested_dir):
+        for item in sorted(os.listdir(nested_dir)):
             # 跳過點檔案 (隱藏檔案)
             if item.startswith('.'):
                 continue
@@ -128,7 +135,7 @@ def normalize_folder_structure(temp_dir, question_num):
                 # 確保圖片資料夾存在
                 if item in ["question_figures", "explain_figures"]:
                     os.makedirs(dst, exist_ok=True)
-                    for img in os.listdir(src):
+                    for img in sorted(os.listdir(src)):
                         # 跳過點檔案 (隱藏檔案)
                         if img.startswith('.'):
                             continue
@@ -140,12 +147,12 @@ def normalize_folder_structure(temp_dir, question_num):
                             shutil.copy2(img_src, img_dst)
                 else:
                     # 其他資料夾，可能是嵌套結構
-                    for sub_item in os.listdir(src):
+                    for sub_item in sorted(os.listdir(src)):
                         sub_src = os.path.join(src, sub_item)
                         if os.path.isdir(sub_src) and sub_item in ["question_figures", "explain_figures"]:
                             sub_dst = os.path.join(target_dir, sub_item)
                             os.makedirs(sub_dst, exist_ok=True)
-                            for img in os.listdir(sub_src):
+                            for img in sorted(os.listdir(sub_src)):
                                 # 跳過點檔案 (隱藏檔案)
                                 if img.startswith('.'):
                                     continue
@@ -165,8 +172,8 @@ def normalize_folder_structure(temp_dir, question_num):
                     shutil.copy2(src, dst)
     else:
         # 沒有找到包含問題檔案的資料夾，嘗試直接複製所有檔案
-        print(f"警告: 在 {temp_dir} 中找不到 question.txt，嘗試直接複製所有檔案")
-        for item in os.listdir(temp_dir):
+        progress.warn(f"警告: 在 {temp_dir} 中找不到 question.txt，嘗試直接複製所有檔案")
+        for item in sorted(os.listdir(temp_dir)):
             # 跳過點檔案 (隱藏檔案)
             if item.startswith('.'):
                 continue
@@ -218,8 +225,50 @@ def ensure_required_files(dir_path):
                 else:
                     f.write("")  # 其他檔案為空
 
-def process_zip_files():
-    """處理 zips 目錄中的所有壓縮檔"""
+def archive_question_number(zip_file):
+    """從壓縮檔名稱取得問題編號 (例如 012.zip -> 12)，不是問題壓縮檔時回傳 None"""
+    # 標準化檔案名稱，將空格替換為底線
+    normalized_filename = normalize_filename(os.path.basename(zip_file))
+    match = re.match(r'(\d+)\.(?:zip|rar)', normalized_filename)
+    return int(match.group(1)) if match else None
+
+def extract_archive(zip_file, question_num):
+    """解壓縮單一壓縮檔並標準化為問題 question_num，成功時回傳 True"""
+    os.makedirs(EXTRACT_DIR, exist_ok=True)
+    progress.item(f"處理問題 {question_num:03d} 從 {os.path.basename(zip_file)}")
+    
+    # 創建臨時目錄用於解壓縮
+    temp_dir = os.path.join(EXTRACT_DIR, f"temp_{question_num:03d}")
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    os.makedirs(temp_dir, exist_ok=True)
+    
+    ok = False
+    # 解壓縮檔案 (ZIP 或 RAR)
+    if extract_zip_file(zip_file, temp_dir):
+        # 標準化資料夾結構
+        normalize_folder_structure(temp_dir, question_num)
+        ok = True
+    else:
+        # 如果解壓縮失敗，嘗試從主目錄複製
+        progress.item(f"嘗試從主目錄複製問題 {question_num:03d}")
+        source_dir = os.path.join(BASE_DIR, f"{question_num:03d}")
+        if os.path.exists(source_dir) and os.path.isdir(source_dir):
+            normalize_folder_structure(source_dir, question_num)
+            ok = True
+        else:
+            progress.warn(f"錯誤: 找不到問題 {question_num:03d} 的資料夾")
+    
+    # 清理臨時目錄
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    return ok
+
+def process_zip_files(shard=None):
+    """處理 zips 目錄中的所有壓縮檔；指定 shard 時只處理屬於該分片的問題"""
+    # 確保輸出目錄存在
+    os.makedirs(EXTRACT_DIR, exist_ok=True)
+    
     # 獲取所有 zip 檔案，排除點檔案
     zip_files = []
     for ext in ['*.zip', '*.rar']:
@@ -230,78 +279,62 @@ def process_zip_files():
     
     zip_files.sort()
     
+    # 分片時只保留屬於該分片的問題 (各分片寫入不同的問題資料夾)
+    # 壓縮檔依本身的題號篩選；range(1, 121) 只用於主目錄備援與缺漏檢查
+    question_range = range(1, 121)
+    if shard is not None:
+        zip_files = shard.select(zip_files, key=archive_question_number)
+        question_range = shard.select(question_range)
+        print(f"分片 {shard}: {len(zip_files)} 個壓縮檔")
+    
     # 用於跟踪已處理的問題編號
     processed_questions = set()
     
     # 處理每個壓縮檔
-    for zip_file in zip_files:
+    for zip_file in instrumentation.questions(progress.track(zip_files, "extract")):
         # 從檔案名稱中提取問題編號
-        filename = os.path.basename(zip_file)
-        # 標準化檔案名稱，將空格替換為底線
-        normalized_filename = normalize_filename(filename)
-        match = re.match(r'(\d+)\.(?:zip|rar)', normalized_filename)
-        if match:
-            question_num = int(match.group(1))
-            
+        question_num = archive_question_number(zip_file)
+        if question_num is not None:
             # 如果這個問題已經處理過，跳過
             if question_num in processed_questions:
-                print(f"跳過已處理的問題 {question_num:03d}")
+                progress.item(f"跳過已處理的問題 {question_num:03d}")
                 continue
             
-            print(f"處理問題 {question_num:03d} 從 {filename}")
-            
-            # 創建臨時目錄用於解壓縮
-            temp_dir = os.path.join(EXTRACT_DIR, f"temp_{question_num:03d}")
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 解壓縮檔案 (ZIP 或 RAR)
-            if extract_zip_file(zip_file, temp_dir):
-                # 標準化資料夾結構
-                normalize_folder_structure(temp_dir, question_num)
+            if extract_archive(zip_file, question_num):
                 processed_questions.add(question_num)
-            else:
-                # 如果解壓縮失敗，嘗試從主目錄複製
-                print(f"嘗試從主目錄複製問題 {question_num:03d}")
-                source_dir = os.path.join(BASE_DIR, f"{question_num:03d}")
-                if os.path.exists(source_dir) and os.path.isdir(source_dir):
-                    normalize_folder_structure(source_dir, question_num)
-                    processed_questions.add(question_num)
-                else:
-                    print(f"錯誤: 找不到問題 {question_num:03d} 的資料夾")
-            
-            # 清理臨時目錄
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
     
     # 處理主目錄中的問題資料夾
-    for i in range(1, 121):
+    for i in question_range:
         if i not in processed_questions:
             question_dir = f"{i:03d}"
             source_dir = os.path.join(BASE_DIR, question_dir)
             if os.path.exists(source_dir) and os.path.isdir(source_dir):
-                print(f"從主目錄處理問題 {i:03d}")
+                progress.item(f"從主目錄處理問題 {i:03d}")
                 normalize_folder_structure(source_dir, i)
                 processed_questions.add(i)
     
     # 檢查是否所有 120 個問題都已處理
     missing_questions = []
-    for i in range(1, 121):
+    for i in question_range:
         if i not in processed_questions:
             missing_questions.append(i)
     
     if missing_questions:
-        print(f"警告: 以下問題未處理: {missing_questions}")
+        progress.warn(f"警告: 以下問題未處理: {missing_questions}", questions=missing_questions)
     else:
-        print("成功: 所有 120 個問題都已處理")
+        print(f"成功: 所有 {len(question_range)} 個問題都已處理")
     
     return len(processed_questions)
 
 def main():
     """主函數"""
+    parser = argparse.ArgumentParser(description="解壓縮 zips 目錄中的壓縮檔並標準化問題資料夾")
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
     print("開始處理壓縮檔案並標準化問題資料夾結構...")
-    num_processed = process_zip_files()
+    num_processed = process_zip_files(args.shard)
     print(f"完成! 共處理了 {num_processed} 個問題")
     print(f"標準化的問題資料夾位於: {EXTRACT_DIR}")
 
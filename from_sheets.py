@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Import edits made in questions_sheet.xlsx back into normalized_questions.
+
+The sheet is read row by row (openpyxl read-only mode). Each text field is
+compared by hash with the cleaned text of the current file, the same
+cleaning to_sheets.py applies on export, and only fields that were
+actually edited are rewritten (normalized like extract_and_normalize.py
+does, and replaced atomically). Untouched files keep their mtime, so
+incremental rebuilds only redo the edited questions.
+
+    python from_sheets.py                       # import questions_sheet.xlsx
+    python from_sheets.py edited.xlsx --dry-run # only list what would change
+"""
+
+import argparse
+import hashlib
+from pathlib import Path
+
+import progress
+from extract_and_normalize import normalize_text
+from output_utils import UNCHANGED, WriteReport, write_if_changed
+from to_sheets import COLUMNS, QUESTIONS_DIR, clean_text, read_text_file
+
+BASE_DIR = Path(__file__).parent
+SHEET_FILE = BASE_DIR / "questions_sheet.xlsx"
+
+# Sheet columns of each question file; the question is split over two columns
+FIELD_COLUMNS = {
+    "option_A.txt": "optionA",
+    "option_B.txt": "optionB",
+    "option_C.txt": "optionC",
+    "option_D.txt": "optionD",
+    "option_E.txt": "optionE",
+    "correct_answer.txt": "correct_answer_txt",
+    "explain.txt": "explain",
+}
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cell_text(value) -> str:
+    """Return a cell value as text; numbers editors typed come back as numbers."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def iter_sheet_rows(sheet_file: Path):
+    """Yield each data row of the sheet as a dict keyed by column name."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(sheet_file, read_only=True)
+    try:
+        worksheet = workbook["Questions"] if "Questions" in workbook.sheetnames else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = [cell_text(value) for value in next(rows, ())]
+        missing = [column for column in COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"{sheet_file} is missing column(s): {', '.join(missing)}")
+        index = {column: header.index(column) for column in COLUMNS}
+        for values in rows:
+            values = list(values) + [None] * (len(header) - len(values))
+            yield {column: cell_text(values[idx]) for column, idx in index.items()}
+    finally:
+        workbook.close()
+
+
+def row_fields(row) -> dict:
+    """Return {file name: cleaned text} for the question files of a sheet row."""
+    question = row["first_line_of_question_txt"]
+    if row["rest_lines_of_question_txt"]:
+        question += "\n" + row["rest_lines_of_question_txt"]
+    fields = {"question.txt": question}
+    fields.update({file_name: row[column] for file_name, column in FIELD_COLUMNS.items()})
+    return {file_name: clean_text(text) for file_name, text in fields.items()}
+
+
+def import_row(row, questions_dir: Path, report: WriteReport, dry_run=False):
+    """Rewrite the files of one question whose text differs from the sheet row.
+
+    Returns the names of the files that changed (or would change).
+    """
+    question_dir = questions_dir / row["folder_name"]
+    changed = []
+    for file_name, text in row_fields(row).items():
+        file_path = question_dir / file_name
+        content = normalize_text(text)
+        # Compare what the export would show for the file before and after
+        if text_hash(read_text_file(file_path)) == text_hash(clean_text(content)):
+            report.unchanged += 1
+            continue
+        if dry_run:
+            changed.append(file_name)
+            continue
+        status = report.record(write_if_changed(file_path, content))
+        if status != UNCHANGED:
+            changed.append(file_name)
+    return changed
+
+
+def import_sheet(sheet_file: Path = SHEET_FILE, questions_dir: Path = QUESTIONS_DIR, dry_run=False):
+    """Apply the edits in sheet_file to questions_dir.
+
+    Numeric folder names are padded to three digits (Excel stores "001" as
+    1). Rows whose folder_name is not a question number, or of questions
+    that do not exist in questions_dir, are skipped with a warning.
+    Returns {question folder name: [changed file names]}.
+    """
+    report = WriteReport("question files")
+    changes = {}
+    skipped = 0
+    for row in progress.track(iter_sheet_rows(sheet_file), "import", key=lambda row: row["folder_name"]):
+        folder_name = row["folder_name"].strip()
+        if not folder_name:
+            if any(value.strip() for value in row.values()):
+                progress.warn("Warning: a row without folder_name was skipped")
+                skipped += 1
+            continue
+        # Only plain question numbers, so a row cannot point outside questions_dir (e.g. "../x");
+        # Excel turns "001" into the number 1, so numbers are padded back to folder names
+        if folder_name.isascii() and folder_name.isdigit():
+            folder_name = f"{int(folder_name):03d}"
+        if not folder_name.isdigit() or not (questions_dir / folder_name).is_dir():
+            progress.warn(f"Warning: {folder_name} is not a question folder in {questions_dir}, skipped")
+            skipped += 1
+            continue
+        row["folder_name"] = folder_name
+        changed = import_row(row, questions_dir, report, dry_run)
+        if changed:
+            changes[folder_name] = changed
+            progress.info(f"{'Would update' if dry_run else 'Updated'} {folder_name}: {', '.join(changed)}")
+
+    if dry_run:
+        total = sum(len(files) for files in changes.values())
+        print(f"\n{total} file(s) in {len(changes)} question(s) would change")
+    else:
+        print(f"\n{len(changes)} question(s) changed; {report.summary()}")
+    if skipped:
+        print(f"{skipped} row(s) skipped")
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import edits from the question sheet into normalized_questions")
+    parser.add_argument("sheet", nargs="?", type=Path, default=SHEET_FILE,
+                        help=f"edited sheet (default: {SHEET_FILE.name})")
+    parser.add_argument("--dry-run", action="store_true", help="only list the files that would change")
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+
+    if not args.sheet.exists():
+        print(f"Error: {args.sheet} does not exist!")
+        return
+    if not QUESTIONS_DIR.exists():
+        print(f"Error: {QUESTIONS_DIR} does not exist!")
+        return
+    import_sheet(args.sheet, QUESTIONS_DIR, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,12 @@ import tempfile
 from pathlib import Path
 import glob
 import sys
+import argparse
+
+import instrumentation
+import progress
+import sharding
+from media_utils import MediaStore, add_media_arguments, iter_figure_paths, media_from_args
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Use current script directory
@@ -16,13 +22,9 @@ TEMP_DIR = os.path.join(BASE_DIR, "tmp")
 EXTRACT_DIR = os.path.join(BASE_DIR, "extracted")
 OUTPUT_MD_FILE = os.path.join(BASE_DIR, "anki_deck.md")
 OUTPUT_DIR = os.path.join(BASE_DIR, "anki_output")
+MD_INPUT_DIR = os.path.join(BASE_DIR, "md_input")
 CUSTOM_CSS_FILE = os.path.join(BASE_DIR, "custom.css")
 
-# Create necessary directories if they don't exist
-os.makedirs(TEMP_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(EXTRACT_DIR, exist_ok=True)
-
 def read_file_content(file_path):
     """Read content from a file if it exists, otherwise return empty string."""
     if os.path.exists(file_path):
@@ -31,14 +33,19 @@ def read_file_content(file_path):
             return content
     return ""
 
-def process_images(source_dir, question_num, prefix):
-    """Copy images from source directory to temp directory with proper naming."""
+def process_images(source_dir, media_store):
+    """Store images from source directory in the media store.
+
+    Images are named by content hash, so a figure shared by several
+    questions is stored once. Returns (original name, stored name, <img>
+    HTML) for each image.
+    """
     image_paths = []
     
     if not os.path.exists(source_dir) or not os.path.isdir(source_dir):
         return image_paths
     
-    for filename in os.listdir(source_dir):
+    for filename in sorted(os.listdir(source_dir)):
         if filename.startswith('.'):  # Skip hidden files like .DS_Store
             continue
             
@@ -47,17 +54,13 @@ def process_images(source_dir, question_num, prefix):
         if ext.lower() not in ['.jpg', '.jpeg', '.png', '.gif']:
             continue
             
-        # Create new filename
-        new_filename = f"q{question_num:03d}_{prefix}_{filename}"
-        new_path = os.path.join(TEMP_DIR, new_filename)
-        
-        # Copy file
-        shutil.copy2(os.path.join(source_dir, filename), new_path)
-        image_paths.append((filename, new_filename))
+        # Copy file (and its thumbnails) under its content-hash name
+        new_filename, img_html = media_store.add_figure(os.path.join(source_dir, filename), filename)
+        image_paths.append((filename, new_filename, img_html))
     
     return image_paths
 
-def create_custom_css():
+def create_custom_css(css_file=CUSTOM_CSS_FILE):
     """Create a custom CSS file for the Anki cards."""
     css_content = """
     .card {
@@ -110,10 +113,10 @@ def create_custom_css():
     }
     """
     
-    with open(CUSTOM_CSS_FILE, 'w', encoding='utf-8') as f:
+    with open(css_file, 'w', encoding='utf-8') as f:
         f.write(css_content)
     
-    return CUSTOM_CSS_FILE
+    return css_file
 
 def extract_zip_file(zip_path, extract_to):
     """Extract a zip file to the specified directory."""
@@ -123,11 +126,11 @@ def extract_zip_file(zip_path, extract_to):
                 zip_ref.extractall(extract_to)
             return True
         except Exception as e:
-            print(f"Error extracting ZIP file {zip_path}: {e}")
+            progress.warn(f"Error extracting ZIP file {zip_path}: {e}")
             return False
     elif zip_path.endswith('.rar'):
-        print(f"Warning: Cannot extract RAR file {zip_path} without additional tools.")
-        print(f"Trying to find the question in the main directory instead.")
+        progress.warn(f"Warning: Cannot extract RAR file {zip_path} without additional tools. "
+                      "Trying to find the question in the main directory instead.")
         return False
     return False
 
@@ -150,7 +153,7 @@ def find_question_files(question_num):
             return base_path
         
         # Try to find any subfolder that contains question.txt
-        for item in os.listdir(base_path):
+        for item in sorted(os.listdir(base_path)):
             item_path = os.path.join(base_path, item)
             if os.path.isdir(item_path) and os.path.exists(os.path.join(item_path, "question.txt")):
                 return item_path
@@ -169,7 +172,7 @@ def find_question_files(question_num):
         # First try ZIP files
         for zip_file in possible_files:
             if os.path.exists(zip_file):
-                print(f"Extracting {zip_file} to {extract_path}")
+                progress.item(f"Extracting {zip_file} to {extract_path}")
                 if extract_zip_file(zip_file, extract_path):
                     break
         
@@ -179,7 +182,7 @@ def find_question_files(question_num):
             source_dir = os.path.join(BASE_DIR, question_dir)
             if os.path.exists(source_dir) and os.path.isdir(source_dir):
                 # Copy all files from source_dir to extract_path
-                for item in os.listdir(source_dir):
+                for item in sorted(os.listdir(source_dir)):
                     s = os.path.join(source_dir, item)
                     d = os.path.join(extract_path, item)
                     if os.path.isdir(s):
@@ -199,7 +202,7 @@ def find_question_files(question_num):
             return nested_path
             
         # Try to find any subfolder that contains question.txt
-        for item in os.listdir(extract_path):
+        for item in sorted(os.listdir(extract_path)):
             item_path = os.path.join(extract_path, item)
             if os.path.isdir(item_path) and os.path.exists(os.path.join(item_path, "question.txt")):
                 return item_path
@@ -207,26 +210,48 @@ def find_question_files(question_num):
     # If no valid path found
     return None
 
-def generate_markdown():
-    """Generate markdown file for Anki deck."""
+def generate_markdown(output_md_file=OUTPUT_MD_FILE, media_dir=TEMP_DIR, css_file=None, media=None, shard=None):
+    """Generate markdown file for Anki deck.
+
+    Cards are written one at a time, so memory use does not grow with the
+    deck. Images are copied straight into media_dir, once per distinct
+    content. When css_file is given, the deck starts with frontmatter that
+    links the stylesheet. media is a MediaPipeline that decides how images
+    are optimized and placed; optimization runs on a process pool before
+    the cards are written. With shard, only the questions of that
+    sharding.Shard are written.
+    """
+    media_store = MediaStore(media_dir, media)
     # Process all 120 questions (001-120)
     question_nums = list(range(1, 121))
+    if shard is not None:
+        question_nums = shard.select(question_nums)
     processed_count = 0
     
+    if media and (media.optimizer or media.thumbnailer):
+        question_paths = [find_question_files(num) for num in question_nums]
+        media.warm(iter_figure_paths(p for p in question_paths if p))
+    
     # Debug: print total questions to process
-    print(f"Processing all {len(question_nums)} questions (001-120)")
+    print(f"Processing {len(question_nums)} questions (001-120)")
     
     # Start writing markdown
-    with open(OUTPUT_MD_FILE, 'w', encoding='utf-8') as md_file:
+    with open(output_md_file, 'w', encoding='utf-8') as md_file:
+        # Write frontmatter so mdankideck picks up the custom CSS
+        if css_file:
+            md_file.write("---\n")
+            md_file.write(f"css: {os.path.basename(css_file)}\n")
+            md_file.write("---\n\n")
+        
         # Write deck title
         md_file.write("# 腫專2024\n\n")
         
         # Process each question
-        for question_num in question_nums:
+        for question_num in instrumentation.questions(progress.track(question_nums, "anki-deck")):
             # Find the actual directory containing question files
             question_path = find_question_files(question_num)
             if not question_path:
-                print(f"Warning: Could not find valid question files for {question_num:03d}")
+                progress.warn(f"Warning: Could not find valid question files for {question_num:03d}")
                 continue
                 
             processed_count += 1
@@ -234,7 +259,7 @@ def generate_markdown():
             # Read question content
             question_text = read_file_content(os.path.join(question_path, "question.txt"))
             if not question_text:
-                print(f"Warning: No question text found for {question_dir}")
+                progress.warn(f"Warning: No question text found for {question_num:03d}")
                 continue  # Skip if no question text
                 
             # Read options
@@ -251,13 +276,11 @@ def generate_markdown():
             # Process images
             question_images = process_images(
                 os.path.join(question_path, "question_figures"), 
-                question_num, 
-                "q"
+                media_store
             )
             explain_images = process_images(
                 os.path.join(question_path, "explain_figures"), 
-                question_num, 
-                "e"
+                media_store
             )
             
             # Create question content with proper HTML structure
@@ -267,8 +290,8 @@ def generate_markdown():
             question_content += f"    <p>{question_text}</p>\n"
             
             # Add question images if any
-            for orig_name, new_name in question_images:
-                question_content += f"    <img src=\"{new_name}\" alt=\"{orig_name}\">\n"
+            for orig_name, new_name, img_html in question_images:
+                question_content += f"    {img_html}\n"
             
             # Add options
             question_content += f"    <div class=\"options\">\n"
@@ -289,8 +312,8 @@ def generate_markdown():
             answer_content += f"    <p>{question_text}</p>\n"
             
             # Add question images if any
-            for orig_name, new_name in question_images:
-                answer_content += f"    <img src=\"{new_name}\" alt=\"{orig_name}\">\n"
+            for orig_name, new_name, img_html in question_images:
+                answer_content += f"    {img_html}\n"
             
             # Add options
             answer_content += f"    <div class=\"options\">\n"
@@ -317,8 +340,8 @@ def generate_markdown():
                     answer_content += f"      <p>{line}</p>\n"
             
             # Add explanation images if any
-            for orig_name, new_name in explain_images:
-                answer_content += f"      <img src=\"{new_name}\" alt=\"{orig_name}\">\n"
+            for orig_name, new_name, img_html in explain_images:
+                answer_content += f"      {img_html}\n"
             
             answer_content += f"    </div>\n"
             answer_content += f"  </div>\n"
@@ -332,94 +355,61 @@ def generate_markdown():
             md_file.write("---\n\n")  # Separator between cards
             
             # Add explanation images if any
-            for orig_name, new_name in explain_images:
+            for orig_name, new_name, img_html in explain_images:
                 md_file.write(f"![{orig_name}]({new_name})\n\n")
             
             md_file.write("---\n\n")  # Separator between cards
     
-    print(f"Markdown file generated: {OUTPUT_MD_FILE}")
+    print(f"Markdown file generated: {output_md_file}")
+    print(f"Media: {media_store.summary()}")
     return processed_count
 
-if __name__ == "__main__":
-    # Clean up temp directory if it exists
-    if os.path.exists(TEMP_DIR):
-        shutil.rmtree(TEMP_DIR)
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    
-    # Clean up output directory if it exists
-    if os.path.exists(OUTPUT_DIR):
-        shutil.rmtree(OUTPUT_DIR)
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    
-    # Create custom CSS file
-    css_file = create_custom_css()
-    
-    # Generate markdown file
-    md_file = generate_markdown()
-    
-    # Create a dedicated input directory for the markdown file
-    md_input_dir = os.path.join(BASE_DIR, "md_input")
+def emit_deck(md_input_dir=MD_INPUT_DIR, media=None, shard=None):
+    """Write the frontmatter-prefixed deck, CSS and images into md_input_dir.
+
+    Everything is written once, directly to its final location.
+    """
+    # Start from an empty input directory
     if os.path.exists(md_input_dir):
         shutil.rmtree(md_input_dir)
     os.makedirs(md_input_dir, exist_ok=True)
     
-    # Create frontmatter for the markdown file to include custom CSS
-    with open(os.path.join(md_input_dir, "anki_deck.md"), 'w', encoding='utf-8') as f:
-        f.write("---\n")
-        f.write(f"css: {os.path.basename(css_file)}\n")
-        f.write("---\n\n")
-        
-        # Read the generated markdown file and append it
-        with open(md_file, 'r', encoding='utf-8') as src:
-            f.write(src.read())
-    
-    # Copy CSS file to the input directory
-    shutil.copy2(css_file, os.path.join(md_input_dir, os.path.basename(css_file)))
-    
-    # Copy all images to the input directory
-    for img in os.listdir(TEMP_DIR):
-        shutil.copy2(os.path.join(TEMP_DIR, img), os.path.join(md_input_dir, img))
+    # Create custom CSS file next to the deck
+    css_file = create_custom_css(os.path.join(md_input_dir, os.path.basename(CUSTOM_CSS_FILE)))
+    
+    # Stream the deck and its images into the input directory
+    return generate_markdown(
+        os.path.join(md_input_dir, "anki_deck.md"),
+        md_input_dir,
+        css_file,
+        media,
+        shard
+    )
 
-if __name__ == "__main__":
-    # Clean up temp directory if it exists
-    if os.path.exists(TEMP_DIR):
-        shutil.rmtree(TEMP_DIR)
-    os.makedirs(TEMP_DIR, exist_ok=True)
+def main():
+    parser = argparse.ArgumentParser(description="Generate the Anki deck markdown and media in md_input")
+    add_media_arguments(parser, sync=False)
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+    
+    # A shard writes into its own shard directory
+    output_dir, md_input_dir = OUTPUT_DIR, MD_INPUT_DIR
+    if args.shard:
+        output_dir, md_input_dir = args.shard.output_path(OUTPUT_DIR), args.shard.output_path(MD_INPUT_DIR)
     
     # Clean up output directory if it exists
-    if os.path.exists(OUTPUT_DIR):
-        shutil.rmtree(OUTPUT_DIR)
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    
-    # Create custom CSS file
-    css_file = create_custom_css()
-    
-    # Generate markdown file
-    processed_count = generate_markdown()
-    
-    # Create a dedicated input directory for the markdown file
-    md_input_dir = os.path.join(BASE_DIR, "md_input")
-    if os.path.exists(md_input_dir):
-        shutil.rmtree(md_input_dir)
-    os.makedirs(md_input_dir, exist_ok=True)
-    
-    # Create frontmatter for the markdown file to include custom CSS
-    with open(os.path.join(md_input_dir, "anki_deck.md"), 'w', encoding='utf-8') as f:
-        f.write("---\n")
-        f.write(f"css: {os.path.basename(css_file)}\n")
-        f.write("---\n\n")
-        
-        # Read the generated markdown file and append it
-        with open(OUTPUT_MD_FILE, 'r', encoding='utf-8') as src:
-            f.write(src.read())
-    
-    # Copy CSS file to the input directory
-    shutil.copy2(css_file, os.path.join(md_input_dir, os.path.basename(css_file)))
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
     
-    # Copy all images to the input directory
-    for img in os.listdir(TEMP_DIR):
-        shutil.copy2(os.path.join(TEMP_DIR, img), os.path.join(md_input_dir, img))
+    # Generate the markdown deck and media in the input directory
+    processed_count = emit_deck(md_input_dir, media_from_args(args), args.shard)
     
-    print(f"Successfully processed {processed_count} questions out of 120.")
+    print(f"Successfully processed {processed_count} questions.")
     print("Now run the following command to create the Anki deck:")
-    print(f"source .venv/bin/activate && mdankideck {md_input_dir} {OUTPUT_DIR}")
+    print(f"source .venv/bin/activate && mdankideck {md_input_dir} {output_dir}")
+
+if __name__ == "__main__":
+    main()
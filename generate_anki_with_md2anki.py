@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import os
 import re
-import shutil
 import subprocess
 import html
 from pathlib import Path
 
+import instrumentation
+import progress
+import sharding
+from media_utils import MediaStore, add_media_arguments, iter_figure_paths, media_from_args
+from reproducible import ANKI_REWRITE, normalize_zip
+
 # 配置
 BASE_DIR = Path(__file__).parent.absolute()  # 使用當前腳本所在目錄
 QUESTIONS_DIR = BASE_DIR / 'normalized_questions'
@@ -15,24 +21,17 @@ OUTPUT_DIR = BASE_DIR / 'anki_output'
 MARKDOWN_DIR = BASE_DIR / 'markdown_input'
 MEDIA_DIR = MARKDOWN_DIR / 'media'
 
-# 確保輸出目錄存在
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(MARKDOWN_DIR, exist_ok=True)
-os.makedirs(MEDIA_DIR, exist_ok=True)
-
-def copy_image_files(src_dir, dest_dir, question_num):
-    """複製圖片文件到媒體目錄"""
+def copy_image_files(src_dir, media_store):
+    """複製圖片文件到媒體目錄，以內容雜湊命名，相同圖片只存一份"""
     images = []
     if not os.path.exists(src_dir):
         return images
     
-    for file in os.listdir(src_dir):
+    for file in sorted(os.listdir(src_dir)):
         if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.svg')):
             src_path = os.path.join(src_dir, file)
-            # 創建一個唯一的文件名，包含問題編號
-            new_filename = f"q{question_num:03d}_{file}"
-            dest_path = os.path.join(dest_dir, new_filename)
-            shutil.copy2(src_path, dest_path)
+            # 以內容雜湊作為文件名，多個問題共用的圖片只複製一次
+            new_filename = media_store.add(src_path)
             images.append((file, f"media/{new_filename}"))
     
     return images
@@ -49,18 +48,27 @@ def escape_html_content(text):
     # 使用html.escape轉義HTML字符，但保留換行符
     return html.escape(text, quote=False)
 
-def generate_markdown():
-    """生成適用於md2anki的Markdown文件"""
+def generate_markdown(markdown_dir=MARKDOWN_DIR, media=None, shard=None):
+    """生成適用於md2anki的Markdown文件，可選擇先以多進程優化所有圖片；指定 shard 時只包含該分片的問題"""
     question_nums = list(range(1, 121))
+    if shard is not None:
+        question_nums = shard.select(question_nums)
     processed_count = 0
     
-    markdown_path = MARKDOWN_DIR / 'anki_deck.md'
+    markdown_path = markdown_dir / 'anki_deck.md'
+    media_store = MediaStore(markdown_dir / 'media', media)
+    if media and media.optimizer:
+        # 先以進程池優化所有圖片，之後逐題寫入時直接使用快取
+        # 只處理本次（或本分片）要匯出的題目；巢狀目錄（NNN/NNN）一併列入
+        question_dirs = [QUESTIONS_DIR / f"{num:03d}" for num in question_nums]
+        question_dirs += [d / d.name for d in question_dirs]
+        media.warm(iter_figure_paths(question_dirs))
     
     with open(markdown_path, 'w', encoding='utf-8') as md_file:
         # 寫入標題
         md_file.write("# 腫專2024\n\n")
         
-        for question_num in question_nums:
+        for question_num in instrumentation.questions(progress.track(question_nums, "md2anki")):
             question_dir = QUESTIONS_DIR / f"{question_num:03d}"
             
             # 檢查問題目錄是否存在
@@ -69,13 +77,13 @@ def generate_markdown():
                 if os.path.exists(nested_dir):
                     question_dir = nested_dir
                 else:
-                    print(f"警告: 找不到問題 {question_num:03d} 的目錄")
+                    progress.warn(f"警告: 找不到問題 {question_num:03d} 的目錄")
                     continue
             
             # 讀取問題文件
             question_file = question_dir / "question.txt"
             if not os.path.exists(question_file):
-                print(f"警告: 找不到問題 {question_num:03d} 的問題文件")
+                progress.warn(f"警告: 找不到問題 {question_num:03d} 的問題文件")
                 continue
             
             with open(question_file, 'r', encoding='utf-8') as f:
@@ -115,8 +123,8 @@ def generate_markdown():
                 explanation = "未提供解釋"
             
             # 複製圖片文件
-            question_images = copy_image_files(question_dir / "question_figures", MEDIA_DIR, question_num)
-            explain_images = copy_image_files(question_dir / "explain_figures", MEDIA_DIR, question_num)
+            question_images = copy_image_files(question_dir / "question_figures", media_store)
+            explain_images = copy_image_files(question_dir / "explain_figures", media_store)
             
             # 寫入問題標題
             md_file.write(f"## Question {question_num:03d}\n\n")
@@ -163,45 +171,67 @@ def generate_markdown():
             
             processed_count += 1
     
+    # 刪除本次沒有用到的媒體檔（已修改或刪除的圖片留下的舊雜湊檔名）
+    media_store.prune()
+    
     print(f"Markdown 檔案已生成: {markdown_path}")
     print(f"成功處理了 {processed_count} 個問題")
+    print(f"媒體文件: {media_store.summary()}")
     return markdown_path
 
-def generate_anki_deck(markdown_path):
+def generate_anki_deck(markdown_path, output_dir=OUTPUT_DIR):
     """使用md2anki生成Anki牌組"""
     print("開始生成 Anki 牌組...")
     
     # 確保輸出目錄存在
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
     
     # 設置輸出文件路徑
-    output_apkg = OUTPUT_DIR / "anki_deck.apkg"
+    output_apkg = output_dir / "anki_deck.apkg"
     
-    # 構建md2anki命令
+    # 構建md2anki命令 (圖片路徑相對於 Markdown 所在目錄)
     cmd = [
         "md2anki",
         str(markdown_path),
         "-o-anki", str(output_apkg),
-        "-file-dir", str(MARKDOWN_DIR)
+        "-file-dir", str(Path(markdown_path).parent)
     ]
     
     # 執行命令
     try:
-        subprocess.run(cmd, check=True)
+        instrumentation.run_subprocess("md2anki", cmd, check=True)
+        # 固定壓縮檔內的時間戳記、順序與牌組資料庫的 id，確保相同輸入產生相同輸出
+        if output_apkg.exists():
+            normalize_zip(output_apkg, rewrite=ANKI_REWRITE)
         print("成功生成 Anki 牌組!")
-        print(f"Anki 牌組位於: {OUTPUT_DIR}")
+        print(f"Anki 牌組位於: {output_dir}")
     except subprocess.CalledProcessError as e:
-        print(f"生成 Anki 牌組時出錯: {e}")
+        progress.warn(f"生成 Anki 牌組時出錯: {e}")
         return False
     
     return True
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="使用md2anki生成Anki牌組")
+    add_media_arguments(parser, sync=False, thumbnails=False)
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+    
+    # 分片時輸出到該分片的目錄
+    markdown_dir, output_dir = MARKDOWN_DIR, OUTPUT_DIR
+    if args.shard:
+        markdown_dir, output_dir = args.shard.output_path(MARKDOWN_DIR), args.shard.output_path(OUTPUT_DIR)
+    
     # 生成Markdown文件
-    markdown_path = generate_markdown()
+    markdown_path = generate_markdown(markdown_dir, media_from_args(args), args.shard)
     
     # 生成Anki牌組
-    if generate_anki_deck(markdown_path):
+    if generate_anki_deck(markdown_path, output_dir):
         print(f"完成! Anki 牌組已生成，包含所有問題")
     else:
         print("生成 Anki 牌組失敗")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Per-stage instrumentation for the pipeline.
+
+Runs stages in-process and records, for each one: wall and CPU time, the
+time of every question, the number of files read and written, files and
+bytes copied, the tracemalloc peak, and the time spent in the external
+tools (unar, md2anki, mdankideck, mdbook). The results are written as JSON:
+
+    python instrumentation.py                         # all stages -> metrics.json
+    python instrumentation.py extract mdbook sheet --output -
+    python instrumentation.py --profile slowest.prof  # cProfile dump of the slowest stage
+
+Scripts report per-question times by looping over
+instrumentation.questions(...) and run external tools with
+instrumentation.run_subprocess(...); both cost nothing when
+instrumentation is not enabled. File counters come from audit hooks, so
+they cover every stage without further changes. Work done in worker
+processes only shows up in the stage's CPU time (as child CPU time).
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Opens of these files are imports, not pipeline I/O
+IGNORED_SUFFIXES = (".py", ".pyc", ".so", ".pyd", ".pth")
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR
+
+
+def cpu_time():
+    """CPU time of this process plus that of its finished child processes."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def question_key(item):
+    """Name a question by its number (001) or the name of its folder or archive."""
+    if isinstance(item, int):
+        return f"{item:03d}"
+    return os.path.basename(os.fspath(item))
+
+
+class StageMetrics:
+    """Counters of one stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.files_read = 0
+        self.files_written = 0
+        self.files_copied = 0
+        self.files_linked = 0
+        self.bytes_copied = 0
+        self.memory_peak_bytes = None
+        self.subprocesses = {}  # tool name -> {"count", "seconds", "failures"}
+        self.questions = {}  # question key -> {"wall_seconds", "cpu_seconds"}
+        self.error = None
+
+    def to_dict(self):
+        slowest = sorted(self.questions.items(), key=lambda item: item[1]["wall_seconds"], reverse=True)
+        return {
+            "name": self.name,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "files_read": self.files_read,
+            "files_written": self.files_written,
+            "files_copied": self.files_copied,
+            "files_linked": self.files_linked,
+            "bytes_copied": self.bytes_copied,
+            "memory_peak_bytes": self.memory_peak_bytes,
+            "subprocesses": self.subprocesses,
+            "question_count": len(self.questions),
+            "slowest_questions": [key for key, _ in slowest[:10]],
+            "questions": self.questions,
+            "error": self.error,
+        }
+
+
+class Instrumentation:
+    """Collects StageMetrics for the stages run while it is enabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.profile = False
+        self.stages = []
+        self.current = None
+        self.slowest_profile = None  # (wall seconds, stage name, cProfile.Profile)
+        self.lock = threading.Lock()
+        self.hook_installed = False
+
+    def enable(self, trace_memory=True, profile=False):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.profile = profile
+        if trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        # Audit hooks cannot be removed, so install one that checks self.current
+        if not self.hook_installed:
+            sys.addaudithook(self._audit)
+            self.hook_installed = True
+
+    def _audit(self, event, args):
+        stage = self.current
+        if stage is None:
+            return
+        if event == "open":
+            path, _, flags = args
+            if path is None or isinstance(path, int):
+                return
+            path = os.fsdecode(path)
+            if path.endswith(IGNORED_SUFFIXES):
+                return
+            if flags & WRITE_FLAGS:
+                stage.files_written += 1
+            else:
+                stage.files_read += 1
+        elif event == "shutil.copyfile":
+            stage.files_copied += 1
+            try:
+                stage.bytes_copied += os.path.getsize(args[0])
+            except OSError:
+                pass
+        elif event == "os.link":
+            stage.files_linked += 1
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Record the metrics of the code run in the with-block as stage name."""
+        metrics = StageMetrics(name)
+        self.stages.append(metrics)
+        profiler = None
+        if self.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.reset_peak()
+        self.current = metrics
+        wall_start, cpu_start = time.perf_counter(), cpu_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield metrics
+        finally:
+            if profiler:
+                profiler.disable()
+            metrics.wall_seconds = time.perf_counter() - wall_start
+            metrics.cpu_seconds = cpu_time() - cpu_start
+            self.current = None
+            if self.trace_memory:
+                metrics.memory_peak_bytes = tracemalloc.get_traced_memory()[1]
+            if profiler and (self.slowest_profile is None or metrics.wall_seconds > self.slowest_profile[0]):
+                self.slowest_profile = (metrics.wall_seconds, name, profiler)
+
+    def questions(self, items, key=question_key):
+        """Iterate over items, recording the time of each loop body as one question."""
+        if not self.enabled:
+            return items
+        return self._timed_questions(items, key)
+
+    def _timed_questions(self, items, key):
+        for item in items:
+            stage = self.current
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            try:
+                yield item
+            finally:
+                if stage is not None:
+                    entry = stage.questions.setdefault(key(item), {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+                    entry["wall_seconds"] += time.perf_counter() - wall_start
+                    entry["cpu_seconds"] += time.process_time() - cpu_start
+
+    def run_subprocess(self, tool, *args, **kwargs):
+        """subprocess.run, timed as one call of tool when instrumentation is enabled."""
+        stage = self.current
+        if not self.enabled or stage is None:
+            return subprocess.run(*args, **kwargs)
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = subprocess.run(*args, **kwargs)
+            failed = result.returncode != 0
+            return result
+        finally:
+            # mdbook builds run on threads
+            with self.lock:
+                entry = stage.subprocesses.setdefault(tool, {"count": 0, "seconds": 0.0, "failures": 0})
+                entry["count"] += 1
+                entry["seconds"] += time.perf_counter() - start
+                entry["failures"] += failed
+
+    def to_dict(self):
+        return {
+            "python": sys.version.split()[0],
+            "total_wall_seconds": round(sum(stage.wall_seconds for stage in self.stages), 6),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def dump_profile(self, path):
+        """Write the cProfile stats of the slowest stage. Returns its name."""
+        if self.slowest_profile is None:
+            return None
+        _, name, profiler = self.slowest_profile
+        profiler.dump_stats(path)
+        return name
+
+
+metrics = Instrumentation()
+stage = metrics.stage
+questions = metrics.questions
+run_subprocess = metrics.run_subprocess
+
+
+def _run_extract():
+    import extract_and_normalize
+    extract_and_normalize.process_zip_files()
+
+
+def _run_deck():
+    import convert_to_mdankideck
+    output_dir = convert_to_mdankideck.OUTPUT_DIR
+    output_dir.mkdir(exist_ok=True)
+    question_dirs = convert_to_mdankideck.list_question_dirs(convert_to_mdankideck.QUESTIONS_DIR)
+    convert_to_mdankideck.write_single_deck(question_dirs, output_dir)
+    if not convert_to_mdankideck.package_deck(output_dir, "."):
+        raise RuntimeError("mdankideck did not write medical_questions.apkg")
+    convert_to_mdankideck.normalize_package(Path(".") / "medical_questions.apkg")
+
+
+def _run_md2anki():
+    import generate_anki_with_md2anki
+    markdown_path = generate_anki_with_md2anki.generate_markdown()
+    generate_anki_with_md2anki.generate_anki_deck(markdown_path)
+
+
+def _run_anki_deck():
+    import generate_anki_deck
+    generate_anki_deck.emit_deck()
+
+
+def _run_mdbook():
+    import create_mdbook
+    create_mdbook.build_book()
+    create_mdbook.run_mdbook_builds([create_mdbook.BOOK_DIR])
+
+
+def _run_mkdoc():
+    from to_mkdoc import MkdocConverter
+    MkdocConverter().convert_all()
+
+
+def _run_mkdocs():
+    import txt2md
+    txt2md.convert_all_questions()
+
+
+def _run_html():
+    import to_html
+    to_html.export_bundles()
+
+
+def _run_sheet():
+    import to_sheets
+    to_sheets.export_sheet(to_sheets.QUESTIONS_DIR, to_sheets.BASE_DIR / "questions_sheet.xlsx")
+
+
+def _run_columnar():
+    import to_columnar
+    to_columnar.export_columnar()
+
+
+# Stages with their default inputs and outputs, in pipeline order
+STAGES = {
+    "extract": _run_extract,
+    "deck": _run_deck,
+    "md2anki": _run_md2anki,
+    "anki-deck": _run_anki_deck,
+    "mdbook": _run_mdbook,
+    "mkdoc": _run_mkdoc,
+    "mkdocs": _run_mkdocs,
+    "html": _run_html,
+    "sheet": _run_sheet,
+    "columnar": _run_columnar,
+}
+
+
+def run_stages(stage_names):
+    """Run each stage under instrumentation; a failing stage is recorded and the rest still run."""
+    for name in stage_names:
+        print(f"=== {name} ===")
+        with stage(name) as stage_metrics:
+            try:
+                STAGES[name]()
+            except ImportError as e:
+                stage_metrics.error = f"skipped: {e}"
+            except Exception as e:
+                stage_metrics.error = f"{type(e).__name__}: {e}"
+        if stage_metrics.error:
+            print(f"{name}: {stage_metrics.error}")
+
+
+def print_summary():
+    print(f"\n{'stage':<10} {'wall s':>8} {'cpu s':>8} {'read':>6} {'written':>7} {'copied':>10} {'peak MB':>8}")
+    for stage_metrics in metrics.stages:
+        peak = stage_metrics.memory_peak_bytes
+        print(f"{stage_metrics.name:<10} {stage_metrics.wall_seconds:8.3f} {stage_metrics.cpu_seconds:8.3f} "
+              f"{stage_metrics.files_read:6d} {stage_metrics.files_written:7d} "
+              f"{stage_metrics.bytes_copied / 1e6:8.1f}MB {peak / 1e6 if peak is not None else 0:8.1f}")
+        for tool, entry in stage_metrics.subprocesses.items():
+            print(f"    {tool}: {entry['count']} call(s), {entry['seconds']:.3f} s")
+
+
+def main():
+    import progress
+
+    parser = argparse.ArgumentParser(description="Run pipeline stages and record timings, I/O and memory as JSON")
+    parser.add_argument("stages", nargs="*", help=f"stages to run (default: all of {', '.join(STAGES)})")
+    parser.add_argument("--output", default="metrics.json", help="JSON output file, - for stdout (default: metrics.json)")
+    parser.add_argument("--profile", nargs="?", const="slowest_stage.prof", metavar="FILE",
+                        help="write cProfile stats of the slowest stage (default file: slowest_stage.prof)")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory (tracemalloc slows stages down)")
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    metrics.enable(trace_memory=not args.no_memory, profile=bool(args.profile))
+    # Stage output goes to stderr when the JSON is written to stdout
+    with contextlib.redirect_stdout(sys.stderr if args.output == "-" else sys.stdout):
+        run_stages(args.stages or list(STAGES))
+        print_summary()
+
+    report = metrics.to_dict()
+    if args.profile:
+        report["profile"] = {"stage": metrics.dump_profile(args.profile), "file": args.profile}
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nMetrics: {args.output}")
+        if args.profile:
+            print(f"Profile of the slowest stage ({report['profile']['stage']}): {args.profile}")
+    return 1 if any(s.error and not s.error.startswith("skipped") for s in metrics.stages) else 0
+
+
+if __name__ == "__main__":
+    # The scripts import this module as "instrumentation"; run main() on
+    # that instance so they report to the same collector
+    import instrumentation
+    sys.exit(instrumentation.main())
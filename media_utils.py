@@ -0,0 +1,823 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for placing question figures into exporter outputs.
+
+Figures can be copied, hardlinked, reflinked or symlinked (see
+materialize). Image optimization and responsive thumbnails are optional
+and need Pillow (`uv pip install pillow`).
+"""
+
+import hashlib
+import html
+import json
+import os
+import shutil
+import struct
+import sys
+
+import progress
+
+# Number of hex digits of the SHA-256 digest used in media file names
+HASH_PREFIX_LENGTH = 16
+
+# Optimized images are cached here, keyed by source hash and settings
+MEDIA_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".media_cache")
+
+# Formats the optimizer re-encodes; everything else is passed through
+OPTIMIZABLE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Bump when the optimization code changes so stale cache entries are ignored
+OPTIMIZER_VERSION = 1
+
+# How figures are placed in outputs, and what to try when a mode is not possible
+DEFAULT_MEDIA_MODE = "copy"
+MEDIA_MODE_FALLBACKS = {
+    "copy": ("copy",),
+    "hardlink": ("hardlink", "reflink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "symlink": ("symlink", "hardlink", "copy"),
+}
+
+# Widths of the responsive thumbnails generated for figures
+THUMBNAIL_WIDTHS = (320, 640, 1024)
+THUMBNAIL_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+THUMBNAIL_VERSION = 1
+
+# Layout width hint for srcset: full width on phones, at most 800px otherwise
+IMAGE_SIZES = "(max-width: 800px) 100vw, 800px"
+
+# Linux ioctl that clones a file's extents (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# How destination files are compared with their sources during a sync
+SYNC_COMPARE_MODES = ("mtime", "hash")
+
+_digest_cache = {}
+_digest_cache_dirty = False
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in chunks.
+
+    Digests are remembered per (path, size, mtime), so hashing the same
+    unchanged file twice in one run reads it once. See load_digest_index
+    for keeping them across runs.
+    """
+    global _digest_cache_dirty
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_size, stat.st_mtime_ns)
+    if key in _digest_cache:
+        return _digest_cache[key]
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    _digest_cache[key] = digest.hexdigest()
+    _digest_cache_dirty = True
+    return _digest_cache[key]
+
+
+def load_digest_index(index_path):
+    """Load digests saved by save_digest_index, so unchanged files are not re-read."""
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    for path, size, mtime_ns, digest in entries:
+        _digest_cache.setdefault((path, size, mtime_ns), digest)
+
+
+def save_digest_index(index_path):
+    """Save the digests computed so far, if any are new."""
+    global _digest_cache_dirty
+    if not _digest_cache_dirty:
+        return
+    entries = sorted([*key, digest] for key, digest in _digest_cache.items())
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+    os.replace(tmp_path, index_path)
+    _digest_cache_dirty = False
+
+
+def format_bytes(size):
+    """Format a byte count for humans, e.g. 1536 -> '1.5 KB'."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _optimize_image(src_path, dst_path, settings):
+    """Re-encode one image according to settings and write it to dst_path.
+
+    Runs in worker processes, so it only takes plain, picklable arguments.
+    """
+    from PIL import Image
+
+    ext = os.path.splitext(src_path)[1].lower()
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    resized = False
+
+    with Image.open(src_path) as img:
+        img.load()
+        max_dimension = settings["max_dimension"]
+        if max_dimension and max(img.size) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            resized = True
+
+        if settings["webp"]:
+            img.save(tmp_path, "WEBP", lossless=(ext == ".png"), quality=settings["jpeg_quality"], method=6)
+        elif ext in (".jpg", ".jpeg"):
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(tmp_path, "JPEG", quality=settings["jpeg_quality"], optimize=True, progressive=True)
+        else:
+            img.save(tmp_path, "PNG", optimize=True)
+
+    # Keep the original when re-encoding in the same format did not help
+    if not resized and not settings["webp"] and os.path.getsize(tmp_path) >= os.path.getsize(src_path):
+        shutil.copyfile(src_path, tmp_path)
+
+    os.replace(tmp_path, dst_path)
+    return dst_path
+
+
+class ImageOptimizer:
+    """Shrinks figures with Pillow and caches the results on disk.
+
+    PNGs are recompressed losslessly, JPEGs are re-encoded at no more than
+    jpeg_quality, anything larger than max_dimension is downscaled, and
+    webp=True converts both to WebP. Results are cached under
+    cache_dir/<settings key>/<source hash><ext>, so rerunning with the same
+    settings costs nothing.
+    """
+
+    def __init__(self, jpeg_quality=85, max_dimension=None, webp=False, cache_dir=MEDIA_CACHE_DIR, workers=None):
+        import PIL  # noqa: F401  (fail early when Pillow is missing)
+
+        self.settings = {
+            "version": OPTIMIZER_VERSION,
+            "jpeg_quality": jpeg_quality,
+            "max_dimension": max_dimension,
+            "webp": webp,
+        }
+        settings_key = hashlib.sha256(json.dumps(self.settings, sort_keys=True).encode()).hexdigest()[:12]
+        self.cache_dir = os.path.join(cache_dir, settings_key)
+        self.digest_index = os.path.join(cache_dir, "digests.json")
+        self.workers = workers
+        self.cache_hits = 0
+        self.cache_misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Finding a cache entry needs the source hash; reuse hashes of unchanged files
+        load_digest_index(self.digest_index)
+
+    def output_name(self, filename):
+        """Return the file name an image will have after optimization."""
+        base, ext = os.path.splitext(filename)
+        if self.settings["webp"] and ext.lower() in OPTIMIZABLE_EXTENSIONS:
+            return base + ".webp"
+        return filename
+
+    def cache_path(self, src_path, digest=None):
+        """Return the cache location of the optimized version of src_path."""
+        digest = digest or file_sha256(src_path)
+        ext = os.path.splitext(self.output_name(src_path))[1].lower()
+        return os.path.join(self.cache_dir, digest + ext)
+
+    def optimize(self, src_path, digest=None):
+        """Return the path of an optimized copy of src_path.
+
+        Files that are not optimizable images, or that fail to decode, are
+        returned unchanged.
+        """
+        src_path = str(src_path)
+        if os.path.splitext(src_path)[1].lower() not in OPTIMIZABLE_EXTENSIONS:
+            return src_path
+
+        cached = self.cache_path(src_path, digest)
+        if os.path.exists(cached):
+            self.cache_hits += 1
+            return cached
+
+        self.cache_misses += 1
+        try:
+            return _optimize_image(src_path, cached, self.settings)
+        except Exception as e:
+            progress.warn(f"Warning: could not optimize {src_path}: {e}")
+            return src_path
+
+    def warm(self, paths):
+        """Optimize every uncached image in paths on a process pool."""
+        pending = {}
+        for path in paths:
+            path = str(path)
+            if os.path.splitext(path)[1].lower() not in OPTIMIZABLE_EXTENSIONS:
+                continue
+            cached = self.cache_path(path)
+            if not os.path.exists(cached):
+                pending.setdefault(cached, path)
+        save_digest_index(self.digest_index)
+
+        if not pending:
+            return 0
+
+        # Imported here: multiprocessing is slow to import and most runs have nothing to process
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(_optimize_image, src, dst, self.settings): src
+                for dst, src in pending.items()
+            }
+            for future, src in progress.track(futures.items(), "optimize figures"):
+                try:
+                    future.result()
+                except Exception as e:
+                    progress.warn(f"Warning: could not optimize {src}: {e}")
+        return len(pending)
+
+    def summary(self):
+        """Describe how often the cache was used."""
+        return f"image cache: {self.cache_hits} hits, {self.cache_misses} misses"
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        kind = marker[1]
+        if kind in (0xD8, 0x01) or 0xD0 <= kind <= 0xD7:
+            continue
+        length = struct.unpack(">H", f.read(2))[0]
+        # SOF markers carry the frame size; C4/C8/CC are tables, not frames
+        if 0xC0 <= kind <= 0xCF and kind not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def image_size(file_path):
+    """Return (width, height) of a PNG, JPEG, GIF or WebP image, or None.
+
+    Only the file header is read, so Pillow is not needed. Other formats
+    fall back to Pillow when it is installed.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(32)
+            if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", head[6:10])
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                chunk = head[12:16]
+                if chunk == b"VP8 ":
+                    width, height = struct.unpack("<HH", head[26:30])
+                    return width & 0x3FFF, height & 0x3FFF
+                if chunk == b"VP8L":
+                    bits = int.from_bytes(head[21:25], "little")
+                    return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                if chunk == b"VP8X":
+                    return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+            if head[:2] == b"\xff\xd8":
+                return _jpeg_size(f)
+    except (OSError, struct.error):
+        return None
+
+    try:
+        from PIL import Image
+        with Image.open(file_path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def thumbnail_name(filename, width):
+    """Return the file name of the thumbnail of filename at width, e.g. a.png -> a-320w.png."""
+    base, ext = os.path.splitext(filename)
+    return f"{base}-{width}w{ext}"
+
+
+def img_tag(src, alt, size=None, thumbnails=(), link=True, style=None):
+    """Return the HTML for a figure.
+
+    size is (width, height) of the full-resolution image and thumbnails a
+    list of (width, url). Browsers pick the smallest file that fits from
+    srcset, load it lazily and reserve its space up front; with link=True
+    the image links to the full-resolution file.
+    """
+    attrs = [f'src="{html.escape(src)}"']
+    if thumbnails and size:
+        candidates = [f"{html.escape(url)} {width}w" for width, url in thumbnails]
+        candidates.append(f"{html.escape(src)} {size[0]}w")
+        attrs.append(f'srcset="{", ".join(candidates)}"')
+        attrs.append(f'sizes="{IMAGE_SIZES}"')
+    if size:
+        attrs.append(f'width="{size[0]}" height="{size[1]}"')
+    attrs.append('loading="lazy" decoding="async"')
+    if style:
+        attrs.append(f'style="{style}"')
+    attrs.append(f'alt="{html.escape(alt)}"')
+    tag = f"<img {' '.join(attrs)}>"
+    if link:
+        tag = f'<a href="{html.escape(src)}">{tag}</a>'
+    return tag
+
+
+def _make_thumbnail(src_path, dst_path, width):
+    """Downscale one image to width and write it to dst_path (runs in worker processes)."""
+    from PIL import Image
+
+    ext = os.path.splitext(src_path)[1].lower()
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    with Image.open(src_path) as img:
+        img.load()
+        height = max(1, round(img.height * width / img.width))
+        img = img.resize((width, height), Image.LANCZOS)
+        if ext in (".jpg", ".jpeg"):
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(tmp_path, "JPEG", quality=80, optimize=True, progressive=True)
+        elif ext == ".webp":
+            img.save(tmp_path, "WEBP", quality=80, method=6)
+        else:
+            img.save(tmp_path, "PNG", optimize=True)
+    os.replace(tmp_path, dst_path)
+    return dst_path
+
+
+class Thumbnailer:
+    """Generates downscaled copies of figures at a few widths, cached on disk.
+
+    Only widths smaller than the image get a thumbnail. Results are cached
+    under cache_dir/thumbs/v<version>/<source hash>-<width>w<ext>.
+    """
+
+    def __init__(self, widths=THUMBNAIL_WIDTHS, cache_dir=MEDIA_CACHE_DIR, workers=None):
+        import PIL  # noqa: F401  (fail early when Pillow is missing)
+
+        self.widths = tuple(sorted(set(widths)))
+        self.cache_dir = os.path.join(cache_dir, "thumbs", f"v{THUMBNAIL_VERSION}")
+        self.digest_index = os.path.join(cache_dir, "digests.json")
+        self.workers = workers
+        os.makedirs(self.cache_dir, exist_ok=True)
+        load_digest_index(self.digest_index)
+
+    def _plan(self, src_path):
+        """Return [(width, cache path)] of the thumbnails src_path should have."""
+        src_path = str(src_path)
+        ext = os.path.splitext(src_path)[1].lower()
+        if ext not in THUMBNAIL_EXTENSIONS:
+            return []
+        size = image_size(src_path)
+        if not size:
+            return []
+        digest = file_sha256(src_path)
+        return [
+            (width, os.path.join(self.cache_dir, f"{digest}-{width}w{ext}"))
+            for width in self.widths if width < size[0]
+        ]
+
+    def thumbnails(self, src_path):
+        """Return [(width, path)] of the thumbnails of src_path, creating missing ones."""
+        result = []
+        for width, cached in self._plan(src_path):
+            if not os.path.exists(cached):
+                try:
+                    _make_thumbnail(str(src_path), cached, width)
+                except Exception as e:
+                    progress.warn(f"Warning: could not create thumbnail of {src_path}: {e}")
+                    continue
+            result.append((width, cached))
+        return result
+
+    def warm(self, paths):
+        """Create every missing thumbnail of the images in paths on a process pool."""
+        pending = {}
+        for path in paths:
+            for width, cached in self._plan(path):
+                if not os.path.exists(cached):
+                    pending.setdefault(cached, (str(path), width))
+        save_digest_index(self.digest_index)
+
+        if not pending:
+            return 0
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(_make_thumbnail, src, dst, width): src
+                for dst, (src, width) in pending.items()
+            }
+            for future, src in progress.track(futures.items(), "thumbnails"):
+                try:
+                    future.result()
+                except Exception as e:
+                    progress.warn(f"Warning: could not create thumbnail of {src}: {e}")
+        return len(pending)
+
+
+def _reflink(src_path, dst_path):
+    """Create a copy-on-write clone of src_path, or raise OSError."""
+    if sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src_path), os.fsencode(dst_path), 0) != 0:
+            raise OSError(ctypes.get_errno(), "clonefile failed")
+        return
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflinks are not supported on this platform")
+    try:
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        if os.path.exists(dst_path):
+            os.unlink(dst_path)
+        raise
+    shutil.copystat(src_path, dst_path)
+
+
+def _materialize_once(src_path, dst_path, mode):
+    if mode == "copy":
+        shutil.copy2(src_path, dst_path)
+    elif mode == "hardlink":
+        os.link(src_path, dst_path)
+    elif mode == "reflink":
+        _reflink(src_path, dst_path)
+    elif mode == "symlink":
+        os.symlink(os.path.relpath(src_path, os.path.dirname(os.path.abspath(dst_path))), dst_path)
+    else:
+        raise ValueError(f"unknown media mode: {mode}")
+
+
+def materialize(src_path, dst_path, mode="copy"):
+    """Place src_path at dst_path using mode, falling back when it is not possible.
+
+    Modes are "copy", "hardlink", "reflink" (copy-on-write clone) and
+    "symlink" (relative). A hardlink across filesystems falls back to a
+    reflink and then a copy; a symlink that cannot be created falls back to
+    a hardlink and then a copy. Returns the mode that was actually used.
+    """
+    src_path, dst_path = str(src_path), str(dst_path)
+    # Never write through an existing link into the source file
+    if os.path.lexists(dst_path):
+        os.unlink(dst_path)
+
+    for attempt in MEDIA_MODE_FALLBACKS[mode]:
+        try:
+            _materialize_once(src_path, dst_path, attempt)
+            return attempt
+        except OSError:
+            if attempt == "copy":
+                raise
+    return mode
+
+
+class MediaPipeline:
+    """How figures get from normalized_questions into an exporter's output.
+
+    Each figure is optionally optimized (see ImageOptimizer) and then
+    materialized at its destination with the configured media mode. With a
+    Thumbnailer, downscaled copies are placed next to each figure and
+    referenced from its srcset (see figure_html).
+    """
+
+    # Keeps images with explicit width/height attributes from being stretched
+    IMG_STYLE = "max-width:100%;height:auto"
+
+    def __init__(self, optimizer=None, mode=DEFAULT_MEDIA_MODE, compare="mtime", thumbnailer=None):
+        if mode not in MEDIA_MODE_FALLBACKS:
+            raise ValueError(f"unknown media mode: {mode}")
+        if compare not in SYNC_COMPARE_MODES:
+            raise ValueError(f"unknown sync comparison: {compare}")
+        self.optimizer = optimizer
+        self.mode = mode
+        self.compare = compare
+        self.thumbnailer = thumbnailer
+        self.modes_used = {}
+
+    def output_name(self, filename):
+        """Return the file name a figure has in the output."""
+        return self.optimizer.output_name(filename) if self.optimizer else filename
+
+    def source_for(self, src_path, digest=None):
+        """Return the file to materialize for src_path (optimized if enabled)."""
+        return self.optimizer.optimize(src_path, digest) if self.optimizer else str(src_path)
+
+    def thumbnails(self, src_path):
+        """Return [(width, path)] of the thumbnails of the figure placed for src_path."""
+        if not self.thumbnailer:
+            return []
+        return self.thumbnailer.thumbnails(self.source_for(src_path))
+
+    def warm(self, paths):
+        """Optimize all figures in paths and create their thumbnails up front, when enabled."""
+        if not (self.optimizer or self.thumbnailer):
+            return
+        paths = [str(path) for path in paths]
+        if self.optimizer:
+            self.optimizer.warm(paths)
+        if self.thumbnailer:
+            self.thumbnailer.warm(self.source_for(path) for path in paths)
+
+    def figure_files(self, src_path):
+        """Return {output file name: file to place} for a figure and its thumbnails."""
+        name = self.output_name(os.path.basename(str(src_path)))
+        files = {name: self.source_for(src_path)}
+        for width, thumbnail in self.thumbnails(src_path):
+            files[thumbnail_name(name, width)] = thumbnail
+        return files
+
+    def figure_html(self, src_path, url_prefix, alt):
+        """Return the <img> HTML for a figure placed (with sync_dir) at url_prefix."""
+        name = self.output_name(os.path.basename(str(src_path)))
+        thumbnails = [
+            (width, url_prefix + thumbnail_name(name, width)) for width, _ in self.thumbnails(src_path)
+        ]
+        return img_tag(url_prefix + name, alt, image_size(self.source_for(src_path)),
+                       thumbnails, style=self.IMG_STYLE)
+
+    def place(self, src_path, dst_dir, filename=None):
+        """Materialize src_path in dst_dir and return the destination path."""
+        filename = self.output_name(filename or os.path.basename(src_path))
+        dst_path = os.path.join(str(dst_dir), filename)
+        used = materialize(self.source_for(src_path), dst_path, self.mode)
+        self.modes_used[used] = self.modes_used.get(used, 0) + 1
+        return dst_path
+
+    def is_up_to_date(self, src_path, dst_path):
+        """Return True when dst_path already holds what src_path would place there.
+
+        With compare="mtime" only file metadata is read: size and mtime must
+        match (copies keep the source mtime; links share it). With
+        compare="hash" the contents are compared by SHA-256.
+
+        Only a symlink is stale in itself, when the mode no longer places
+        symlinks. In symlink mode a regular file is accepted: it is what
+        materialize falls back to where symlinks cannot be created.
+        """
+        if not os.path.lexists(dst_path):
+            return False
+        if os.path.islink(dst_path) and self.mode != "symlink":
+            return False
+        try:
+            src_stat = os.stat(src_path)
+            dst_stat = os.stat(dst_path)
+        except OSError:
+            return False
+        if src_stat.st_size != dst_stat.st_size:
+            return False
+        if self.compare == "hash":
+            return file_sha256(src_path) == file_sha256(dst_path)
+        return src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+    def sync_dir(self, src_paths, dst_dir, report, prune=True):
+        """Make dst_dir hold exactly the figures in src_paths (and their thumbnails).
+
+        Only new or changed figures are placed; with prune=True files in
+        dst_dir that no source maps to are deleted. When two sources have
+        the same name, the later one wins. Changes are counted in report.
+        """
+        dst_dir = str(dst_dir)
+        expected = {}
+        for src_path in src_paths:
+            expected.update(self.figure_files(src_path))
+
+        if expected:
+            os.makedirs(dst_dir, exist_ok=True)
+        for name, source in expected.items():
+            dst_path = os.path.join(dst_dir, name)
+            if self.is_up_to_date(source, dst_path):
+                report.unchanged += 1
+                continue
+            existed = os.path.lexists(dst_path)
+            used = materialize(source, dst_path, self.mode)
+            self.modes_used[used] = self.modes_used.get(used, 0) + 1
+            if used == "copy":
+                report.bytes_copied += os.path.getsize(source)
+            if existed:
+                report.updated += 1
+            else:
+                report.created += 1
+
+        if prune and os.path.isdir(dst_dir):
+            for name in sorted(os.listdir(dst_dir)):
+                path = os.path.join(dst_dir, name)
+                if name not in expected and (os.path.isfile(path) or os.path.islink(path)):
+                    os.unlink(path)
+                    report.removed += 1
+            if not os.listdir(dst_dir):
+                os.rmdir(dst_dir)
+        return report
+
+
+class SyncReport:
+    """Counts of what a media sync changed."""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.bytes_copied = 0
+
+    @property
+    def changed(self):
+        return self.created + self.updated + self.removed
+
+    def summary(self):
+        """Describe the sync in one line."""
+        return (
+            f"{self.created} new, {self.updated} updated, {self.unchanged} unchanged, "
+            f"{self.removed} removed figures ({format_bytes(self.bytes_copied)} copied)"
+        )
+
+
+def add_media_arguments(parser, placement=True, sync=True, thumbnails=True):
+    """Add the shared media options to an argparse parser.
+
+    Exporters that do not place figure files (placement), do not sync
+    figure directories (sync) or cannot use thumbnails leave those options
+    out; media_from_args then uses their defaults.
+    """
+    group = parser.add_argument_group("media")
+    if placement:
+        group.add_argument(
+            "--media-mode",
+            choices=sorted(MEDIA_MODE_FALLBACKS),
+            default=os.environ.get("QBANK_MEDIA_MODE", DEFAULT_MEDIA_MODE),
+            help="how figures are placed in the output (default: $QBANK_MEDIA_MODE or copy)",
+        )
+    if sync:
+        group.add_argument(
+            "--sync-compare",
+            choices=SYNC_COMPARE_MODES,
+            default="mtime",
+            help="detect changed figures by size and mtime (default) or by content hash",
+        )
+    group.add_argument("--optimize-images", action="store_true", help="recompress and downscale figures before export (requires Pillow)")
+    group.add_argument("--jpeg-quality", type=int, default=85, help="maximum JPEG quality (default: 85)")
+    group.add_argument("--max-dimension", type=int, help="downscale images whose longer side exceeds this many pixels")
+    group.add_argument("--webp", action="store_true", help="convert PNG and JPEG figures to WebP")
+    group.add_argument("--media-workers", type=int, help="number of image optimization processes")
+    if thumbnails:
+        group.add_argument(
+            "--thumbnails",
+            action="store_true",
+            help="add responsive thumbnails to figures (requires Pillow)",
+        )
+        group.add_argument(
+            "--thumbnail-widths",
+            type=lambda value: tuple(int(width) for width in value.split(",")),
+            default=THUMBNAIL_WIDTHS,
+            help=f"comma-separated thumbnail widths in pixels (default: {','.join(map(str, THUMBNAIL_WIDTHS))})",
+        )
+    return parser
+
+
+def cache_dir_from_args(args):
+    """Return the media cache directory; a --shard run keeps its own in its shard directory."""
+    shard = getattr(args, "shard", None)
+    return os.path.join(shard.dir, ".media_cache") if shard else MEDIA_CACHE_DIR
+
+
+def optimizer_from_args(args):
+    """Build an ImageOptimizer from parsed arguments, or None when disabled."""
+    if not args.optimize_images:
+        return None
+    try:
+        return ImageOptimizer(
+            jpeg_quality=args.jpeg_quality,
+            max_dimension=args.max_dimension,
+            webp=args.webp,
+            cache_dir=cache_dir_from_args(args),
+            workers=args.media_workers,
+        )
+    except ImportError:
+        progress.warn("Warning: Pillow is not installed, figures will be copied unoptimized")
+        return None
+
+
+def thumbnailer_from_args(args):
+    """Build a Thumbnailer from parsed arguments, or None when disabled."""
+    if not getattr(args, "thumbnails", False):
+        return None
+    try:
+        return Thumbnailer(args.thumbnail_widths, cache_dir=cache_dir_from_args(args), workers=args.media_workers)
+    except ImportError:
+        progress.warn("Warning: Pillow is not installed, figures will have no thumbnails")
+        return None
+
+
+def media_from_args(args):
+    """Build the MediaPipeline described by parsed arguments."""
+    return MediaPipeline(
+        optimizer_from_args(args),
+        getattr(args, "media_mode", DEFAULT_MEDIA_MODE),
+        getattr(args, "sync_compare", "mtime"),
+        thumbnailer_from_args(args),
+    )
+
+
+def iter_figure_paths(question_dirs):
+    """Yield every figure file in the question_figures/explain_figures of question_dirs."""
+    for question_dir in question_dirs:
+        for figures in ("question_figures", "explain_figures"):
+            figures_dir = os.path.join(question_dir, figures)
+            if not os.path.isdir(figures_dir):
+                continue
+            for name in sorted(os.listdir(figures_dir)):
+                path = os.path.join(figures_dir, name)
+                if not name.startswith(".") and os.path.isfile(path):
+                    yield path
+
+
+class MediaStore:
+    """A media directory where every file is named by its content hash.
+
+    Adding the same figure twice, even from different questions, stores it
+    once and returns the same name, so all cards point at the shared file.
+    """
+
+    def __init__(self, media_dir, media=None):
+        self.media_dir = str(media_dir)
+        self.media = media or MediaPipeline()
+        self.names = {}  # digest -> stored file name
+        self.thumbnail_names = set()
+        self.files_stored = 0
+        self.bytes_original = 0
+        self.bytes_stored = 0
+        self.duplicates = 0
+        self.bytes_saved = 0
+        self.removed = 0
+        os.makedirs(self.media_dir, exist_ok=True)
+
+    def add(self, src_path):
+        """Store src_path (once) and return its file name inside media_dir."""
+        src_path = str(src_path)
+        digest = file_sha256(src_path)
+        size = os.path.getsize(src_path)
+
+        if digest in self.names:
+            self.duplicates += 1
+            self.bytes_saved += size
+            return self.names[digest]
+
+        stored_path = self.media.source_for(src_path, digest)
+        _, ext = os.path.splitext(stored_path)
+        name = f"{digest[:HASH_PREFIX_LENGTH]}{ext.lower()}"
+        materialize(stored_path, os.path.join(self.media_dir, name), self.media.mode)
+        self.names[digest] = name
+        self.files_stored += 1
+        self.bytes_original += size
+        self.bytes_stored += os.path.getsize(stored_path)
+        return name
+
+    def add_figure(self, src_path, alt):
+        """Store a figure and its thumbnails; return (file name, <img> HTML)."""
+        name = self.add(src_path)
+        thumbnails = []
+        for width, thumbnail in self.media.thumbnails(src_path):
+            thumb_name = thumbnail_name(name, width)
+            if thumb_name not in self.thumbnail_names:
+                materialize(thumbnail, os.path.join(self.media_dir, thumb_name), self.media.mode)
+                self.thumbnail_names.add(thumb_name)
+            thumbnails.append((width, thumb_name))
+        size = image_size(self.media.source_for(src_path))
+        return name, img_tag(name, alt, size, thumbnails, link=False)
+
+    def prune(self):
+        """Remove files in media_dir that were not stored in this run. Returns the count."""
+        kept = set(self.names.values()) | self.thumbnail_names
+        for name in sorted(os.listdir(self.media_dir)):
+            path = os.path.join(self.media_dir, name)
+            if name not in kept and (os.path.isfile(path) or os.path.islink(path)):
+                os.unlink(path)
+                self.removed += 1
+        return self.removed
+
+    def summary(self):
+        """Describe how many files were stored and how much deduplication saved."""
+        text = (
+            f"{self.files_stored} media files stored ({format_bytes(self.bytes_stored)}), "
+            f"{self.duplicates} duplicates skipped, {format_bytes(self.bytes_saved)} saved"
+        )
+        if self.thumbnail_names:
+            text += f", {len(self.thumbnail_names)} thumbnails"
+        if self.removed:
+            text += f", {self.removed} stale files removed"
+        if self.media.optimizer:
+            text += (
+                f"; optimized from {format_bytes(self.bytes_original)}"
+                f" ({self.media.optimizer.summary()})"
+            )
+        return text
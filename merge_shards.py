@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Merge the outputs of sharded runs into the final outputs.
+把各分片的輸出合併為最終輸出
+
+    python create_mdbook.py --shard 1/2      # on this machine
+    python create_mdbook.py --shard 2/2      # on another one, then copy shards/ back
+    python merge_shards.py                   # every output found in shards/
+    python merge_shards.py mdbook sheet --section-size 50
+
+How each output is merged:
+
+    apkg      every .apkg (deck, md2anki): the notes, cards and media of all
+              shards in one collection, in question order
+    mdbook    chapters and figures copied, SUMMARY.md rebuilt
+    mkdocs    question pages copied, nav and search index rebuilt
+    mkdoc     same as mkdocs; existing note.md files are kept
+    sheet     rows of all shards in question order
+    columnar  rows of all shards in question order (JSONL, Parquet, Arrow)
+
+html bundles and the md_input / markdown_input decks are not merged;
+each shard keeps its own. Merging reads only shards/, so the shard
+directories can come from other machines. All shards of one run
+(shard-1-of-N ... shard-N-of-N) must be present.
+"""
+
+import argparse
+import filecmp
+import fnmatch
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+import sharding
+from mkdocs_index import SEARCH_SHARD_SIZE, write_mkdocs_site
+from output_utils import WriteReport
+from reproducible import OFFICE_REWRITE, normalize_zip
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SHEET_NAME = "questions_sheet.xlsx"
+
+
+def complete_shards(shards_dir=sharding.SHARDS_DIR):
+    """Return the shards of the one sharded run in shards_dir.
+
+    Raises ValueError when shards of different counts are mixed or a shard
+    is missing.
+    """
+    shards = sharding.list_shards(shards_dir)
+    if not shards:
+        raise ValueError(f"no shard directories in {shards_dir}")
+    counts = sorted({shard.count for shard in shards})
+    if len(counts) > 1:
+        raise ValueError(f"shards of different runs in {shards_dir} (of {', '.join(map(str, counts))}); remove the stale ones")
+    count = counts[0]
+    missing = sorted(set(range(1, count + 1)) - {shard.index for shard in shards})
+    if missing:
+        raise ValueError(f"missing shard(s) {', '.join(f'{i}/{count}' for i in missing)}")
+    return shards
+
+
+def merged_records(shards):
+    """Return the question records of all shard manifests, in question order."""
+    records = {}
+    for shard in shards:
+        manifest = sharding.read_manifest(shard.dir)
+        if manifest is None:
+            raise ValueError(f"{shard.dir} has no {sharding.MANIFEST_NAME}")
+        for record in manifest["questions"]:
+            if record["number"] in records:
+                raise ValueError(f"question {record['number']} is in more than one shard")
+            records[record["number"]] = record
+    return [records[number] for number in sorted(records, key=int)]
+
+
+def shard_outputs(shards, relative):
+    """Return the path of relative in every shard, or [] if no shard has it.
+
+    Raises ValueError when only some shards have it.
+    """
+    paths = [os.path.join(shard.dir, relative) for shard in shards]
+    present = [path for path in paths if os.path.exists(path)]
+    if present and len(present) != len(paths):
+        lacking = [str(shard) for shard, path in zip(shards, paths) if not os.path.exists(path)]
+        raise ValueError(f"{relative} is missing from shard(s) {', '.join(lacking)}")
+    return present
+
+
+def copy_if_changed(src, dst, report):
+    """Copy src to dst unless dst already has the same content (keeping its mtime)."""
+    if os.path.exists(dst) and filecmp.cmp(src, dst, shallow=False):
+        report.unchanged += 1
+        return
+    report.record("updated" if os.path.exists(dst) else "created")
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, dst)
+
+
+def copy_tree(src_dir, dst_dir, report, keep_existing=(), skip=()):
+    """Copy every file under src_dir to dst_dir.
+
+    Files named in keep_existing are not overwritten, and files matching a
+    pattern in skip are not copied.
+    """
+    for root, dirs, files in os.walk(src_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in skip):
+                continue
+            src = os.path.join(root, name)
+            dst = os.path.join(dst_dir, os.path.relpath(src, src_dir))
+            if name in keep_existing and os.path.exists(dst):
+                report.unchanged += 1
+                continue
+            copy_if_changed(src, dst, report)
+
+
+# ---------------------------------------------------------------- apkg
+
+def question_sort_key(sort_field):
+    """Question number at the start of a card front (e.g. "<h2 ...>005 ..."), for ordering notes."""
+    text = re.sub(r"<[^>]*>", " ", str(sort_field))
+    match = re.search(r"\d+", text)
+    return int(match.group()) if match else sys.maxsize
+
+
+def read_package(apkg_path, work_dir):
+    """Read the collection tables and media of an .apkg extracted into work_dir."""
+    with zipfile.ZipFile(apkg_path) as package:
+        names = package.namelist()
+        collection = next((name for name in ("collection.anki21", "collection.anki2") if name in names), None)
+        if collection is None:
+            raise ValueError(f"{apkg_path}: unsupported package format (no collection.anki2)")
+        collection_path = package.extract(collection, work_dir)
+        media = json.loads(package.read("media")) if "media" in names else {}
+        media = {name: package.read(index) for index, name in sorted(media.items(), key=lambda item: int(item[0]))}
+
+    conn = sqlite3.connect(collection_path)
+    try:
+        models, decks = conn.execute("SELECT models, decks FROM col").fetchone()
+        notes = conn.execute("SELECT * FROM notes ORDER BY id").fetchall()
+        cards = conn.execute("SELECT * FROM cards ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    return {
+        "collection": collection,
+        "collection_path": collection_path,
+        "models": json.loads(models),
+        "decks": json.loads(decks),
+        "notes": notes,
+        "cards": cards,
+        "media": media,
+    }
+
+
+def merge_packages(apkg_paths, output_path):
+    """Combine the notes, cards and media of several .apkg files into one.
+
+    Note types and decks are matched by id, or by name when a shard gave
+    the same deck or note type another id. Notes with the same guid are
+    kept once. Notes get new ids in question order, so Anki shows new
+    cards in the same order as an unsharded deck. Returns the note count.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        packages = [read_package(path, os.path.join(work_dir, str(i))) for i, path in enumerate(apkg_paths)]
+        base = packages[0]
+
+        models, decks = {}, {}
+        notes, cards, media = [], [], {}
+        seen_guids = set()
+        for order, package in enumerate(packages):
+            model_ids = merge_by_name(models, package["models"])
+            deck_ids = merge_by_name(decks, package["decks"])
+            kept_notes = set()
+            for note in package["notes"]:
+                note_id, guid, mid = note[0], note[1], str(note[2])
+                if guid in seen_guids:
+                    continue
+                seen_guids.add(guid)
+                kept_notes.add(note_id)
+                note = list(note)
+                note[2] = int(model_ids.get(mid, mid))
+                notes.append((question_sort_key(note[7]), order, note_id, note))
+            for card in package["cards"]:
+                if card[1] in kept_notes:
+                    card = list(card)
+                    card[2] = int(deck_ids.get(str(card[2]), card[2]))
+                    cards.append((order, card))
+            for name, data in package["media"].items():
+                media.setdefault(name, data)
+
+        # New ids in question order, starting at the smallest original id
+        notes.sort(key=lambda item: item[:3])
+        first_note_id = min(item[2] for item in notes) if notes else 1
+        note_ids = {}
+        for new_id, (_, order, old_id, note) in enumerate(notes, first_note_id):
+            note_ids[(order, old_id)] = new_id
+            note[0] = new_id
+        for order, card in cards:
+            card[1] = note_ids[(order, card[1])]
+        cards = [card for _, card in cards]
+        cards.sort(key=lambda card: (card[1], card[3]))
+        first_card_id = min(card[0] for card in cards) if cards else 1
+        for new_id, card in enumerate(cards, first_card_id):
+            card[0] = new_id
+
+        conn = sqlite3.connect(base["collection_path"])
+        try:
+            conn.execute("DELETE FROM notes")
+            conn.execute("DELETE FROM cards")
+            if notes:
+                placeholders = ",".join("?" * len(notes[0][3]))
+                conn.executemany(f"INSERT INTO notes VALUES({placeholders})", [item[3] for item in notes])
+            if cards:
+                placeholders = ",".join("?" * len(cards[0]))
+                conn.executemany(f"INSERT INTO cards VALUES({placeholders})", cards)
+            conn.execute("UPDATE col SET models = ?, decks = ?", (json.dumps(models), json.dumps(decks)))
+            conn.commit()
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as package:
+            package.write(base["collection_path"], base["collection"])
+            names = sorted(media)
+            package.writestr("media", json.dumps({str(i): name for i, name in enumerate(names)}))
+            for i, name in enumerate(names):
+                package.writestr(str(i), media[name])
+        os.replace(tmp_path, output_path)
+    normalize_zip(output_path)
+    return len(notes)
+
+
+def merge_by_name(merged, entries):
+    """Add the note types or decks of one package to merged.
+
+    Returns {id in the package: id in merged} for entries that already
+    exist in merged under another id with the same name.
+    """
+    by_name = {entry["name"]: entry_id for entry_id, entry in merged.items()}
+    remap = {}
+    for entry_id, entry in entries.items():
+        if entry_id in merged:
+            continue
+        if entry["name"] in by_name:
+            remap[entry_id] = by_name[entry["name"]]
+        else:
+            merged[entry_id] = entry
+            by_name[entry["name"]] = entry_id
+    return remap
+
+
+def merge_apkg(shards, records, args):
+    relatives = set()
+    for shard in shards:
+        for path in Path(shard.dir).rglob("*.apkg"):
+            relatives.add(os.path.relpath(path, shard.dir))
+    if not relatives:
+        return False
+    for relative in sorted(relatives):
+        paths = shard_outputs(shards, relative)
+        count = merge_packages(paths, os.path.join(BASE_DIR, relative))
+        print(f"{relative}: {count} notes from {len(paths)} shards")
+    return True
+
+
+# ---------------------------------------------------------------- mdbook
+
+def merge_mdbook(shards, records, args):
+    import create_mdbook
+
+    book_dirs = shard_outputs(shards, "mdbook")
+    if not book_dirs:
+        return False
+    book_dir = create_mdbook.BOOK_DIR
+    book_src_dir = os.path.join(book_dir, "src")
+    numbers = [record["number"].zfill(3) for record in records]
+
+    report = WriteReport("files")
+    for shard_book_dir in book_dirs:
+        # SUMMARY.md and section pages only cover one shard and are rebuilt below
+        copy_tree(os.path.join(shard_book_dir, "src"), book_src_dir, report,
+                  skip=("SUMMARY.md", "section_*.md"))
+    create_mdbook.create_book_toml(book_dir, title=create_mdbook.BOOK_TITLE, fold=bool(args.section_size))
+    create_mdbook.write_summary(book_src_dir, numbers, args.section_size)
+
+    # Remove chapters and figures of questions that are in no shard
+    chapters = {f"question_{number}.md" for number in numbers}
+    for chapter_file in sorted(Path(book_src_dir).glob("question_*.md")):
+        if chapter_file.name not in chapters:
+            chapter_file.unlink()
+            report.removed += 1
+    normalized_dest = os.path.join(book_src_dir, "normalized_questions")
+    if os.path.isdir(normalized_dest):
+        for name in sorted(os.listdir(normalized_dest)):
+            if name not in {record["number"] for record in records}:
+                shutil.rmtree(os.path.join(normalized_dest, name))
+                report.removed += 1
+
+    print(f"mdbook: {len(records)} questions, {report.summary()}")
+    if args.build:
+        create_mdbook.run_mdbook_builds([book_dir])
+    return True
+
+
+# ---------------------------------------------------------------- mkdocs
+
+def merge_mkdocs_site(shards, records, docs_name, search_shard_size, keep_existing=()):
+    docs_dirs = shard_outputs(shards, docs_name)
+    if not docs_dirs:
+        return False
+    docs_dir = os.path.join(BASE_DIR, docs_name)
+    report = WriteReport("files")
+    for shard_docs_dir in docs_dirs:
+        # Only the question pages; the config and search index are rebuilt below
+        for name in sorted(os.listdir(shard_docs_dir)):
+            if name.isdigit():
+                copy_tree(os.path.join(shard_docs_dir, name), os.path.join(docs_dir, name), report, keep_existing)
+
+    # Remove question pages that are in no shard
+    numbers = {record["number"].zfill(3) for record in records}
+    if os.path.isdir(docs_dir):
+        for name in sorted(os.listdir(docs_dir)):
+            if name.isdigit() and name not in numbers and os.path.isdir(os.path.join(docs_dir, name)):
+                shutil.rmtree(os.path.join(docs_dir, name))
+                report.removed += 1
+    print(f"{docs_name}: {len(records)} questions, {report.summary()}")
+    write_mkdocs_site(docs_dir, records, shard_size=search_shard_size)
+    return True
+
+
+def merge_mkdocs(shards, records, args):
+    return merge_mkdocs_site(shards, records, "mkdocs", args.search_shard_size)
+
+
+def merge_mkdoc(shards, records, args):
+    # to_mkdoc never overwrites note.md, which holds the reader's notes
+    return merge_mkdocs_site(shards, records, "mkdoc", args.search_shard_size, keep_existing=("note.md",))
+
+
+# ---------------------------------------------------------------- sheet
+
+def merge_sheet(shards, records, args):
+    from from_sheets import iter_sheet_rows
+    from to_sheets import COLUMNS, write_workbook
+
+    paths = shard_outputs(shards, SHEET_NAME)
+    if not paths:
+        return False
+    rows = []
+    for path in paths:
+        rows.extend([row[column] for column in COLUMNS] for row in iter_sheet_rows(Path(path)))
+    rows.sort(key=lambda row: int(row[0]))
+
+    widths = [max([len(column)] + [len(row[idx]) for row in rows]) for idx, column in enumerate(COLUMNS)]
+    output_file = Path(BASE_DIR) / SHEET_NAME
+    write_workbook(output_file, rows, widths)
+    normalize_zip(output_file, rewrite=OFFICE_REWRITE)
+    print(f"{SHEET_NAME}: {len(rows)} rows from {len(paths)} shards")
+    return True
+
+
+# ---------------------------------------------------------------- columnar
+
+def read_columnar(path, fmt):
+    """Return the rows of a columnar export as dicts."""
+    if fmt == "jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+    import pyarrow as pa
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pylist()
+
+
+def merge_columnar(shards, records, args):
+    import to_columnar
+
+    merged = False
+    for fmt, file_name in to_columnar.FORMATS.items():
+        relative = os.path.join("columnar", file_name)
+        paths = shard_outputs(shards, relative)
+        if not paths:
+            continue
+        rows = []
+        for path in paths:
+            rows.extend(read_columnar(path, fmt))
+        rows.sort(key=lambda row: int(row["folder_name"]))
+
+        output_path = os.path.join(to_columnar.OUTPUT_DIR, file_name)
+        os.makedirs(to_columnar.OUTPUT_DIR, exist_ok=True)
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        writer = to_columnar.WRITERS[fmt](tmp_path)
+        try:
+            for start in range(0, len(rows), args.batch_size):
+                writer.write(rows[start:start + args.batch_size])
+        finally:
+            writer.close()
+        os.replace(tmp_path, output_path)
+        print(f"{relative}: {len(rows)} rows from {len(paths)} shards")
+        merged = True
+    return merged
+
+
+# Output -> merger(shards, records, args), in pipeline order
+MERGERS = {
+    "apkg": merge_apkg,
+    "mdbook": merge_mdbook,
+    "mkdocs": merge_mkdocs,
+    "mkdoc": merge_mkdoc,
+    "sheet": merge_sheet,
+    "columnar": merge_columnar,
+}
+
+
+def main():
+    from to_sheets import BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description="Merge the outputs of --shard runs into the final outputs")
+    parser.add_argument("outputs", nargs="*", help=f"outputs to merge (default: every one found, of {', '.join(MERGERS)})")
+    parser.add_argument("--shards-dir", default=sharding.SHARDS_DIR, help="directory with the shard-I-of-N directories (default: shards)")
+    parser.add_argument("--section-size", type=int, help="nest the mdBook sidebar in sections of this many questions")
+    parser.add_argument("--build", action="store_true", help="run 'mdbook build' on the merged book")
+    parser.add_argument("--search-shard-size", type=int, default=SEARCH_SHARD_SIZE,
+                        help=f"questions per search index shard and nav section (default: {SEARCH_SHARD_SIZE})")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"rows per Parquet row group (default: {BATCH_SIZE})")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.outputs if name not in MERGERS]
+    if unknown:
+        parser.error(f"unknown output(s): {', '.join(unknown)}")
+
+    try:
+        shards = complete_shards(args.shards_dir)
+        records = merged_records(shards)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Merging {len(shards)} shards with {len(records)} questions from {args.shards_dir}")
+
+    failed = False
+    for name in args.outputs or list(MERGERS):
+        try:
+            if not MERGERS[name](shards, records, args) and args.outputs:
+                print(f"{name}: not found in the shards")
+        except (ValueError, sqlite3.Error, OSError) as e:
+            print(f"{name}: {e}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Generate the mkdocs config (with an explicit nav) and a prebuilt, sharded
+search index for the mkdocs exporters.
+
+Without a nav mkdocs has to discover every page at build time, and its
+built-in search ships one index for the whole site, which is slow to load
+for thousands of questions. Here the nav is written from the question
+records, and the search index is split by question range:
+
+    <docs_dir>/search/manifest.json           shard file names and ranges
+    <docs_dir>/search/shard_0001-0200.json    records of questions 1-200
+    <docs_dir>/search/search.js               loader that fetches shards on demand
+
+The config is written next to the docs directory as <docs_dir>.yml, so the
+site builds with `mkdocs build -f <docs_dir>.yml`.
+"""
+
+import json
+import os
+import re
+
+from output_utils import WriteReport, write_if_changed
+from question_loader import OPTION_LETTERS
+
+SEARCH_SHARD_SIZE = 200
+SEARCH_DIR_NAME = "search"
+TITLE_LENGTH = 80
+
+# Client-side search: a number only loads the shard that contains it,
+# text queries load shards one at a time until enough results are found
+SEARCH_JS = """\
+(function () {
+  var script = document.currentScript;
+  var base = script.src.replace(/search\\/search\\.js(\\?.*)?$/, "");
+  var manifest = null;
+  var shards = {};
+  var LIMIT = 50;
+
+  function fetchJSON(url) {
+    return fetch(url).then(function (response) { return response.json(); });
+  }
+
+  function loadManifest() {
+    if (!manifest) manifest = fetchJSON(base + "search/manifest.json");
+    return manifest;
+  }
+
+  function loadShard(shard) {
+    if (!shards[shard.file]) shards[shard.file] = fetchJSON(base + "search/" + shard.file);
+    return shards[shard.file];
+  }
+
+  function search(query) {
+    query = query.trim().toLowerCase();
+    var number = /^\\d+$/.test(query) ? parseInt(query, 10) : null;
+    return loadManifest().then(function (m) {
+      var candidates = m.shards.filter(function (shard) {
+        return number === null || (number >= shard.first && number <= shard.last);
+      });
+      var results = [];
+      function next(i) {
+        if (i >= candidates.length || results.length >= LIMIT) return results;
+        return loadShard(candidates[i]).then(function (docs) {
+          docs.forEach(function (doc) {
+            if (results.length >= LIMIT) return;
+            var hit = number !== null
+              ? parseInt(doc.number, 10) === number
+              : (doc.title + " " + doc.text).toLowerCase().indexOf(query) !== -1;
+            if (hit) results.push(doc);
+          });
+          return next(i + 1);
+        });
+      }
+      return next(0);
+    });
+  }
+
+  function render(list, results) {
+    list.innerHTML = "";
+    results.forEach(function (doc) {
+      var item = document.createElement("li");
+      var link = document.createElement("a");
+      link.href = base + doc.location;
+      link.textContent = doc.title;
+      item.appendChild(link);
+      list.appendChild(item);
+    });
+  }
+
+  document.addEventListener("DOMContentLoaded", function () {
+    var box = document.createElement("div");
+    box.className = "qbank-search";
+    var input = document.createElement("input");
+    input.type = "search";
+    input.placeholder = "Search questions";
+    var list = document.createElement("ul");
+    box.appendChild(input);
+    box.appendChild(list);
+    document.body.insertBefore(box, document.body.firstChild);
+
+    var pending = 0;
+    input.addEventListener("input", function () {
+      var query = input.value;
+      var ticket = ++pending;
+      if (query.trim().length < 2 && !/^\\d+$/.test(query.trim())) {
+        list.innerHTML = "";
+        return;
+      }
+      search(query).then(function (results) {
+        if (ticket === pending) render(list, results);
+      });
+    });
+  });
+})();
+"""
+
+
+def _collapse(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def search_record(record):
+    """Return the search index entry for one question record."""
+    number = record["number"]
+    options = " ".join(
+        f"{letter}. {record['options'][letter]}" for letter in OPTION_LETTERS if record["options"].get(letter)
+    )
+    title = _collapse(record["question"])
+    if len(title) > TITLE_LENGTH:
+        title = title[:TITLE_LENGTH].rstrip() + "…"
+    return {
+        "number": number,
+        "location": f"{number}/",
+        "title": f"{number} {title}".strip(),
+        "text": _collapse(" ".join([record["question"], options, record["explanation"]])),
+    }
+
+
+def shard_records(records, shard_size=SEARCH_SHARD_SIZE):
+    """Split question records into consecutive runs of at most shard_size."""
+    shard_size = max(1, shard_size)
+    return [records[i:i + shard_size] for i in range(0, len(records), shard_size)]
+
+
+def shard_file_name(first, last):
+    return f"shard_{first:04d}-{last:04d}.json"
+
+
+def write_search_index(docs_dir, records, shard_size=SEARCH_SHARD_SIZE):
+    """Write the sharded search index and its loader into docs_dir/search.
+
+    Shards of removed question ranges are deleted. Returns a WriteReport.
+    """
+    search_dir = os.path.join(docs_dir, SEARCH_DIR_NAME)
+    os.makedirs(search_dir, exist_ok=True)
+    report = WriteReport("search files")
+
+    manifest = {"version": 1, "shard_size": shard_size, "shards": []}
+    for shard in shard_records(records, shard_size):
+        first, last = int(shard[0]["number"]), int(shard[-1]["number"])
+        file_name = shard_file_name(first, last)
+        docs = [search_record(record) for record in shard]
+        content = json.dumps(docs, ensure_ascii=False, separators=(",", ":"))
+        report.record(write_if_changed(os.path.join(search_dir, file_name), content))
+        manifest["shards"].append({"file": file_name, "first": first, "last": last, "count": len(docs)})
+
+    report.record(write_if_changed(
+        os.path.join(search_dir, "manifest.json"),
+        json.dumps(manifest, ensure_ascii=False, indent=2) + "\n",
+    ))
+    report.record(write_if_changed(os.path.join(search_dir, "search.js"), SEARCH_JS))
+
+    current = {shard["file"] for shard in manifest["shards"]}
+    for name in sorted(os.listdir(search_dir)):
+        if name.startswith("shard_") and name.endswith(".json") and name not in current:
+            os.remove(os.path.join(search_dir, name))
+            report.removed += 1
+    return report
+
+
+def render_nav(records, section_size=SEARCH_SHARD_SIZE):
+    """Return the YAML lines of the nav, one section per question range."""
+    lines = ["nav:"]
+    for section in shard_records(records, section_size):
+        first, last = int(section[0]["number"]), int(section[-1]["number"])
+        lines.append(f"  - {json.dumps(f'Questions {first}–{last}', ensure_ascii=False)}:")
+        for record in section:
+            number = record["number"]
+            lines.append(f"    - {json.dumps(number)}:")
+            lines.append(f"      - Question: {number}/index.md")
+            lines.append(f"      - Note: {number}/note.md")
+    return lines
+
+
+def render_config(docs_dir, records, site_name, section_size=SEARCH_SHARD_SIZE):
+    """Return the content of the mkdocs config for docs_dir."""
+    docs_name = os.path.basename(os.path.normpath(docs_dir))
+    lines = [
+        "# Generated from the question records on every export; edits are overwritten.",
+        f"site_name: {json.dumps(site_name, ensure_ascii=False)}",
+        f"docs_dir: {json.dumps(docs_name)}",
+        f"site_dir: {json.dumps(docs_name + '_site')}",
+        "markdown_extensions:",
+        "  - admonition",
+        "  - pymdownx.details",
+        "  - pymdownx.tasklist",
+        "# The built-in search plugin is replaced by the prebuilt index in search/",
+        "plugins: []",
+        "extra_javascript:",
+        f"  - {SEARCH_DIR_NAME}/search.js",
+    ]
+    lines.extend(render_nav(records, section_size))
+    return "\n".join(lines) + "\n"
+
+
+def config_path(docs_dir):
+    """Return the path of the mkdocs config that belongs to docs_dir."""
+    docs_dir = os.path.normpath(os.path.abspath(docs_dir))
+    return os.path.join(os.path.dirname(docs_dir), os.path.basename(docs_dir) + ".yml")
+
+
+def write_mkdocs_site(docs_dir, records, site_name="Medical Questions", shard_size=SEARCH_SHARD_SIZE):
+    """Write the mkdocs config with its nav and the sharded search index.
+
+    records are question records from question_loader, in nav order.
+    Returns the path of the config.
+    """
+    records = list(records)
+    config = config_path(docs_dir)
+    status = write_if_changed(config, render_config(docs_dir, records, site_name, shard_size))
+    report = write_search_index(docs_dir, records, shard_size)
+    print(f"mkdocs config ({status}): {config}")
+    print(f"Search index: {report.summary()}")
+    return config
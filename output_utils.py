@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for writing generated text files.
+"""
+
+import os
+
+CREATED = "created"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+
+
+def write_if_changed(path, content, encoding="utf-8"):
+    """Write content to path only if it differs from what is on disk.
+
+    Unchanged files keep their mtime, so watchers such as `mdbook serve`
+    do not rebuild for them. Changed files are replaced atomically.
+    Returns CREATED, UPDATED or UNCHANGED.
+    """
+    path = str(path)
+    data = content.encode(encoding)
+    status = CREATED
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return UNCHANGED
+        status = UPDATED
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return status
+
+
+class WriteReport:
+    """Counts of created, updated, unchanged and removed files."""
+
+    def __init__(self, noun="files"):
+        self.noun = noun
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+
+    def record(self, status):
+        """Count the status returned by write_if_changed."""
+        setattr(self, status, getattr(self, status) + 1)
+        return status
+
+    @property
+    def changed(self):
+        return self.created + self.updated + self.removed
+
+    def summary(self):
+        """Describe the counts in one line."""
+        return (
+            f"{self.created} created, {self.updated} updated, "
+            f"{self.unchanged} unchanged, {self.removed} removed {self.noun}"
+        )
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Write precompressed .gz (and .br) siblings for the static sites.
+
+Static file servers such as nginx (gzip_static / brotli_static) or Caddy
+(precompressed) can serve these directly instead of compressing every
+response. Run it after `mdbook build` / `mkdocs build`:
+
+    python precompress.py                  # default site directories
+    python precompress.py mdbook/book --workers 8
+
+Files whose compressed sibling is newer are skipped, as are images and
+other formats that are already compressed. A sibling that would not be
+smaller than its original is not written; such files are recorded in
+<site_dir>/.precompress-skip (keyed by size and mtime) so they are not
+compressed again on the next run. Brotli output needs the `brotli`
+package (`uv pip install brotli`); without it only .gz is written.
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+
+import progress
+from media_utils import format_bytes
+from output_utils import write_if_changed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Build outputs of create_mdbook.py (mdbook build, also per part with
+# --split-books) and the mkdocs configs; glob patterns are expanded
+DEFAULT_SITE_DIRS = [
+    os.path.join(BASE_DIR, "mdbook", "book"),
+    os.path.join(BASE_DIR, "mdbook", "parts", "*", "book"),
+    os.path.join(BASE_DIR, "mkdoc_site"),
+    os.path.join(BASE_DIR, "mkdocs_site"),
+]
+
+# Text formats that compress well; images, fonts like woff2 and archives do not
+COMPRESSIBLE_EXTENSIONS = (
+    ".html", ".htm", ".css", ".js", ".mjs", ".json", ".map", ".md", ".txt",
+    ".xml", ".svg", ".csv", ".ttf", ".otf", ".eot",
+)
+
+# Smaller files gain nothing from compression
+MIN_SIZE = 256
+
+ENCODINGS = (".gz", ".br")
+
+# Files whose compressed siblings did not shrink, per site directory
+SKIP_FILE = ".precompress-skip"
+
+
+def has_brotli():
+    try:
+        import brotli  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def is_fresh(src_path, compressed_path):
+    """Return True when compressed_path exists and is not older than src_path."""
+    try:
+        return os.stat(compressed_path).st_mtime_ns >= os.stat(src_path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def load_skipped(site_dir):
+    """Return {relative path: {encoding: [size, mtime_ns]}} of siblings not worth writing."""
+    try:
+        with open(os.path.join(site_dir, SKIP_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_skipped(site_dir, skipped):
+    """Write the skip list of site_dir, dropping entries of files that no longer exist."""
+    skipped = {
+        rel_path: encodings for rel_path, encodings in sorted(skipped.items())
+        if encodings and os.path.exists(os.path.join(site_dir, rel_path))
+    }
+    path = os.path.join(site_dir, SKIP_FILE)
+    if skipped:
+        write_if_changed(path, json.dumps(skipped, indent=1, sort_keys=True) + "\n")
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def compress_file(src_path, encodings, level):
+    """Write the missing or stale compressed siblings of one file.
+
+    Runs in worker processes. Siblings that would not be smaller than the
+    original are not written (and stale ones are removed). Returns a list
+    of (encoding, bytes in, bytes out) for the siblings written and the
+    list of encodings that were skipped because they did not shrink.
+    """
+    with open(src_path, "rb") as f:
+        data = f.read()
+
+    written = []
+    skipped = []
+    for encoding in encodings:
+        compressed_path = src_path + encoding
+        if is_fresh(src_path, compressed_path):
+            continue
+        if encoding == ".gz":
+            # mtime=0 and no file name keep the output reproducible
+            compressed = gzip.compress(data, compresslevel=level, mtime=0)
+        else:
+            import brotli
+            compressed = brotli.compress(data, quality=min(11, level + 2))
+
+        if len(compressed) >= len(data):
+            if os.path.exists(compressed_path):
+                os.remove(compressed_path)
+            skipped.append(encoding)
+            continue
+        _write(compressed_path, compressed)
+        written.append((encoding, len(data), len(compressed)))
+    return written, skipped
+
+
+def iter_site_files(site_dir, min_size=MIN_SIZE):
+    """Yield the compressible files under site_dir, in sorted order."""
+    for root, dirs, files in os.walk(site_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name == SKIP_FILE or not name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            if os.path.islink(path) or os.path.getsize(path) < min_size:
+                continue
+            yield path
+
+
+def remove_orphans(site_dir):
+    """Remove .gz/.br files whose original no longer exists. Returns the count."""
+    removed = 0
+    for root, _, files in os.walk(site_dir):
+        for name in files:
+            base, ext = os.path.splitext(name)
+            if ext in ENCODINGS and base.lower().endswith(COMPRESSIBLE_EXTENSIONS) and base not in files:
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+def precompress(site_dirs, brotli=None, level=9, min_size=MIN_SIZE, workers=None):
+    """Precompress every compressible file in site_dirs on a process pool.
+
+    brotli=None writes .br files when the brotli package is installed.
+    Returns the number of compressed files written.
+    """
+    if brotli is None:
+        brotli = has_brotli()
+    elif brotli and not has_brotli():
+        progress.warn("Warning: brotli is not installed, writing .gz files only")
+        brotli = False
+    encodings = (".gz", ".br") if brotli else (".gz",)
+
+    files = []
+    removed = 0
+    skip_lists = {}
+    for site_dir in site_dirs:
+        if not os.path.isdir(site_dir):
+            print(f"Skipping {site_dir}: not a directory")
+            continue
+        removed += remove_orphans(site_dir)
+        skipped = skip_lists[site_dir] = load_skipped(site_dir)
+        for path in iter_site_files(site_dir, min_size):
+            rel_path = os.path.relpath(path, site_dir)
+            signature = file_signature(path)
+            known = skipped.get(rel_path, {})
+            stale = [
+                encoding for encoding in encodings
+                if not is_fresh(path, path + encoding) and known.get(encoding) != signature
+            ]
+            if stale:
+                files.append((site_dir, rel_path, path, stale, signature))
+
+    written = 0
+    bytes_in = bytes_out = 0
+    if files:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(compress_file, [item[2] for item in files], [item[3] for item in files],
+                                   [level] * len(files), chunksize=max(1, len(files) // 64))
+            tracked = progress.track(zip(files, results), "precompress", total=len(files),
+                                     key=lambda item: item[0][2])
+            for (site_dir, rel_path, _, stale, signature), (result, not_smaller) in tracked:
+                for encoding, size_in, size_out in result:
+                    written += 1
+                    bytes_in += size_in
+                    bytes_out += size_out
+                known = skip_lists[site_dir].setdefault(rel_path, {})
+                for encoding in stale:
+                    if encoding in not_smaller:
+                        known[encoding] = signature
+                    else:
+                        known.pop(encoding, None)
+
+    for site_dir, skipped in skip_lists.items():
+        save_skipped(site_dir, skipped)
+
+    print(
+        f"Precompressed {len(files)} files: {written} written "
+        f"({format_bytes(bytes_in)} -> {format_bytes(bytes_out)}), {removed} orphans removed"
+    )
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write .gz/.br siblings for static site files")
+    parser.add_argument("site_dirs", nargs="*", help="site directories (default: the built mdBook and mkdocs sites)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--brotli", dest="brotli", action="store_true", default=None,
+                       help="also write .br files (default: when the brotli package is installed)")
+    group.add_argument("--no-brotli", dest="brotli", action="store_false", help="only write .gz files")
+    parser.add_argument("--level", type=int, default=9, choices=range(1, 10), metavar="1-9",
+                        help="compression level (default: 9)")
+    parser.add_argument("--min-size", type=int, default=MIN_SIZE,
+                        help=f"skip files smaller than this many bytes (default: {MIN_SIZE})")
+    parser.add_argument("--workers", type=int, help="number of compression processes")
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+
+    site_dirs = args.site_dirs or [
+        d for pattern in DEFAULT_SITE_DIRS for d in sorted(glob.glob(pattern)) if os.path.isdir(d)
+    ]
+    if not site_dirs:
+        print("No built sites found; run `mdbook build` or `mkdocs build` first")
+        return 1
+    precompress(site_dirs, args.brotli, args.level, args.min_size, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Shared progress reporting and warning log for the pipeline stages.
+
+Loops over questions are wrapped in progress.track(items, label), which
+shows one status line with the count, rate and ETA instead of a line per
+question. The line is redrawn at most a few times per second on a
+terminal and every few seconds otherwise (logs, CI). Per-question detail
+goes through progress.item() and is only shown in verbose mode.
+Warnings go through progress.warn(): each one is appended as a JSON line
+to the warning log (warnings.jsonl) and shown on stderr unless quiet.
+
+Verbosity is quiet, normal (default) or verbose, from -q / -v on the
+command line or QBANK_VERBOSITY; the log file can be set with --log-file
+or QBANK_LOG_FILE. Quiet mode prints nothing per item; only a count of
+the logged warnings at exit.
+"""
+
+import atexit
+import json
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_FILE = os.path.join(BASE_DIR, "warnings.jsonl")
+
+QUIET, NORMAL, VERBOSE = 0, 1, 2
+VERBOSITY_NAMES = {"quiet": QUIET, "normal": NORMAL, "verbose": VERBOSE}
+
+# Seconds between redraws of the status line
+TTY_INTERVAL = 0.2
+LOG_INTERVAL = 10.0
+
+
+def in_worker_process():
+    """True in a multiprocessing worker (multiprocessing is not imported just to ask)."""
+    multiprocessing = sys.modules.get("multiprocessing")
+    return multiprocessing is not None and multiprocessing.parent_process() is not None
+
+
+def item_name(item):
+    """Name an item in the warning log: 005 for a question number, else the file or folder name."""
+    if isinstance(item, int):
+        return f"{item:03d}"
+    if isinstance(item, (str, os.PathLike)):
+        return os.path.basename(os.fspath(item))
+    return str(item)
+
+
+def format_duration(seconds):
+    """Format seconds as 0.4s, 42s, 3m05s or 1h02m."""
+    if seconds < 10:
+        return f"{seconds:.1f}s"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class Reporter:
+    """Status lines, per-item detail and the warning log of one process."""
+
+    def __init__(self, verbosity=NORMAL, log_file=LOG_FILE, stream=None):
+        self.verbosity = verbosity
+        self.log_file = log_file
+        self.stream = stream or sys.stderr
+        self.warnings = 0
+        self.label = None  # label of the loop being tracked
+        self.current = None  # item being processed
+        self.line_shown = False
+
+    @property
+    def tty(self):
+        return hasattr(self.stream, "isatty") and self.stream.isatty()
+
+    def configure(self, verbosity=None, log_file=None):
+        if verbosity is not None:
+            self.verbosity = verbosity
+        if log_file is not None:
+            self.log_file = log_file
+
+    def _write(self, text):
+        # Clear the status line first so messages do not end up behind it
+        if self.line_shown:
+            self.stream.write("\r\033[K")
+            self.line_shown = False
+        self.stream.write(text + "\n")
+        self.stream.flush()
+
+    def status(self, text, final=False):
+        if self.tty and not final:
+            self.stream.write("\r\033[K" + text)
+            self.stream.flush()
+            self.line_shown = True
+        else:
+            self._write(text)
+
+    def start(self, label, total=None):
+        """Return a Progress for label; call update(n) as items finish and finish() at the end."""
+        return Progress(self, label, total)
+
+    def track(self, items, label, total=None, key=None):
+        """Yield items, keeping a rate-limited status line with rate and ETA.
+
+        key names the current item in logged warnings (default: item_name).
+        """
+        if total is None:
+            try:
+                total = len(items)
+            except TypeError:
+                total = None
+        progress = self.start(label, total)
+        self.label = label
+        try:
+            for item in items:
+                self.current = (key or item_name)(item)
+                yield item
+                progress.update()
+        finally:
+            self.label = self.current = None
+        progress.finish()
+
+    def item(self, message):
+        """Per-item detail, shown only in verbose mode."""
+        if self.verbosity >= VERBOSE:
+            self._write(message)
+
+    def info(self, message):
+        """A message shown unless quiet."""
+        if self.verbosity >= NORMAL:
+            self._write(message)
+
+    def warn(self, message, **fields):
+        """Log a warning to the warning log and show it unless quiet.
+
+        message is shown as given (with its own "Warning:" / "錯誤:"
+        prefix); fields are added to the JSON record, e.g. question="005".
+        """
+        self.warnings += 1
+        if self.verbosity >= NORMAL:
+            self._write(message)
+        from datetime import datetime, timezone
+
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "stage": self.label,
+            "item": self.current,
+            "message": message,
+        }
+        record.update(fields)
+        try:
+            # One write per record, so records of parallel workers do not interleave
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError:
+            pass
+
+    def summary(self):
+        if self.warnings and not in_worker_process():
+            self._write(f"{self.warnings} warning(s) logged to {self.log_file}")
+
+
+class Progress:
+    """Count, rate and ETA of one loop, drawn at most every TTY_INTERVAL / LOG_INTERVAL seconds."""
+
+    def __init__(self, reporter, label, total=None):
+        self.reporter = reporter
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.start = self.last = time.monotonic()
+        # Worker processes leave the status line to the main process
+        self.shown = reporter.verbosity >= NORMAL and not in_worker_process()
+        self.interval = TTY_INTERVAL if reporter.tty else LOG_INTERVAL
+
+    def update(self, count=1):
+        self.done += count
+        if not self.shown:
+            return
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.reporter.status(self.line(now - self.start))
+
+    def line(self, elapsed):
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        line = f"{self.label}: {self.done}"
+        if self.total:
+            line += f"/{self.total} ({self.done / self.total:.0%})"
+        line += f" {rate:.0f}/s"
+        if self.total and rate:
+            line += f" ETA {format_duration((self.total - self.done) / rate)}"
+        return line
+
+    def finish(self):
+        if self.shown:
+            elapsed = time.monotonic() - self.start
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            self.reporter.status(f"{self.label}: {self.done} in {format_duration(elapsed)} ({rate:.0f}/s)", final=True)
+
+
+def verbosity_from_env():
+    return VERBOSITY_NAMES.get(os.environ.get("QBANK_VERBOSITY", "normal").lower(), NORMAL)
+
+
+reporter = Reporter(verbosity_from_env(), os.environ.get("QBANK_LOG_FILE", LOG_FILE))
+start = reporter.start
+track = reporter.track
+item = reporter.item
+info = reporter.info
+warn = reporter.warn
+atexit.register(reporter.summary)
+
+
+def add_progress_arguments(parser):
+    """Add -q / -v / --log-file to an argparse parser."""
+    group = parser.add_argument_group("output")
+    volume = group.add_mutually_exclusive_group()
+    volume.add_argument("-q", "--quiet", action="store_const", const=QUIET, dest="verbosity",
+                        help="no per-question output (warnings are still logged)")
+    volume.add_argument("-v", "--verbose", action="store_const", const=VERBOSE, dest="verbosity",
+                        help="also print a line for every question")
+    group.add_argument("--log-file", help=f"warning log, JSON lines (default: $QBANK_LOG_FILE or {os.path.basename(LOG_FILE)})")
+    return parser
+
+
+def configure_from_args(args):
+    """Apply the options added by add_progress_arguments."""
+    reporter.configure(args.verbosity, args.log_file)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+One command-line entry point for every pipeline stage.
+所有步驟的統一命令列入口
+
+    python qbank.py --help                  # list the commands
+    python qbank.py extract
+    python qbank.py mdbook --section-size 50 --build
+    python qbank.py sheet
+    python qbank.py mdbook --help           # options of one command
+
+Each command runs the main() of its stage script with the remaining
+arguments, so `qbank.py mdbook ...` behaves exactly like
+`create_mdbook.py ...`. Stage modules are imported only when their
+command runs, so listing the commands or asking for help does not load
+pandas, Pillow or any other heavy dependency.
+"""
+
+import importlib
+import os
+import sys
+
+# Command -> (module, description)
+COMMANDS = {
+    "extract": ("extract_and_normalize", "extract zips/ into normalized_questions"),
+    "deck": ("convert_to_mdankideck", "build the Anki deck with markdown-anki-decks"),
+    "anki-deck": ("generate_anki_deck", "write the styled Anki deck markdown and media to md_input"),
+    "md2anki": ("generate_anki_with_md2anki", "build the Anki deck with md2anki"),
+    "mdbook": ("create_mdbook", "build the mdBook"),
+    "mkdoc": ("to_mkdoc", "build the mkdoc site"),
+    "mkdocs": ("txt2md", "build the mkdocs site"),
+    "html": ("to_html", "export single-file offline HTML"),
+    "sheet": ("to_sheets", "export the Excel sheet"),
+    "import-sheet": ("from_sheets", "import edits from the Excel sheet"),
+    "columnar": ("to_columnar", "export JSONL / Parquet / Arrow"),
+    "build": ("build", "rebuild only the stages and questions whose inputs changed"),
+    "merge": ("merge_shards", "merge the outputs of --shard runs"),
+    "compress": ("precompress", "write .gz / .br files next to the built sites"),
+    "check": ("reproducible", "check that every exporter output is reproducible"),
+    "metrics": ("instrumentation", "run stages and record timings, I/O and memory"),
+    "watch": ("watch", "rebuild changed questions as files change"),
+    "serve": ("serve", "serve question previews from memory over local HTTP"),
+}
+
+# Arguments a command always passes to its script
+DEFAULT_ARGS = {
+    "check": ["--check"],
+}
+
+
+def usage():
+    prog = os.path.basename(sys.argv[0])
+    width = max(len(name) for name in COMMANDS)
+    lines = [f"usage: {prog} <command> [options]", "", "commands:"]
+    lines += [f"  {name:<{width}}  {description}" for name, (_, description) in COMMANDS.items()]
+    lines += ["", f"Run '{prog} <command> --help' for the options of a command."]
+    return "\n".join(lines)
+
+
+def run_command(command, argv):
+    """Import the stage module of command and run its main() with argv."""
+    module_name, _ = COMMANDS[command]
+    # The scripts parse sys.argv; their usage line shows "qbank.py <command>"
+    sys.argv = [f"{os.path.basename(sys.argv[0])} {command}"] + DEFAULT_ARGS.get(command, []) + argv
+    module = importlib.import_module(module_name)
+    return module.main()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"Unknown command: {command}\n\n{usage()}", file=sys.stderr)
+        return 2
+    return run_command(command, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
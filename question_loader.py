@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Load normalized question folders into plain question records.
+
+A record is a dict with the question number (as the folder name, e.g.
+"001"), the question text, options A-E, the correct answer, the
+explanation and the figure file names of the question.
+"""
+
+import os
+from pathlib import Path
+
+OPTION_LETTERS = ("A", "B", "C", "D", "E")
+FIGURE_DIRS = ("question_figures", "explain_figures")
+
+
+def read_text(file_path):
+    """Return the stripped content of a text file, or "" if it does not exist."""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def list_question_dirs(normalized_dir):
+    """Return the numeric question folders in normalized_dir, sorted numerically."""
+    normalized_dir = Path(normalized_dir)
+    if not normalized_dir.exists():
+        return []
+    question_dirs = [d for d in normalized_dir.iterdir() if d.is_dir() and d.name.isdigit()]
+    question_dirs.sort(key=lambda d: int(d.name))
+    return question_dirs
+
+
+def list_figures(question_dir, figures):
+    """Return the visible figure file names in one figure directory, sorted."""
+    figures_dir = os.path.join(question_dir, figures)
+    if not os.path.isdir(figures_dir):
+        return []
+    return [
+        name for name in sorted(os.listdir(figures_dir))
+        if not name.startswith(".") and os.path.isfile(os.path.join(figures_dir, name))
+    ]
+
+
+def load_question(question_dir):
+    """Read one normalized question folder into a record."""
+    question_dir = Path(question_dir)
+    return {
+        "number": question_dir.name,
+        "path": str(question_dir),
+        "question": read_text(question_dir / "question.txt"),
+        "options": {
+            letter: read_text(question_dir / f"option_{letter}.txt") for letter in OPTION_LETTERS
+        },
+        "correct_answer": read_text(question_dir / "correct_answer.txt"),
+        "explanation": read_text(question_dir / "explain.txt"),
+        "question_figures": list_figures(question_dir, "question_figures"),
+        "explain_figures": list_figures(question_dir, "explain_figures"),
+    }
+
+
+def iter_questions(normalized_dir):
+    """Yield a record for every question folder in normalized_dir, in order."""
+    for question_dir in list_question_dirs(normalized_dir):
+        yield load_question(question_dir)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Helpers for reproducible builds.
+
+Every exporter should produce byte-identical output for identical input.
+This module provides the pieces they share (zip normalization with fixed
+timestamps and member order) and a check mode that builds each
+exporter twice and compares the results:
+
+    python reproducible.py --check
+    python reproducible.py --check mdbook mkdoc
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Zip archives cannot store dates before 1980, so that is the default epoch.
+# SOURCE_DATE_EPOCH follows https://reproducible-builds.org/specs/source-date-epoch/
+ZIP_EPOCH = 315532800
+SOURCE_DATE_EPOCH = max(int(os.environ.get("SOURCE_DATE_EPOCH", ZIP_EPOCH)), ZIP_EPOCH)
+FIXED_DATE_TIME = time.gmtime(SOURCE_DATE_EPOCH)[:6]
+FIXED_DATETIME = datetime.fromtimestamp(SOURCE_DATE_EPOCH, tz=timezone.utc).replace(tzinfo=None)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def normalize_zip(zip_path, rewrite=None):
+    """Rewrite a zip archive so identical members give identical bytes.
+
+    Members are written in sorted order with a fixed timestamp, fixed
+    permissions and the original compression method. rewrite maps member
+    names to a function(data) returning the data to store (see
+    OFFICE_REWRITE and ANKI_REWRITE); only those members are read into
+    memory, all others are streamed.
+    """
+    zip_path = Path(zip_path)
+    rewrite = rewrite or {}
+    tmp_path = zip_path.with_name(zip_path.name + ".tmp")
+    with zipfile.ZipFile(zip_path, "r") as src, zipfile.ZipFile(tmp_path, "w") as dst:
+        for info in sorted(src.infolist(), key=lambda info: info.filename):
+            fixed = zipfile.ZipInfo(info.filename, date_time=FIXED_DATE_TIME)
+            fixed.compress_type = info.compress_type
+            fixed.create_system = 3
+            if info.is_dir():
+                fixed.external_attr = (0o40755 << 16) | 0x10
+            else:
+                fixed.external_attr = 0o100644 << 16
+            if info.is_dir():
+                dst.writestr(fixed, b"")
+            elif info.filename in rewrite:
+                dst.writestr(fixed, rewrite[info.filename](src.read(info)))
+            else:
+                # The size lets the writer decide on zip64 before streaming
+                fixed.file_size = info.file_size
+                with src.open(info) as data, dst.open(fixed, "w") as out:
+                    shutil.copyfileobj(data, out, COPY_BUFFER_SIZE)
+    os.replace(tmp_path, zip_path)
+    return zip_path
+
+
+def fix_office_timestamps(data):
+    """Pin the created/modified dates that openpyxl writes to docProps/core.xml."""
+    stamp = FIXED_DATETIME.strftime("%Y-%m-%dT%H:%M:%SZ").encode()
+    return re.sub(
+        rb"(<dcterms:(?:created|modified)[^>]*>)[^<]*(</dcterms:)",
+        rb"\g<1>" + stamp + rb"\g<2>",
+        data,
+    )
+
+
+def fix_anki_collection(data):
+    """Pin the time-based ids and modification times in an .apkg collection.
+
+    genanki numbers notes and cards from the current time in milliseconds
+    and stamps them (and the note types) with it. Notes and cards keep
+    their order but are renumbered from SOURCE_DATE_EPOCH; Anki matches
+    imported notes by guid, which does not depend on the time.
+    """
+    with tempfile.TemporaryDirectory(prefix="repro_apkg_") as tmp:
+        path = os.path.join(tmp, "collection.anki2")
+        with open(path, "wb") as f:
+            f.write(data)
+        conn = sqlite3.connect(path)
+        try:
+            first_id = SOURCE_DATE_EPOCH * 1000
+            notes = [old_id for (old_id,) in conn.execute("SELECT id FROM notes ORDER BY id")]
+            cards = conn.execute("SELECT id, nid FROM cards ORDER BY id").fetchall()
+            note_ids = {old_id: new_id for new_id, old_id in enumerate(notes, first_id)}
+            # Negative ids first, so a new id never collides with an old one
+            conn.executemany("UPDATE notes SET id = ?, mod = ? WHERE id = ?",
+                             [(-new_id, SOURCE_DATE_EPOCH, old_id) for old_id, new_id in note_ids.items()])
+            conn.executemany("UPDATE cards SET id = ?, nid = ?, mod = ? WHERE id = ?",
+                             [(-new_id, -note_ids[nid], SOURCE_DATE_EPOCH, old_id)
+                              for new_id, (old_id, nid) in enumerate(cards, first_id)])
+            conn.execute("UPDATE notes SET id = -id")
+            conn.execute("UPDATE cards SET id = -id, nid = -nid")
+            models = json.loads(conn.execute("SELECT models FROM col").fetchone()[0])
+            for model in models.values():
+                model["mod"] = SOURCE_DATE_EPOCH
+            conn.execute("UPDATE col SET models = ?", (json.dumps(models, sort_keys=True),))
+            conn.commit()
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        with open(path, "rb") as f:
+            return f.read()
+
+
+# Members of generated archives that hold timestamps or time-based ids
+OFFICE_REWRITE = {"docProps/core.xml": fix_office_timestamps}
+ANKI_REWRITE = {"collection.anki2": fix_anki_collection, "collection.anki21": fix_anki_collection}
+
+
+def tree_digest(root):
+    """Return {relative path: sha256} for every file under root, sorted by path."""
+    root = Path(root)
+    digest = {}
+    for path in sorted(root.rglob("*")):
+        if path.is_file():
+            digest[path.relative_to(root).as_posix()] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return digest
+
+
+def _build_mdbook(out_dir):
+    import create_mdbook
+    create_mdbook.build_book(create_mdbook.NORMALIZED_DIR, out_dir)
+
+
+# The mkdocs exporters write their config next to the docs directory
+# (<docs_dir>.yml), so they build into a subdirectory of out_dir
+
+
+def _build_mkdoc(out_dir):
+    from to_mkdoc import MkdocConverter
+    MkdocConverter(target_dir=os.path.join(out_dir, "mkdoc")).convert_all()
+
+
+def _build_mkdocs(out_dir):
+    import txt2md
+    txt2md.convert_all_questions(txt2md.NORMALIZED_DIR, os.path.join(out_dir, "mkdocs"))
+
+
+def _build_deck_markdown(out_dir):
+    import convert_to_mdankideck
+    convert_to_mdankideck.write_single_deck(
+        convert_to_mdankideck.list_question_dirs(convert_to_mdankideck.QUESTIONS_DIR), Path(out_dir)
+    )
+
+
+def _build_deck_package(out_dir):
+    import convert_to_mdankideck
+    markdown_dir = Path(out_dir) / "markdown"
+    markdown_dir.mkdir()
+    convert_to_mdankideck.write_single_deck(
+        convert_to_mdankideck.list_question_dirs(convert_to_mdankideck.QUESTIONS_DIR), markdown_dir
+    )
+    if not (os.path.exists(os.path.join(".venv", "bin", "mdankideck")) or shutil.which("mdankideck")):
+        raise ImportError("mdankideck is not installed")
+    if not convert_to_mdankideck.package_deck(markdown_dir, out_dir):
+        raise RuntimeError("mdankideck did not write medical_questions.apkg")
+    convert_to_mdankideck.normalize_package(Path(out_dir) / "medical_questions.apkg")
+
+
+def _build_md2anki_markdown(out_dir):
+    import generate_anki_with_md2anki
+    generate_anki_with_md2anki.generate_markdown(Path(out_dir))
+
+
+def _build_anki_deck_markdown(out_dir):
+    import generate_anki_deck
+    generate_anki_deck.emit_deck(out_dir)
+
+
+def _build_html(out_dir):
+    import to_html
+    to_html.export_bundles(to_html.NORMALIZED_DIR, out_dir)
+
+
+def _build_columnar(out_dir):
+    import to_columnar
+    formats = ["jsonl", "parquet", "arrow"] if to_columnar.has_pyarrow() else ["jsonl"]
+    to_columnar.export_columnar(to_columnar.QUESTIONS_DIR, out_dir, formats)
+
+
+def _build_sheet(out_dir):
+    import to_sheets
+    to_sheets.export_sheet(to_sheets.QUESTIONS_DIR, Path(out_dir) / "questions_sheet.xlsx")
+
+
+# Exporters that can be built into an arbitrary output directory
+CHECK_STAGES = {
+    "deck": _build_deck_markdown,
+    "apkg": _build_deck_package,
+    "md2anki": _build_md2anki_markdown,
+    "anki-deck": _build_anki_deck_markdown,
+    "mdbook": _build_mdbook,
+    "mkdoc": _build_mkdoc,
+    "mkdocs": _build_mkdocs,
+    "html": _build_html,
+    "sheet": _build_sheet,
+    "columnar": _build_columnar,
+}
+
+
+def check_stage(name, build):
+    """Build a stage twice into fresh directories and compare the outputs.
+
+    Returns None when both builds are identical, a list of differing paths
+    when they are not, and raises ImportError when a dependency is missing.
+    """
+    with tempfile.TemporaryDirectory(prefix=f"repro_{name}_") as tmp:
+        digests = []
+        for run in ("a", "b"):
+            out_dir = os.path.join(tmp, run)
+            os.makedirs(out_dir)
+            with contextlib.redirect_stdout(io.StringIO()):
+                build(out_dir)
+            digests.append(tree_digest(out_dir))
+    first, second = digests
+    differing = sorted(p for p in set(first) | set(second) if first.get(p) != second.get(p))
+    return differing or None
+
+
+def run_check(stage_names):
+    """Check each stage for reproducibility and print a report."""
+    failures = 0
+    for name in stage_names:
+        try:
+            differing = check_stage(name, CHECK_STAGES[name])
+        except ImportError as e:
+            print(f"- {name}: skipped ({e})")
+            continue
+        except Exception as e:
+            failures += 1
+            print(f"✗ {name}: build failed ({type(e).__name__}: {e})")
+            continue
+        if differing:
+            failures += 1
+            print(f"✗ {name}: {len(differing)} file(s) differ between builds")
+            for path in differing[:20]:
+                print(f"    {path}")
+        else:
+            print(f"✓ {name}: byte-identical")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify that exporters produce byte-identical output")
+    parser.add_argument("--check", action="store_true", help="build each stage twice and compare the outputs")
+    parser.add_argument("stages", nargs="*", help=f"stages to check (default: all of {', '.join(sorted(CHECK_STAGES))})")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.stages if name not in CHECK_STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    if not args.check:
+        parser.print_help()
+        return 0
+    failures = run_check(args.stages or sorted(CHECK_STAGES))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Long-lived local server with the question bank kept in memory.
+常駐的本機預覽伺服器，題庫與渲染結果保留在記憶體中
+
+    python serve.py                  # http://127.0.0.1:8765/
+    python serve.py --port 9000
+
+Endpoints:
+
+    GET  /                      list of endpoints and questions (JSON)
+    GET  /questions             question numbers (JSON)
+    GET  /question/NNN          parsed question record (JSON)
+    GET  /card/NNN              Anki card markdown (convert_to_mdankideck)
+    GET  /chapter/NNN           mdBook chapter markdown (create_mdbook)
+    GET  /mkdocs/NNN            mkdoc page markdown (to_mkdoc)
+    GET  /status                cache statistics (JSON)
+    POST /export/STAGE          run a full export now, e.g. /export/mdbook (JSON result)
+
+Parsed questions and rendered previews are cached per question. Before a
+cached entry is used, the modification times of the question's files are
+compared with the ones it was built from, so edits are picked up on the
+next request without a restart. The server only listens on localhost,
+and exports are refused when the request's Host or Origin is not this
+server, so other web pages open in the browser cannot trigger them.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import instrumentation
+from media_utils import MediaPipeline
+from question_loader import list_question_dirs, load_question
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NORMALIZED_DIR = os.path.join(BASE_DIR, "normalized_questions")
+HOST = "127.0.0.1"
+PORT = 8765
+
+MARKDOWN_TYPE = "text/markdown; charset=utf-8"
+JSON_TYPE = "application/json; charset=utf-8"
+
+
+def question_signature(question_dir):
+    """(path, mtime, size) of every file of a question; changes whenever a file does."""
+    signature = []
+    for root, dirs, files in os.walk(question_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def render_card(question_dir):
+    import convert_to_mdankideck
+    return convert_to_mdankideck.create_anki_card(Path(question_dir), int(Path(question_dir).name))
+
+
+def render_chapter(question_dir, media=None):
+    import create_mdbook
+    _, questions = create_mdbook.read_normalized_questions(
+        os.path.dirname(str(question_dir)), media or MediaPipeline(), [str(question_dir)], track=False
+    )
+    if not questions:
+        return ""
+    return create_mdbook.chapter_for_question(os.path.join(create_mdbook.BOOK_DIR, "src"), questions[0])[1]
+
+
+def render_mkdocs(question_dir):
+    from to_mkdoc import MkdocConverter
+    return MkdocConverter(os.path.dirname(str(question_dir))).create_index_md(Path(question_dir))
+
+
+# Preview kind -> renderer(question dir)
+RENDERERS = {
+    "card": render_card,
+    "chapter": render_chapter,
+    "mkdocs": render_mkdocs,
+}
+
+
+class Corpus:
+    """Parsed questions and rendered previews, invalidated when files change."""
+
+    def __init__(self, normalized_dir=NORMALIZED_DIR):
+        self.normalized_dir = normalized_dir
+        self.entries = {}  # question name -> {"signature", "record", "renders": {kind: text}}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def question_names(self):
+        return [question_dir.name for question_dir in list_question_dirs(self.normalized_dir)]
+
+    def entry(self, name):
+        """Return the cache entry of a question, reloading it when its files changed."""
+        question_dir = os.path.join(self.normalized_dir, name)
+        if not os.path.isdir(question_dir):
+            with self.lock:
+                self.entries.pop(name, None)
+            raise KeyError(name)
+        signature = question_signature(question_dir)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry["signature"] != signature:
+                entry = {"signature": signature, "record": load_question(Path(question_dir)), "renders": {}}
+                self.entries[name] = entry
+            return entry
+
+    def record(self, name):
+        return self.entry(name)["record"]
+
+    def render(self, kind, name):
+        entry = self.entry(name)
+        renders = entry["renders"]
+        if kind in renders:
+            self.hits += 1
+            return renders[kind]
+        self.misses += 1
+        text = RENDERERS[kind](os.path.join(self.normalized_dir, name))
+        with self.lock:
+            renders[kind] = text
+        return text
+
+    def warm(self):
+        """Load and render every question once."""
+        for name in self.question_names():
+            for kind in RENDERERS:
+                self.render(kind, name)
+
+    def status(self):
+        with self.lock:
+            renders = sum(len(entry["renders"]) for entry in self.entries.values())
+            return {"questions": len(self.entries), "renders": renders, "hits": self.hits, "misses": self.misses}
+
+
+class ExportRunner:
+    """Runs full exports one at a time."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def run(self, stage):
+        with self.lock:
+            start = time.perf_counter()
+            try:
+                instrumentation.STAGES[stage]()
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            return {"stage": stage, "ok": error is None, "error": error,
+                    "seconds": round(time.perf_counter() - start, 3)}
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    corpus = None
+    exporter = None
+
+    def send(self, status, body, content_type=JSON_TYPE):
+        if not isinstance(body, str):
+            body = json.dumps(body, ensure_ascii=False, indent=2, default=str)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def is_local_request(self):
+        """True when Host (and Origin, if sent) name this server on localhost."""
+        port = self.server.server_port
+        local = {f"{host}:{port}" for host in ("127.0.0.1", "localhost")}
+        if self.headers.get("Host") not in local:
+            return False
+        origin = self.headers.get("Origin")
+        return origin is None or origin in {f"http://{host}" for host in local}
+
+    def question_name(self, number):
+        return f"{int(number):03d}"
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        if path == "/":
+            self.send(200, {
+                "endpoints": ["/questions", "/question/NNN", "/card/NNN", "/chapter/NNN", "/mkdocs/NNN",
+                              "/status", "POST /export/STAGE"],
+                "stages": list(instrumentation.STAGES),
+                "questions": self.corpus.question_names(),
+            })
+            return
+        if path == "/questions":
+            self.send(200, self.corpus.question_names())
+            return
+        if path == "/status":
+            self.send(200, self.corpus.status())
+            return
+
+        match = re.fullmatch(r"/(question|card|chapter|mkdocs)/(\d+)", path)
+        if not match:
+            self.send(404, {"error": f"unknown path {path}"})
+            return
+        kind, number = match.groups()
+        try:
+            if kind == "question":
+                self.send(200, self.corpus.record(self.question_name(number)), JSON_TYPE)
+            else:
+                self.send(200, self.corpus.render(kind, self.question_name(number)), MARKDOWN_TYPE)
+        except KeyError:
+            self.send(404, {"error": f"question {number} does not exist"})
+        except Exception as e:
+            self.send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_POST(self):
+        if not self.is_local_request():
+            self.send(403, {"error": "exports can only be requested from this server"})
+            return
+        match = re.fullmatch(r"/export/([\w-]+)", self.path.rstrip("/"))
+        if not match or match.group(1) not in instrumentation.STAGES:
+            self.send(404, {"error": f"unknown export {self.path}", "stages": list(instrumentation.STAGES)})
+            return
+        result = self.exporter.run(match.group(1))
+        self.send(200 if result["ok"] else 500, result)
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+
+def serve(normalized_dir=NORMALIZED_DIR, host=HOST, port=PORT, warm=True, quiet=False):
+    corpus = Corpus(normalized_dir)
+    if warm:
+        start = time.perf_counter()
+        corpus.warm()
+        print(f"Loaded {corpus.status()['questions']} questions in {time.perf_counter() - start:.2f} s")
+
+    handler = type("Handler", (PreviewHandler,), {"corpus": corpus, "exporter": ExportRunner()})
+    if quiet:
+        handler.log_message = lambda self, format, *args: None
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving previews on http://{host}:{server.server_port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped")
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve question previews from an in-memory corpus")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (default: {PORT})")
+    parser.add_argument("--no-warm", action="store_true", help="load questions on first request instead of at startup")
+    parser.add_argument("--quiet", action="store_true", help="do not log requests")
+    args = parser.parse_args()
+
+    if not os.path.isdir(NORMALIZED_DIR):
+        print(f"Error: {NORMALIZED_DIR} does not exist!")
+        return 1
+    serve(NORMALIZED_DIR, HOST, args.port, warm=not args.no_warm, quiet=args.quiet)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Split the question bank into shards that can be exported independently.
+
+    python create_mdbook.py --shard 1/4      # one shard per process or machine
+    python create_mdbook.py --shard 2/4
+    ...
+    python merge_shards.py                   # combine shards/ into the final outputs
+
+A question belongs to shard i of n by a stable hash of its number, so
+every process and machine assigns questions the same way without
+coordinating, and adding questions does not move existing ones between
+shards. A sharded extraction writes only its own question folders in
+normalized_questions/. A sharded exporter reads only normalized_questions/
+and writes everything, including its media cache, under
+shards/shard-i-of-n/ with the same layout as the project root.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+from output_utils import write_if_changed
+from question_loader import load_question
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARDS_DIR = os.path.join(BASE_DIR, "shards")
+MANIFEST_NAME = "manifest.json"
+
+
+class Shard:
+    """Shard index of count (1-based), e.g. Shard(2, 4) for --shard 2/4."""
+
+    def __init__(self, index, count, shards_dir=SHARDS_DIR):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"invalid shard {index}/{count}")
+        self.index = index
+        self.count = count
+        self.dir = os.path.join(shards_dir, self.name)
+
+    @property
+    def name(self):
+        return f"shard-{self.index}-of-{self.count}"
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def __contains__(self, question_num):
+        return question_num is not None and shard_index(question_num, self.count) == self.index
+
+    def select(self, items, key=None):
+        """Return the items (question dirs, archives or numbers) that belong to this shard."""
+        key = key or question_number
+        return [item for item in items if key(item) in self]
+
+    def output_path(self, path, base_dir=BASE_DIR):
+        """Map an output path of an unsharded run to the same place in the shard directory."""
+        relative = os.path.relpath(path, base_dir) if os.path.isabs(path) else os.fspath(path)
+        mapped = os.path.normpath(os.path.join(self.dir, relative))
+        return Path(mapped) if isinstance(path, Path) else mapped
+
+
+def shard_index(question_num, count):
+    """Return the 1-based shard of a question number, the same on every machine."""
+    digest = hashlib.sha256(str(int(question_num)).encode("ascii")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def question_number(item):
+    """Question number of an int, a question folder (005) or an archive (5.zip), else None."""
+    if isinstance(item, int):
+        return item
+    match = re.match(r"\d+", os.path.basename(os.fspath(item)))
+    return int(match.group()) if match else None
+
+
+def parse_shard(value):
+    """argparse type for --shard i/n."""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", value)
+    try:
+        if not match:
+            raise ValueError
+        return Shard(int(match.group(1)), int(match.group(2)))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard {value!r}, expected i/n with 1 <= i <= n")
+
+
+def add_shard_argument(parser):
+    """Add --shard i/n to an argparse parser."""
+    parser.add_argument(
+        "--shard", type=parse_shard, metavar="I/N",
+        help="only process the questions of shard I of N; exporters write to shards/shard-I-of-N (see merge_shards.py)",
+    )
+    return parser
+
+
+def select_questions(question_dirs, shard):
+    """Restrict question_dirs to shard and record them in the shard's manifest.
+
+    Returns question_dirs unchanged when shard is None.
+    """
+    if shard is None:
+        return question_dirs
+    selected = shard.select(question_dirs)
+    write_manifest(shard, selected)
+    print(f"Shard {shard}: {len(selected)} of {len(question_dirs)} questions")
+    return selected
+
+
+def write_manifest(shard, question_dirs):
+    """Write the shard number and the records of its questions to the shard directory.
+
+    merge_shards.py builds the combined navigation and search index from
+    these records, so merging does not need the input directory.
+    """
+    os.makedirs(shard.dir, exist_ok=True)
+    records = [load_question(question_dir) for question_dir in question_dirs]
+    for record in records:
+        del record["path"]
+    manifest = {"index": shard.index, "count": shard.count, "questions": records}
+    write_if_changed(os.path.join(shard.dir, MANIFEST_NAME),
+                     json.dumps(manifest, ensure_ascii=False, indent=1) + "\n")
+
+
+def read_manifest(shard_dir):
+    """Return the manifest of a shard directory, or None if it has none."""
+    try:
+        with open(os.path.join(shard_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def list_shards(shards_dir=SHARDS_DIR):
+    """Return the Shards found in shards_dir, sorted by count and index."""
+    shards = []
+    if os.path.isdir(shards_dir):
+        for name in os.listdir(shards_dir):
+            match = re.fullmatch(r"shard-(\d+)-of-(\d+)", name)
+            if match and os.path.isdir(os.path.join(shards_dir, name)):
+                shards.append(Shard(int(match.group(1)), int(match.group(2)), shards_dir))
+    shards.sort(key=lambda shard: (shard.count, shard.index))
+    return shards
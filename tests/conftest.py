@@ -0,0 +1,39 @@
+"""Shared fixtures: the scripts live in the project root, next to this directory."""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import progress  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def quiet_progress(tmp_path):
+    """Keep warnings out of the project's warnings.jsonl and off the terminal."""
+    reporter = progress.reporter
+    saved = (reporter.verbosity, reporter.log_file, reporter.warnings)
+    reporter.configure(verbosity=progress.QUIET, log_file=str(tmp_path / "warnings.jsonl"))
+    yield reporter
+    reporter.verbosity, reporter.log_file, reporter.warnings = saved
+
+
+def make_question(questions_dir, name, question="Question text", options="ABCDE", answer="A",
+                  explain="Explanation", figures=None):
+    """Create a normalized question folder; figures maps relative paths to bytes."""
+    question_dir = os.path.join(str(questions_dir), name)
+    os.makedirs(os.path.join(question_dir, "question_figures"), exist_ok=True)
+    os.makedirs(os.path.join(question_dir, "explain_figures"), exist_ok=True)
+    files = {"question.txt": question, "correct_answer.txt": answer, "explain.txt": explain}
+    for letter in "ABCDE":
+        files[f"option_{letter}.txt"] = f"Option {letter}" if letter in options else ""
+    for file_name, text in files.items():
+        with open(os.path.join(question_dir, file_name), "w", encoding="utf-8") as f:
+            f.write(text)
+    for relative, data in (figures or {}).items():
+        with open(os.path.join(question_dir, relative), "wb") as f:
+            f.write(data)
+    return question_dir
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+import build
+from build import Plan, load_state, question_hashes, save_state, tree_hash
+from conftest import make_question
+
+HASHES = {"001": "a", "002": "b"}
+
+
+@pytest.fixture
+def outputs(tmp_path, monkeypatch):
+    """Point build at tmp_path and create the outputs of the mdbook stage."""
+    monkeypatch.setattr(build, "BASE_DIR", str(tmp_path))
+    for path in build.STAGE_OUTPUTS["mdbook"]:
+        os.makedirs(os.path.dirname(str(tmp_path / path)), exist_ok=True)
+        (tmp_path / path).write_text("", encoding="utf-8")
+    return tmp_path
+
+
+def previous(config="config", hashes=HASHES):
+    return {"config": config, "questions": dict(hashes)}
+
+
+def test_plan_first_build_and_force(outputs):
+    assert Plan("mdbook", "config", HASHES, None).reason == "first build"
+    plan = Plan("mdbook", "config", HASHES, previous(), force=True)
+    assert plan.full and plan.reason == "forced"
+
+
+def test_plan_skips_unchanged_stage(outputs):
+    plan = Plan("mdbook", "config", HASHES, previous())
+    assert plan.up_to_date and not plan.full
+    assert plan.describe() == "mdbook: up to date"
+    assert plan.record() == previous()
+
+
+def test_plan_updates_changed_questions(outputs):
+    plan = Plan("mdbook", "config", {"001": "a", "002": "changed"}, previous())
+    assert not plan.full and not plan.up_to_date
+    assert plan.changed == ["002"]
+    assert plan.describe() == "mdbook: update 1 question(s) (002)"
+
+
+@pytest.mark.parametrize("config, hashes, reason", [
+    ("new config", HASHES, "scripts or options changed"),
+    ("config", {"001": "a"}, "questions added or removed"),
+    ("config", {**HASHES, "003": "c"}, "questions added or removed"),
+])
+def test_plan_rebuilds_stage(outputs, config, hashes, reason):
+    plan = Plan("mdbook", config, hashes, previous())
+    assert plan.full and plan.reason == reason
+
+
+def test_plan_rebuilds_when_outputs_are_missing(outputs):
+    os.remove(str(outputs / build.STAGE_OUTPUTS["mdbook"][1]))
+    assert Plan("mdbook", "config", HASHES, previous()).reason == "outputs missing"
+
+
+def test_plan_extract_only_extracts_new_questions(outputs):
+    plan = Plan("extract", "config", {**HASHES, "003": "c"}, previous())
+    assert not plan.full
+    assert plan.changed == ["003"]
+
+
+def test_question_hashes_change_with_their_question(tmp_path):
+    normalized_dir = str(tmp_path / "normalized")
+    for name in ("001", "002", "010"):
+        make_question(normalized_dir, name)
+    (tmp_path / "normalized" / "001" / ".DS_Store").write_bytes(b"ignored")
+    before = question_hashes(normalized_dir)
+    assert list(before) == ["001", "002", "010"]
+    assert before["001"] == tree_hash(os.path.join(normalized_dir, "002"))
+
+    (tmp_path / "normalized" / "002" / "explain.txt").write_text("A new explanation", encoding="utf-8")
+    (tmp_path / "normalized" / "010" / ".notes").write_text("ignored", encoding="utf-8")
+    after = question_hashes(normalized_dir)
+    assert [name for name in after if after[name] != before[name]] == ["002"]
+
+
+def test_state_round_trip(tmp_path):
+    state_file = str(tmp_path / ".build" / "state.json")
+    assert load_state(state_file) == {"version": build.STATE_VERSION, "stages": {}}
+    state = {"version": build.STATE_VERSION, "stages": {"mdbook": previous()}}
+    save_state(state, state_file)
+    assert load_state(state_file) == state
+
+    save_state({"version": build.STATE_VERSION + 1, "stages": {"mdbook": previous()}}, state_file)
+    assert load_state(state_file)["stages"] == {}
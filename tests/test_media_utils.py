@@ -0,0 +1,84 @@
+import os
+import shutil
+
+from media_utils import HASH_PREFIX_LENGTH, MediaPipeline, MediaStore, SyncReport, file_sha256
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_media_store_stores_identical_figures_once(tmp_path):
+    first = write(tmp_path / "001" / "question_figures" / "figure.png", b"same image")
+    second = write(tmp_path / "002" / "explain_figures" / "other.PNG", b"same image")
+    third = write(tmp_path / "002" / "explain_figures" / "third.png", b"another image")
+    store = MediaStore(tmp_path / "media")
+
+    name = store.add(first)
+    assert store.add(second) == name
+    assert name == file_sha256(first)[:HASH_PREFIX_LENGTH] + ".png"
+    assert store.add(third) != name
+
+    assert sorted(os.listdir(store.media_dir)) == sorted(store.names.values())
+    assert (store.files_stored, store.duplicates, store.bytes_saved) == (2, 1, len(b"same image"))
+
+
+def test_media_store_prune_removes_files_of_earlier_runs(tmp_path):
+    figure = write(tmp_path / "figure.png", b"kept")
+    stale = write(tmp_path / "media" / "0123456789abcdef.png", b"from an earlier run")
+    store = MediaStore(tmp_path / "media")
+    name = store.add(figure)
+
+    assert store.prune() == 1
+    assert os.listdir(store.media_dir) == [name]
+    assert not os.path.exists(stale)
+    assert "1 stale files removed" in store.summary()
+
+
+def test_sync_dir_places_only_changes_and_prunes(tmp_path):
+    a = write(tmp_path / "src" / "a.png", b"aaaa")
+    b = write(tmp_path / "src" / "b.png", b"bbbb")
+    dst = tmp_path / "out" / "figures"
+    media = MediaPipeline()
+
+    report = media.sync_dir([a, b], dst, SyncReport())
+    assert (report.created, report.unchanged) == (2, 0)
+    assert sorted(os.listdir(dst)) == ["a.png", "b.png"]
+
+    report = media.sync_dir([a, b], dst, SyncReport())
+    assert (report.created, report.updated, report.unchanged, report.changed) == (0, 0, 2, 0)
+
+    write(a, b"AAAA")
+    os.utime(a, ns=(2_000_000_000, 2_000_000_000))
+    write(dst / "stray.png", b"not a figure")
+    report = media.sync_dir([a, b], dst, SyncReport())
+    assert (report.updated, report.unchanged, report.removed) == (1, 1, 1)
+    assert (dst / "a.png").read_bytes() == b"AAAA"
+    assert sorted(os.listdir(dst)) == ["a.png", "b.png"]
+
+    report = media.sync_dir([], dst, SyncReport())
+    assert report.removed == 2
+    assert not dst.exists()
+
+
+def test_sync_dir_without_prune_keeps_other_files(tmp_path):
+    a = write(tmp_path / "src" / "a.png", b"aaaa")
+    other = write(tmp_path / "out" / "other.png", b"other")
+    report = MediaPipeline().sync_dir([a], tmp_path / "out", SyncReport(), prune=False)
+    assert (report.created, report.removed) == (1, 0)
+    assert os.path.exists(other)
+
+
+def test_is_up_to_date_in_symlink_mode_accepts_fallback_copy(tmp_path):
+    src = write(tmp_path / "a.png", b"aaaa")
+    copy = tmp_path / "copy.png"
+    shutil.copy2(src, copy)
+    link = tmp_path / "link.png"
+    os.symlink(src, link)
+
+    assert MediaPipeline(mode="symlink").is_up_to_date(src, copy)
+    assert MediaPipeline(mode="symlink").is_up_to_date(src, link)
+    assert not MediaPipeline(mode="copy").is_up_to_date(src, link)
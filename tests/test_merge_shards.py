@@ -0,0 +1,116 @@
+import json
+import os
+import sqlite3
+import zipfile
+
+import pytest
+
+import merge_shards
+import sharding
+from conftest import make_question
+from merge_shards import complete_shards, merge_packages
+
+MODELS = {"100": {"id": 100, "name": "Basic"}}
+
+
+def make_apkg(path, deck_id, notes, media=None):
+    """Write a minimal .apkg; notes is a list of (note id, guid, question number)."""
+    collection = path.parent / f"{path.stem}.anki2"
+    conn = sqlite3.connect(str(collection))
+    conn.execute("CREATE TABLE col (id integer primary key, models text, decks text)")
+    conn.execute("CREATE TABLE notes (id integer primary key, guid text, mid integer, mod integer, usn integer,"
+                 " tags text, flds text, sfld text, csum integer, flags integer, data text)")
+    conn.execute("CREATE TABLE cards (id integer primary key, nid integer, did integer, ord integer, mod integer,"
+                 " usn integer, type integer, queue integer, due integer, ivl integer, factor integer,"
+                 " reps integer, lapses integer, left integer, odue integer, odid integer, flags integer,"
+                 " data text)")
+    decks = {str(deck_id): {"id": deck_id, "name": "Medical Questions"}}
+    conn.execute("INSERT INTO col VALUES (1, ?, ?)", (json.dumps(MODELS), json.dumps(decks)))
+    for note_id, guid, number in notes:
+        front = f"<h2>{number:03d}</h2> question"
+        conn.execute("INSERT INTO notes VALUES (?, ?, 100, 0, -1, '', ?, ?, 0, 0, '')",
+                     (note_id, guid, front + "\x1fback", front))
+        conn.execute("INSERT INTO cards VALUES (?, ?, ?, 0, 0, -1, 0, 0, ?, 0, 0, 0, 0, 0, 0, 0, 0, '')",
+                     (note_id + 1000, note_id, deck_id, number))
+    conn.commit()
+    conn.close()
+    media = media or {}
+    with zipfile.ZipFile(path, "w") as package:
+        package.write(collection, "collection.anki2")
+        package.writestr("media", json.dumps({str(i): name for i, name in enumerate(media)}))
+        for i, data in enumerate(media.values()):
+            package.writestr(str(i), data)
+    return path
+
+
+def read_apkg(path, work_dir):
+    with zipfile.ZipFile(path) as package:
+        package.extract("collection.anki2", work_dir)
+        media = json.loads(package.read("media"))
+    conn = sqlite3.connect(str(work_dir / "collection.anki2"))
+    try:
+        notes = conn.execute("SELECT id, guid, sfld FROM notes ORDER BY id").fetchall()
+        cards = conn.execute("SELECT id, nid, did FROM cards ORDER BY id").fetchall()
+        decks = json.loads(conn.execute("SELECT decks FROM col").fetchone()[0])
+    finally:
+        conn.close()
+    return notes, cards, decks, sorted(media.values())
+
+
+def test_merge_packages_orders_and_deduplicates_notes(tmp_path):
+    first = make_apkg(tmp_path / "shard1.apkg", 10, [(50, "g5", 5), (60, "g2", 2)], {"a.png": b"a"})
+    # The second shard has its own deck id for the same deck and repeats note g5
+    second = make_apkg(tmp_path / "shard2.apkg", 20, [(30, "g3", 3), (40, "g1", 1), (70, "g5", 5)],
+                       {"b.png": b"b", "a.png": b"a"})
+    output = tmp_path / "merged" / "deck.apkg"
+
+    assert merge_packages([first, second], output) == 4
+
+    notes, cards, decks, media = read_apkg(output, tmp_path)
+    assert [guid for _, guid, _ in notes] == ["g1", "g2", "g3", "g5"]
+    assert [note_id for note_id, _, _ in notes] == [30, 31, 32, 33]
+    assert [nid for _, nid, _ in cards] == [30, 31, 32, 33]
+    assert {did for _, _, did in cards} == {10}
+    assert list(decks) == ["10"]
+    assert media == ["a.png", "b.png"]
+
+
+def test_merge_packages_is_reproducible(tmp_path):
+    apkg = make_apkg(tmp_path / "shard.apkg", 10, [(1, "g1", 1)])
+    merge_packages([apkg], tmp_path / "one.apkg")
+    merge_packages([apkg], tmp_path / "two.apkg")
+    assert (tmp_path / "one.apkg").read_bytes() == (tmp_path / "two.apkg").read_bytes()
+
+
+def test_complete_shards_requires_one_full_run(tmp_path):
+    shards_dir = str(tmp_path / "shards")
+    with pytest.raises(ValueError):
+        complete_shards(shards_dir)
+    os.makedirs(os.path.join(shards_dir, "shard-1-of-2"))
+    with pytest.raises(ValueError, match="missing shard"):
+        complete_shards(shards_dir)
+    os.makedirs(os.path.join(shards_dir, "shard-2-of-2"))
+    assert [str(shard) for shard in complete_shards(shards_dir)] == ["1/2", "2/2"]
+    os.makedirs(os.path.join(shards_dir, "shard-1-of-3"))
+    with pytest.raises(ValueError, match="different runs"):
+        complete_shards(shards_dir)
+
+
+def test_merge_mkdocs_site_removes_questions_in_no_shard(tmp_path, monkeypatch):
+    monkeypatch.setattr(merge_shards, "BASE_DIR", str(tmp_path))
+    question_dirs = [make_question(tmp_path / "normalized", f"{num:03d}") for num in range(1, 5)]
+    shards = [sharding.Shard(i, 2, str(tmp_path / "shards")) for i in (1, 2)]
+    for shard in shards:
+        for question_dir in sharding.select_questions(question_dirs, shard):
+            page = shard.output_path(os.path.join(str(tmp_path), "mkdocs", os.path.basename(question_dir)),
+                                     str(tmp_path))
+            os.makedirs(page)
+            with open(os.path.join(page, "index.md"), "w", encoding="utf-8") as f:
+                f.write("# Question\n")
+    stale = tmp_path / "mkdocs" / "999"
+    stale.mkdir(parents=True)
+    (stale / "index.md").write_text("# Removed upstream\n", encoding="utf-8")
+
+    records = merge_shards.merged_records(shards)
+    assert merge_shards.merge_mkdocs_site(shards, records, "mkdocs", 50)
+    assert sorted(name for name in os.listdir(tmp_path / "mkdocs") if name.isdigit()) == ["001", "002", "003", "004"]
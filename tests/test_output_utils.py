@@ -0,0 +1,30 @@
+import os
+
+from output_utils import CREATED, UNCHANGED, UPDATED, WriteReport, write_if_changed
+
+
+def test_write_if_changed_statuses(tmp_path):
+    path = tmp_path / "out.md"
+    assert write_if_changed(path, "one") == CREATED
+    assert write_if_changed(path, "one") == UNCHANGED
+    assert write_if_changed(path, "two") == UPDATED
+    assert path.read_text(encoding="utf-8") == "two"
+    assert os.listdir(tmp_path) == ["out.md"]
+
+
+def test_unchanged_file_keeps_mtime(tmp_path):
+    path = tmp_path / "out.md"
+    write_if_changed(path, "題目")
+    os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+    assert write_if_changed(path, "題目") == UNCHANGED
+    assert path.stat().st_mtime_ns == 1_000_000_000
+
+
+def test_write_report_counts():
+    report = WriteReport("pages")
+    for status in (CREATED, CREATED, UPDATED, UNCHANGED):
+        assert report.record(status) == status
+    report.removed += 1
+    assert (report.created, report.updated, report.unchanged, report.removed) == (2, 1, 1, 1)
+    assert report.changed == 4
+    assert report.summary() == "2 created, 1 updated, 1 unchanged, 1 removed pages"
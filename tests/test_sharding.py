@@ -0,0 +1,54 @@
+import argparse
+import os
+
+import pytest
+
+import sharding
+from sharding import Shard, parse_shard, question_number, shard_index
+
+
+def test_shards_partition_the_questions():
+    numbers = range(1, 501)
+    shards = [Shard(i, 4) for i in range(1, 5)]
+    selected = [shard.select(numbers) for shard in shards]
+    assert sorted(num for part in selected for num in part) == list(numbers)
+    # A hash spreads the questions over every shard
+    assert all(len(part) > 50 for part in selected)
+
+
+def test_shard_assignment_is_stable():
+    # The same on every machine and run, so the values are pinned
+    assert [shard_index(num, 4) for num in range(1, 9)] == [2, 3, 4, 3, 4, 4, 3, 4]
+    # Adding questions does not move existing ones
+    before = {num: shard_index(num, 3) for num in range(1, 121)}
+    after = {num: shard_index(num, 3) for num in range(1, 241)}
+    assert all(after[num] == shard for num, shard in before.items())
+
+
+def test_select_accepts_folders_and_archives(tmp_path):
+    shard = Shard(1, 2)
+    items = [str(tmp_path / f"{num:03d}") for num in range(1, 21)] + ["7.zip", "notes"]
+    selected = shard.select(items)
+    assert "notes" not in selected
+    assert [question_number(item) for item in selected] == [
+        question_number(item) for item in items if question_number(item) in shard
+    ]
+    assert question_number("012 copy.rar") == 12
+
+
+def test_parse_shard():
+    shard = parse_shard(" 2 / 4 ")
+    assert (shard.index, shard.count, shard.name) == (2, 4, "shard-2-of-4")
+    for value in ("0/4", "5/4", "1/0", "2", "a/b"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(value)
+
+
+def test_output_path_and_list_shards(tmp_path):
+    shards_dir = str(tmp_path / "shards")
+    shard = Shard(2, 2, shards_dir)
+    assert shard.output_path(os.path.join(str(tmp_path), "mdbook", "src"), str(tmp_path)) == \
+        os.path.join(shards_dir, "shard-2-of-2", "mdbook", "src")
+    for name in ("shard-2-of-2", "shard-1-of-2", "not-a-shard"):
+        os.makedirs(os.path.join(shards_dir, name))
+    assert [str(shard) for shard in sharding.list_shards(shards_dir)] == ["1/2", "2/2"]
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+pytest.importorskip("pandas")
+openpyxl = pytest.importorskip("openpyxl")
+
+from conftest import make_question  # noqa: E402
+from from_sheets import import_sheet  # noqa: E402
+from to_sheets import COLUMNS, clean_batch, export_sheet, process_question_folder  # noqa: E402
+
+
+@pytest.fixture
+def questions_dir(tmp_path):
+    questions_dir = tmp_path / "normalized"
+    make_question(questions_dir, "001", question="First line\n\nsecond line\x0b", options="ABCD")
+    make_question(questions_dir, "002", question="病人接受化學治療", explain="Because\n\n\nit is")
+    make_question(questions_dir, "010", answer="C")
+    (questions_dir / "notes").mkdir()
+    return questions_dir
+
+
+def read_rows(sheet):
+    workbook = openpyxl.load_workbook(sheet, read_only=True)
+    try:
+        rows = list(workbook["Questions"].iter_rows(values_only=True))
+    finally:
+        workbook.close()
+    return rows
+
+
+def test_clean_batch_matches_process_question_folder(questions_dir):
+    folders = sorted(path for path in questions_dir.iterdir() if path.name.isdigit())
+    batch = clean_batch(folders)
+    assert batch[COLUMNS].to_dict("records") == [process_question_folder(folder) for folder in folders]
+
+
+def test_export_sheet_is_reproducible(questions_dir, tmp_path):
+    first, second = tmp_path / "first.xlsx", tmp_path / "second.xlsx"
+    assert export_sheet(questions_dir, first) == 3
+    os.utime(questions_dir / "001" / "question.txt", ns=(1_000_000_000, 1_000_000_000))
+    assert export_sheet(questions_dir, second) == 3
+    assert first.read_bytes() == second.read_bytes()
+
+    rows = read_rows(first)
+    assert list(rows[0]) == COLUMNS
+    assert [row[0] for row in rows[1:]] == ["001", "002", "010"]
+
+
+def snapshot(questions_dir):
+    return {
+        os.path.relpath(os.path.join(root, name), questions_dir): os.stat(os.path.join(root, name)).st_mtime_ns
+        for root, _, files in os.walk(questions_dir) for name in files
+    }
+
+
+def test_unedited_sheet_changes_nothing(questions_dir, tmp_path):
+    sheet = tmp_path / "questions_sheet.xlsx"
+    export_sheet(questions_dir, sheet)
+    before = snapshot(questions_dir)
+    assert import_sheet(sheet, questions_dir) == {}
+    assert snapshot(questions_dir) == before
+
+
+def test_round_trip_rewrites_only_edited_files(questions_dir, tmp_path, quiet_progress):
+    sheet = tmp_path / "questions_sheet.xlsx"
+    export_sheet(questions_dir, sheet)
+    before = snapshot(questions_dir)
+
+    workbook = openpyxl.load_workbook(sheet)
+    worksheet = workbook["Questions"]
+    header = [cell.value for cell in worksheet[1]]
+    rows = {row[0].value: row for row in worksheet.iter_rows(min_row=2)}
+    rows["002"][header.index("explain")].value = "Edited explanation"
+    # Excel turns the folder name "010" into the number 10
+    rows["010"][header.index("folder_name")].value = 10
+    rows["010"][header.index("optionB")].value = "Edited option"
+    worksheet.append(["../x"] + ["outside"] * (len(header) - 1))
+    worksheet.append([None] + ["no folder"] * (len(header) - 1))
+    workbook.save(sheet)
+
+    changes = import_sheet(sheet, questions_dir)
+
+    assert changes == {"002": ["explain.txt"], "010": ["option_B.txt"]}
+    assert (questions_dir / "002" / "explain.txt").read_text(encoding="utf-8") == "Edited explanation"
+    assert (questions_dir / "010" / "option_B.txt").read_text(encoding="utf-8") == "Edited option"
+    assert not (tmp_path / "x").exists()
+    assert quiet_progress.warnings == 2
+    after = snapshot(questions_dir)
+    assert sorted(path for path in after if after[path] != before[path]) == [
+        os.path.join("002", "explain.txt"), os.path.join("010", "option_B.txt"),
+    ]
+
+
+def test_dry_run_writes_nothing(questions_dir, tmp_path):
+    sheet = tmp_path / "questions_sheet.xlsx"
+    export_sheet(questions_dir, sheet)
+    workbook = openpyxl.load_workbook(sheet)
+    workbook["Questions"]["B2"] = "Edited first line"
+    workbook.save(sheet)
+    before = snapshot(questions_dir)
+    assert import_sheet(sheet, questions_dir, dry_run=True) == {"001": ["question.txt"]}
+    assert snapshot(questions_dir) == before
@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from to_sheets import clean_text
+
+
+def reference_clean(content):
+    """The cleaning to_sheets.read_text_file used to do, one character at a time."""
+    content = content.strip()
+    content = "".join(char for char in content if char.isprintable() or char in "\n\t")
+    lines = [line for line in content.split("\n") if line.strip()]
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "  plain text  ",
+    "first line\n\n\nsecond\tline\n   \n",
+    "﻿病人接受化學治療　劑量 mg/m²\r\n第二行\x0b",
+    "zero​width space\x01\x7f\x85 and \U000e0001 tag",
+    "\n\x0c\n  \n",
+    "emoji 🙂 and combining é stay",
+])
+def test_clean_text_matches_reference(text):
+    assert clean_text(text) == reference_clean(text)
+
+
+def test_clean_text_matches_reference_on_every_character():
+    chars = [chr(code) for code in range(0x3200)] + [chr(code) for code in range(0xFE00, 0x10000)
+                                                      if not 0xD800 <= code < 0xE000]
+    assert clean_text("x" + "".join(chars) + "x") == reference_clean("x" + "".join(chars) + "x")
+    rng = random.Random(0)
+    for _ in range(200):
+        text = "".join(rng.choice(chars + ["\n", " ", "a", "題"]) for _ in range(40))
+        assert clean_text(text) == reference_clean(text)
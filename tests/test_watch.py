@@ -0,0 +1,112 @@
+import os
+import shutil
+from pathlib import Path
+
+from conftest import make_question
+from watch import Watcher, changed_paths, question_names, scan
+
+
+class RecordingExporter:
+    name = "recording"
+
+    def __init__(self):
+        self.calls = []
+
+    def build(self, records):
+        self.calls.append(("build", [record["number"] for record in records]))
+
+    def update(self, question_dirs, records):
+        self.calls.append(("update", [Path(question_dir).name for question_dir in question_dirs]))
+
+
+class FailingExporter:
+    name = "failing"
+
+    def build(self, records):
+        raise RuntimeError("broken")
+
+    update = build
+
+
+def make_watcher(tmp_path, *exporters):
+    normalized_dir = str(tmp_path / "normalized")
+    for name in ("001", "002"):
+        make_question(normalized_dir, name)
+    watcher = Watcher(list(exporters), str(tmp_path / "zips"), normalized_dir)
+    watcher.build_all()
+    return watcher
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+def test_scan_maps_files_to_questions(tmp_path):
+    normalized_dir = str(tmp_path / "normalized")
+    make_question(normalized_dir, "001", figures={"question_figures/a.png": b"png"})
+    os.makedirs(os.path.join(normalized_dir, "004"))
+    os.makedirs(os.path.join(normalized_dir, "notes"))
+    before = scan(str(tmp_path / "zips"), normalized_dir)
+    assert question_names(before, normalized_dir) == {"001", "004"}
+
+    edited = write(os.path.join(normalized_dir, "001", "explain.txt"), "A longer explanation")
+    assert changed_paths(before, scan(str(tmp_path / "zips"), normalized_dir)) == [edited]
+
+
+def test_edit_updates_only_that_question(tmp_path):
+    exporter = RecordingExporter()
+    watcher = make_watcher(tmp_path, exporter)
+    assert exporter.calls == [("build", ["001", "002"])]
+
+    path = write(os.path.join(watcher.normalized_dir, "002", "explain.txt"), "Edited")
+    assert watcher.rebuild([path]) == {"002"}
+    assert exporter.calls[-1] == ("update", ["002"])
+    assert watcher.records["002"]["explanation"] == "Edited"
+
+
+def test_added_or_removed_question_rebuilds(tmp_path):
+    exporter = RecordingExporter()
+    watcher = make_watcher(tmp_path, exporter)
+
+    added = make_question(watcher.normalized_dir, "003")
+    assert watcher.rebuild([os.path.join(added, "question.txt")]) == {"003"}
+    assert exporter.calls[-1] == ("build", ["001", "002", "003"])
+
+    removed = os.path.join(watcher.normalized_dir, "001")
+    shutil.rmtree(removed)
+    assert watcher.rebuild([os.path.join(removed, "question.txt")]) == {"001"}
+    assert exporter.calls[-1] == ("build", ["002", "003"])
+
+
+def test_handle_changes_picks_up_edits(tmp_path):
+    exporter = RecordingExporter()
+    watcher = make_watcher(tmp_path, exporter)
+    write(os.path.join(watcher.normalized_dir, "001", "option_A.txt"), "Edited option")
+    write(os.path.join(watcher.normalized_dir, "002", "option_B.txt"), "Edited option")
+    watcher.handle_changes()
+    assert exporter.calls[-1] == ("update", ["001", "002"])
+
+    calls = len(exporter.calls)
+    watcher.handle_changes()
+    assert len(exporter.calls) == calls
+
+
+def test_other_files_are_ignored(tmp_path):
+    exporter = RecordingExporter()
+    watcher = make_watcher(tmp_path, exporter)
+    os.makedirs(watcher.zips_dir)
+    notes = write(os.path.join(watcher.zips_dir, "notes.txt"), "not an archive")
+    # A removed archive keeps its question folder
+    assert watcher.rebuild([notes, os.path.join(watcher.zips_dir, "005.zip")]) == set()
+    assert exporter.calls == [("build", ["001", "002"])]
+
+
+def test_failing_exporter_does_not_stop_the_others(tmp_path, quiet_progress):
+    exporter = RecordingExporter()
+    watcher = make_watcher(tmp_path, FailingExporter(), exporter)
+    path = write(os.path.join(watcher.normalized_dir, "001", "explain.txt"), "Edited")
+    watcher.rebuild([path])
+    assert exporter.calls[-1] == ("update", ["001"])
+    assert quiet_progress.warnings == 2
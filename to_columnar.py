@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Export normalized questions as JSON Lines, Parquet or Arrow files.
+
+The rows have the same columns as the Excel sheet (see to_sheets.py),
+plus the figure lists with their SHA-256 hashes and a content hash of the
+text fields. Questions are read and written in batches, each batch one
+Parquet row group / Arrow record batch, so memory use stays bounded.
+
+    python to_columnar.py                          # JSONL (+ Parquet with pyarrow)
+    python to_columnar.py --format jsonl parquet arrow --batch-size 2048
+
+Every format needs pandas, which to_sheets.clean_batch uses to clean the
+rows; Parquet and Arrow also need pyarrow (`uv pip install pyarrow`).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import progress
+import sharding
+from media_utils import file_sha256
+from question_loader import list_figures, list_question_dirs
+from to_sheets import BATCH_SIZE, COLUMNS, clean_batch
+
+BASE_DIR = Path(__file__).parent
+QUESTIONS_DIR = BASE_DIR / "normalized_questions"
+OUTPUT_DIR = BASE_DIR / "columnar"
+
+FORMATS = {"jsonl": "questions.jsonl", "parquet": "questions.parquet", "arrow": "questions.arrow"}
+
+FIGURE_COLUMNS = ["question_figures", "explain_figures"]
+ALL_COLUMNS = COLUMNS + FIGURE_COLUMNS + ["content_hash"]
+
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def content_hash(row):
+    """SHA-256 of the text columns of a row, stable across exports."""
+    fields = [row[column] for column in COLUMNS]
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def figure_entries(question_dir, figures):
+    """Return [{"name", "sha256"}] for the figures of one figure directory."""
+    figures_dir = os.path.join(question_dir, figures)
+    return [
+        {"name": name, "sha256": file_sha256(os.path.join(figures_dir, name))}
+        for name in list_figures(question_dir, figures)
+    ]
+
+
+def iter_batches(questions_dir, batch_size=BATCH_SIZE, shard=None):
+    """Yield lists of row dicts, batch_size questions at a time."""
+    question_dirs = sharding.select_questions(list_question_dirs(questions_dir), shard)
+    for start in range(0, len(question_dirs), batch_size):
+        folders = question_dirs[start:start + batch_size]
+        batch = clean_batch(folders)
+        rows = []
+        for folder, row in zip(folders, batch[COLUMNS].to_dict("records")):
+            for figures in FIGURE_COLUMNS:
+                row[figures] = figure_entries(folder, figures)
+            row["content_hash"] = content_hash(row)
+            rows.append(row)
+        yield rows
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    figure = pa.list_(pa.struct([("name", pa.string()), ("sha256", pa.string())]))
+    fields = [pa.field(column, pa.string()) for column in COLUMNS]
+    fields += [pa.field(column, figure) for column in FIGURE_COLUMNS]
+    fields.append(pa.field("content_hash", pa.string()))
+    return pa.schema(fields)
+
+
+class JsonlWriter:
+    """Writes rows as one JSON object per line."""
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Writes each batch of rows as one Parquet row group."""
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+
+        self.schema = arrow_schema()
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        import pyarrow as pa
+
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ArrowWriter:
+    """Writes each batch of rows as one record batch of an Arrow IPC file."""
+
+    def __init__(self, path):
+        import pyarrow as pa
+
+        self.schema = arrow_schema()
+        self.sink = pa.OSFile(str(path), "wb")
+        self.writer = pa.ipc.new_file(self.sink, self.schema)
+
+    def write(self, rows):
+        import pyarrow as pa
+
+        self.writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+
+
+WRITERS = {"jsonl": JsonlWriter, "parquet": ParquetWriter, "arrow": ArrowWriter}
+
+
+def export_columnar(questions_dir=QUESTIONS_DIR, output_dir=OUTPUT_DIR, formats=("jsonl",),
+                    batch_size=BATCH_SIZE, shard=None):
+    """Write every question under questions_dir (or only those of shard) in each of formats.
+
+    All formats are written in a single pass over the questions. Files
+    are written under a temporary name and moved into place when
+    complete. Returns the number of rows written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    writers = {}
+    total = 0
+    try:
+        for fmt in formats:
+            tmp_path = os.path.join(output_dir, f"{FORMATS[fmt]}.{os.getpid()}.tmp")
+            writers[fmt] = (WRITERS[fmt](tmp_path), tmp_path)
+
+        tracker = progress.start("columnar")
+        for rows in iter_batches(questions_dir, batch_size, shard):
+            for writer, _ in writers.values():
+                writer.write(rows)
+            total += len(rows)
+            tracker.update(len(rows))
+        tracker.finish()
+
+        for fmt, (writer, tmp_path) in writers.items():
+            writer.close()
+            os.replace(tmp_path, os.path.join(output_dir, FORMATS[fmt]))
+    except BaseException:
+        for writer, tmp_path in writers.values():
+            try:
+                writer.close()
+            except Exception:
+                pass
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+
+    for fmt in formats:
+        print(f"{fmt}: {os.path.join(output_dir, FORMATS[fmt])}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export normalized questions as JSONL, Parquet or Arrow")
+    parser.add_argument("--format", nargs="+", dest="formats", metavar="FORMAT",
+                        help=f"output formats: {', '.join(FORMATS)} (default: jsonl, plus parquet when pyarrow is installed)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"questions per batch / row group (default: {BATCH_SIZE})")
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR, help=f"output directory (default: {OUTPUT_DIR.name})")
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+
+    formats = args.formats or (["jsonl", "parquet"] if has_pyarrow() else ["jsonl"])
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(unknown)}")
+    if any(fmt in ("parquet", "arrow") for fmt in formats) and not has_pyarrow():
+        parser.error("parquet and arrow output need pyarrow (uv pip install pyarrow)")
+
+    if not QUESTIONS_DIR.exists():
+        print(f"Error: {QUESTIONS_DIR} does not exist!")
+        return
+    output_dir = args.shard.output_path(args.output_dir) if args.shard else args.output_dir
+    total = export_columnar(QUESTIONS_DIR, output_dir, formats, args.batch_size, args.shard)
+    print(f"Total questions exported: {total}")
+
+
+if __name__ == "__main__":
+    main()
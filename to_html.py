@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Export normalized_questions as single-file offline HTML bundles.
+把 normalized_questions 匯出為可離線閱讀的單一 HTML 檔案
+
+Each bundle is one self-contained file: figures are embedded as base64
+blobs (stored once per distinct image), and every question is kept in an
+inert <template> until it scrolls near the viewport, so the page opens
+quickly even with hundreds of figures.
+
+    python to_html.py                        # html_bundle/questions.html
+    python to_html.py --chunk-size 200       # one file per 200 questions
+    python to_html.py --optimize-images --max-dimension 1200
+"""
+
+import argparse
+import base64
+import html
+import os
+
+import progress
+import sharding
+from media_utils import (MediaPipeline, add_media_arguments, file_sha256, format_bytes, image_size,
+                         iter_figure_paths, media_from_args)
+from output_utils import WriteReport, write_if_changed
+from question_loader import OPTION_LETTERS, list_question_dirs, load_question
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NORMALIZED_DIR = os.path.join(BASE_DIR, "normalized_questions")
+HTML_DIR = os.path.join(BASE_DIR, "html_bundle")
+BUNDLE_TITLE = "Medical Questions"
+
+MIME_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+}
+
+STYLE = """\
+body { font-family: -apple-system, "Segoe UI", "Noto Sans TC", sans-serif; max-width: 860px;
+       margin: 0 auto; padding: 0 16px 64px; line-height: 1.6; color: #222; }
+header { position: sticky; top: 0; background: #fff; padding: 8px 0; border-bottom: 1px solid #ddd; }
+header select { font-size: 1em; }
+section.question { border-bottom: 1px solid #eee; padding: 16px 0; min-height: 320px; }
+section.question.loaded { min-height: 0; }
+.text { white-space: pre-wrap; }
+.options p { margin: 4px 0 4px 16px; }
+details { margin-top: 12px; }
+summary { cursor: pointer; color: #0066cc; }
+.correct-answer { font-weight: bold; color: #009900; }
+figure { margin: 12px 0; }
+figure img { max-width: 100%; height: auto; }
+figcaption { font-size: 0.85em; color: #666; }
+"""
+
+# Renders a question's template when its section comes near the viewport,
+# and decodes figure blobs into data URIs only at that point
+SCRIPT = """\
+(function () {
+  function blobURL(id) {
+    var blob = document.getElementById("blob-" + id);
+    return "data:" + blob.getAttribute("data-mime") + ";base64," + blob.textContent.trim();
+  }
+
+  function render(section) {
+    if (section.classList.contains("loaded")) return;
+    var template = document.getElementById("t-" + section.id);
+    section.appendChild(template.content.cloneNode(true));
+    section.querySelectorAll("img[data-blob]").forEach(function (img) {
+      img.src = blobURL(img.getAttribute("data-blob"));
+      img.removeAttribute("data-blob");
+    });
+    section.classList.add("loaded");
+  }
+
+  var sections = document.querySelectorAll("section.question");
+  if ("IntersectionObserver" in window) {
+    var observer = new IntersectionObserver(function (entries) {
+      entries.forEach(function (entry) {
+        if (entry.isIntersecting) {
+          render(entry.target);
+          observer.unobserve(entry.target);
+        }
+      });
+    }, { rootMargin: "800px 0px" });
+    sections.forEach(function (section) { observer.observe(section); });
+  } else {
+    sections.forEach(render);
+  }
+
+  var jump = document.getElementById("jump");
+  jump.addEventListener("change", function () {
+    var section = document.getElementById(jump.value);
+    render(section);
+    section.scrollIntoView();
+  });
+})();
+"""
+
+
+class BlobStore:
+    """Figures of one bundle, embedded once per distinct content."""
+
+    def __init__(self, media):
+        self.media = media
+        self.blobs = {}  # blob id -> (mime type, file path)
+
+    def add(self, src_path):
+        """Register a figure and return its blob id."""
+        source = self.media.source_for(src_path)
+        blob_id = file_sha256(source)[:16]
+        if blob_id not in self.blobs:
+            ext = os.path.splitext(source)[1].lower()
+            self.blobs[blob_id] = (MIME_TYPES.get(ext, "application/octet-stream"), source)
+        return blob_id
+
+    def render(self):
+        """Return the <script> elements holding the base64 data of every figure."""
+        parts = []
+        for blob_id, (mime, path) in self.blobs.items():
+            with open(path, "rb") as f:
+                data = base64.b64encode(f.read()).decode("ascii")
+            parts.append(f'<script type="text/plain" id="blob-{blob_id}" data-mime="{mime}">{data}</script>')
+        return "\n".join(parts)
+
+
+def render_figures(record, figures, blobs):
+    """Return the <figure> elements of one figure directory of a question."""
+    parts = []
+    for name in record[figures]:
+        src_path = os.path.join(record["path"], figures, name)
+        blob_id = blobs.add(src_path)
+        size = image_size(blobs.media.source_for(src_path))
+        dimensions = f' width="{size[0]}" height="{size[1]}"' if size else ""
+        parts.append(
+            f'<figure><img data-blob="{blob_id}"{dimensions} alt="{html.escape(name)}">'
+            f"<figcaption>{html.escape(name)}</figcaption></figure>"
+        )
+    return "\n".join(parts)
+
+
+def render_question(record, blobs):
+    """Return the <section> placeholder and the <template> of one question."""
+    number = record["number"]
+    options = "\n".join(
+        f"<p><strong>{letter}.</strong> {html.escape(record['options'][letter])}</p>"
+        for letter in OPTION_LETTERS if record["options"][letter]
+    )
+    explanation = ""
+    if record["explanation"]:
+        explanation = f'<h4>Explanation</h4>\n<div class="text">{html.escape(record["explanation"])}</div>'
+
+    body = f"""<h2>Question {number}</h2>
+<div class="text">{html.escape(record["question"])}</div>
+{render_figures(record, "question_figures", blobs)}
+<div class="options">
+{options}
+</div>
+<details>
+<summary>Show answer</summary>
+<p class="correct-answer">Correct Answer: {html.escape(record["correct_answer"] or "?")}</p>
+{explanation}
+{render_figures(record, "explain_figures", blobs)}
+</details>"""
+    return (
+        f'<section class="question" id="q-{number}"></section>\n'
+        f'<template id="t-q-{number}">\n{body}\n</template>'
+    )
+
+
+def render_bundle(title, records, media):
+    """Return the complete HTML of one bundle."""
+    blobs = BlobStore(media)
+    questions = "\n".join(render_question(record, blobs) for record in records)
+    jump_options = "\n".join(
+        f'<option value="q-{record["number"]}">Question {record["number"]}</option>' for record in records
+    )
+    return f"""<!DOCTYPE html>
+<html lang="zh-Hant">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{html.escape(title)}</title>
+<style>
+{STYLE}</style>
+</head>
+<body>
+<header>
+<strong>{html.escape(title)}</strong>
+<select id="jump" aria-label="Jump to question">
+{jump_options}
+</select>
+</header>
+<main>
+{questions}
+</main>
+{blobs.render()}
+<script>
+{SCRIPT}</script>
+</body>
+</html>
+"""
+
+
+def write_bundle(output_path, title, question_dirs, media=None):
+    """Write one bundle for question_dirs. Returns (path, write status, size)."""
+    media = media or MediaPipeline()
+    records = [load_question(question_dir) for question_dir in question_dirs]
+    content = render_bundle(title, records, media)
+    status = write_if_changed(output_path, content)
+    return output_path, status, os.path.getsize(output_path)
+
+
+def export_bundles(normalized_dir=NORMALIZED_DIR, output_dir=HTML_DIR, media=None,
+                   chunk_size=None, title=BUNDLE_TITLE, workers=None, shard=None):
+    """Write one bundle for the whole bank (or shard), or one per chunk_size questions.
+
+    Bundles are written on a process pool, and bundles of question ranges
+    that no longer exist are removed. Returns a WriteReport.
+    """
+    media = media or MediaPipeline()
+    question_dirs = sharding.select_questions(list_question_dirs(normalized_dir), shard)
+    os.makedirs(output_dir, exist_ok=True)
+    media.warm(iter_figure_paths(question_dirs))
+
+    if chunk_size:
+        chunks = [question_dirs[i:i + chunk_size] for i in range(0, len(question_dirs), chunk_size)]
+        jobs = [
+            (os.path.join(output_dir, f"questions_{chunk[0].name}-{chunk[-1].name}.html"),
+             f"{title} {chunk[0].name}–{chunk[-1].name}", chunk)
+            for chunk in chunks
+        ]
+    else:
+        jobs = [(os.path.join(output_dir, "questions.html"), title, question_dirs)]
+
+    report = WriteReport("bundles")
+    if len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(write_bundle, path, name, dirs, media) for path, name, dirs in jobs]
+            results = [future.result() for future in progress.track(futures, "html")]
+    else:
+        results = [write_bundle(path, name, dirs, media) for path, name, dirs in progress.track(jobs, "html")]
+
+    for path, status, size in results:
+        report.record(status)
+        progress.item(f"{os.path.basename(path)}: {status} ({format_bytes(size)})")
+
+    # Remove bundles of question ranges that no longer exist
+    current = {os.path.basename(path) for path, _, _ in jobs}
+    for name in sorted(os.listdir(output_dir)):
+        if name.startswith("questions") and name.endswith(".html") and name not in current:
+            os.remove(os.path.join(output_dir, name))
+            report.removed += 1
+
+    print(f"Bundles: {report.summary()} in {output_dir}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export normalized questions as single-file offline HTML")
+    parser.add_argument("--chunk-size", type=int, help="questions per HTML file (default: one file for the whole bank)")
+    parser.add_argument("--title", default=BUNDLE_TITLE, help=f"page title (default: {BUNDLE_TITLE})")
+    parser.add_argument("--workers", type=int, help="number of processes writing bundles in parallel")
+    # Figures are embedded as base64: nothing is placed, synced or thumbnailed
+    add_media_arguments(parser, placement=False, sync=False, thumbnails=False)
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+
+    output_dir = args.shard.output_path(HTML_DIR) if args.shard else HTML_DIR
+    export_bundles(NORMALIZED_DIR, output_dir, media_from_args(args), args.chunk_size, args.title, args.workers,
+                   args.shard)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,29 @@ Convert normalized_questions to mkdoc format
 轉換 normalized_questions 到 mkdoc 格式
 """
 
+import argparse
 import os
 import shutil
 from pathlib import Path
 from typing import Dict, List, Optional
 
+import instrumentation
+import progress
+import sharding
+from media_utils import MediaPipeline, SyncReport, add_media_arguments, iter_figure_paths, media_from_args
+from mkdocs_index import SEARCH_SHARD_SIZE, write_mkdocs_site
+from question_loader import load_question
+
 class MkdocConverter:
-    def __init__(self, source_dir: str = "normalized_questions", target_dir: str = "mkdoc"):
+    def __init__(self, source_dir: str = "normalized_questions", target_dir: str = "mkdoc",
+                 media: Optional[MediaPipeline] = None, search_shard_size: int = SEARCH_SHARD_SIZE,
+                 shard: Optional[sharding.Shard] = None):
         self.source_dir = Path(source_dir)
         self.target_dir = Path(target_dir)
+        self.media = media or MediaPipeline()
+        self.search_shard_size = search_shard_size
+        self.shard = shard
+        self.sync_report = SyncReport()
         
     def read_file_content(self, file_path: Path) -> str:
         """讀取文件內容"""
@@ -22,7 +36,7 @@ class MkdocConverter:
         except FileNotFoundError:
             return ""
         except Exception as e:
-            print(f"Warning: Error reading {file_path}: {e}")
+            progress.warn(f"Warning: Error reading {file_path}: {e}")
             return ""
     
     def create_index_md(self, question_dir: Path) -> str:
@@ -100,24 +114,15 @@ class MkdocConverter:
         return content
     
     def copy_figures(self, source_question_dir: Path, target_question_dir: Path):
-        """複製圖片文件"""
-        # 複製 question_figures
-        source_q_fig = source_question_dir / "question_figures"
-        target_figures = target_question_dir / "figures"
-        
-        if source_q_fig.exists() and any(source_q_fig.iterdir()):
-            target_figures.mkdir(parents=True, exist_ok=True)
-            for fig_file in source_q_fig.iterdir():
-                if fig_file.is_file():
-                    shutil.copy2(fig_file, target_figures / fig_file.name)
-        
-        # 複製 explain_figures
-        source_e_fig = source_question_dir / "explain_figures"
-        if source_e_fig.exists() and any(source_e_fig.iterdir()):
-            target_figures.mkdir(parents=True, exist_ok=True)
-            for fig_file in source_e_fig.iterdir():
-                if fig_file.is_file():
-                    shutil.copy2(fig_file, target_figures / fig_file.name)
+        """同步圖片文件：只複製新增或變更的圖片，並刪除上游已移除的圖片"""
+        sources = []
+        for figures in ("question_figures", "explain_figures"):
+            source_fig = source_question_dir / figures
+            if source_fig.exists():
+                sources.extend(f for f in sorted(source_fig.iterdir()) if f.is_file())
+        
+        # question_figures 與 explain_figures 合併到同一個 figures 目錄
+        self.media.sync_dir(sources, target_question_dir / "figures", self.sync_report)
     
     def convert_single_question(self, question_dir: Path):
         """轉換單個問題"""
@@ -142,7 +147,16 @@ class MkdocConverter:
         # 複製圖片
         self.copy_figures(question_dir, target_question_dir)
         
-        print(f"✓ Converted {question_num}")
+        progress.item(f"✓ Converted {question_num}")
+    
+    def prune_questions(self, question_nums):
+        """刪除不在 question_nums 中的問題目錄（含其 note.md 與圖片）"""
+        for target_question_dir in sorted(self.target_dir.iterdir()):
+            if (target_question_dir.is_dir() and target_question_dir.name.isdigit()
+                    and target_question_dir.name not in question_nums):
+                self.media.sync_dir([], target_question_dir / "figures", self.sync_report)
+                shutil.rmtree(target_question_dir)
+                progress.item(f"✗ Removed {target_question_dir.name}")
     
     def convert_all(self):
         """轉換所有問題"""
@@ -157,19 +171,43 @@ class MkdocConverter:
         question_dirs = [d for d in self.source_dir.iterdir() 
                         if d.is_dir() and d.name.isdigit()]
         question_dirs.sort(key=lambda x: int(x.name))
+        # 分片時只轉換屬於該分片的問題
+        question_dirs = sharding.select_questions(question_dirs, self.shard)
         
         print(f"Converting {len(question_dirs)} questions from {self.source_dir} to {self.target_dir}")
         
-        for question_dir in question_dirs:
+        # 先以進程池優化所有圖片
+        self.media.warm(iter_figure_paths(question_dirs))
+        
+        for question_dir in instrumentation.questions(progress.track(question_dirs, "mkdoc")):
             try:
                 self.convert_single_question(question_dir)
             except Exception as e:
-                print(f"Error converting {question_dir.name}: {e}")
+                progress.warn(f"Error converting {question_dir.name}: {e}")
+        
+        # 刪除上游已移除（或不在本分片）的問題頁面
+        self.prune_questions({d.name for d in question_dirs})
+        
+        # 生成 mkdocs nav 與分片搜尋索引
+        records = [load_question(d) for d in question_dirs]
+        write_mkdocs_site(self.target_dir, records, shard_size=self.search_shard_size)
         
         print(f"\n✅ Conversion completed! {len(question_dirs)} questions converted.")
+        print(f"Figures: {self.sync_report.summary()}")
 
 def main():
-    converter = MkdocConverter()
+    parser = argparse.ArgumentParser(description="Convert normalized_questions to mkdoc format")
+    parser.add_argument("--search-shard-size", type=int, default=SEARCH_SHARD_SIZE,
+                        help=f"questions per search index shard and nav section (default: {SEARCH_SHARD_SIZE})")
+    add_media_arguments(parser)
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+    
+    target_dir = args.shard.output_path("mkdoc") if args.shard else "mkdoc"
+    converter = MkdocConverter(target_dir=target_dir, media=media_from_args(args),
+                               search_shard_size=args.search_shard_size, shard=args.shard)
     converter.convert_all()
 
 if __name__ == "__main__":
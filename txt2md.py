@@ -5,11 +5,19 @@ This script takes the normalized questions and generates a folder structure
 suitable for mkdocs, with each question in its own folder.
 """
 
+import argparse
 import os
-import shutil
 import glob
+import shutil
 from pathlib import Path
 
+import instrumentation
+import progress
+import sharding
+from media_utils import MediaPipeline, SyncReport, add_media_arguments, iter_figure_paths, media_from_args
+from mkdocs_index import SEARCH_SHARD_SIZE, write_mkdocs_site
+from question_loader import load_question
+
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 NORMALIZED_DIR = os.path.join(BASE_DIR, "normalized_questions")
@@ -19,8 +27,13 @@ def ensure_dir(directory):
     """Ensure a directory exists, create it if it doesn't."""
     os.makedirs(directory, exist_ok=True)
 
-def create_question_md(question_num, source_dir, target_dir):
-    """Create a markdown file for a question."""
+def create_question_md(question_num, source_dir, target_dir, media=None, report=None):
+    """Create a markdown file for a question.
+
+    media is a MediaPipeline that decides how figures are placed; by
+    default they are plain copies. Figure changes are counted in report.
+    """
+    media = media or MediaPipeline()
     # Ensure target directory exists
     ensure_dir(target_dir)
     
@@ -33,7 +46,7 @@ def create_question_md(question_num, source_dir, target_dir):
         with open(question_path, 'r', encoding='utf-8') as f:
             question_content = f.read().strip()
     except FileNotFoundError:
-        print(f"Warning: question.txt not found in {source_dir}")
+        progress.warn(f"Warning: question.txt not found in {source_dir}")
         question_content = "Question content not available"
     
     # Read options
@@ -46,7 +59,7 @@ def create_question_md(question_num, source_dir, target_dir):
                 if option_content:  # Only add non-empty options
                     options.append((letter, option_content))
         except FileNotFoundError:
-            print(f"Warning: option_{letter}.txt not found in {source_dir}")
+            progress.warn(f"Warning: option_{letter}.txt not found in {source_dir}")
     
     # Read correct answer
     correct_answer_path = os.path.join(source_dir, "correct_answer.txt")
@@ -54,7 +67,7 @@ def create_question_md(question_num, source_dir, target_dir):
         with open(correct_answer_path, 'r', encoding='utf-8') as f:
             correct_answer = f.read().strip()
     except FileNotFoundError:
-        print(f"Warning: correct_answer.txt not found in {source_dir}")
+        progress.warn(f"Warning: correct_answer.txt not found in {source_dir}")
         correct_answer = "?"
     
     # Read explanation
@@ -63,7 +76,7 @@ def create_question_md(question_num, source_dir, target_dir):
         with open(explain_path, 'r', encoding='utf-8') as f:
             explanation = f.read().strip()
     except FileNotFoundError:
-        print(f"Warning: explain.txt not found in {source_dir}")
+        progress.warn(f"Warning: explain.txt not found in {source_dir}")
         explanation = "No explanation available"
     
     # Check for question figures
@@ -80,21 +93,15 @@ def create_question_md(question_num, source_dir, target_dir):
         explain_figures = [os.path.basename(f) for f in glob.glob(os.path.join(explain_figures_dir, "*")) 
                           if os.path.isfile(f) and not os.path.basename(f).startswith('.')]
     
-    # Copy figures to the target directory
+    # Sync question and explanation figures into the target directory,
+    # placing only new or changed files and removing deleted ones
     target_figures_dir = os.path.join(target_dir, "figures")
-    ensure_dir(target_figures_dir)
-    
-    # Copy question figures
-    if os.path.exists(question_figures_dir):
-        for figure in glob.glob(os.path.join(question_figures_dir, "*")):
-            if os.path.isfile(figure) and not os.path.basename(figure).startswith('.'):
-                shutil.copy2(figure, target_figures_dir)
-    
-    # Copy explanation figures
-    if os.path.exists(explain_figures_dir):
-        for figure in glob.glob(os.path.join(explain_figures_dir, "*")):
-            if os.path.isfile(figure) and not os.path.basename(figure).startswith('.'):
-                shutil.copy2(figure, target_figures_dir)
+    figure_sources = [
+        os.path.join(question_figures_dir, figure) for figure in sorted(question_figures)
+    ] + [
+        os.path.join(explain_figures_dir, figure) for figure in sorted(explain_figures)
+    ]
+    media.sync_dir(figure_sources, target_figures_dir, report if report is not None else SyncReport())
     
     # Create markdown content
     md_content = [f"# Question\n\n## {question_num:03d}\n"]
@@ -107,7 +114,8 @@ def create_question_md(question_num, source_dir, target_dir):
         for figure in sorted(question_figures):
             figure_name = os.path.splitext(figure)[0]
             md_content.append(f"#### Figure: {figure_name}\n")
-            md_content.append(f"![{figure_name}](./figures/{figure})\n")
+            figure_path = os.path.join(question_figures_dir, figure)
+            md_content.append(media.figure_html(figure_path, "./figures/", figure_name) + "\n")
     
     # Add options
     md_content.append("\n## Options\n")
@@ -128,7 +136,8 @@ def create_question_md(question_num, source_dir, target_dir):
         for figure in sorted(explain_figures):
             figure_name = os.path.splitext(figure)[0]
             md_content.append(f"#### Figure: {figure_name}\n")
-            md_content.append(f"![{figure_name}](./figures/{figure})\n")
+            figure_path = os.path.join(explain_figures_dir, figure)
+            md_content.append(media.figure_html(figure_path, "./figures/", figure_name) + "\n")
     
     # Write to index.md
     with open(index_md_path, 'w', encoding='utf-8') as f:
@@ -141,36 +150,76 @@ def create_question_md(question_num, source_dir, target_dir):
     
     return True
 
-def convert_all_questions():
-    """Convert all normalized questions to markdown files."""
+def convert_all_questions(normalized_dir=NORMALIZED_DIR, mkdocs_dir=MKDOCS_DIR, media=None,
+                          search_shard_size=SEARCH_SHARD_SIZE, shard=None):
+    """Convert all normalized questions to markdown files.
+
+    Also writes the mkdocs config with the nav and a sharded search index,
+    and removes the pages of questions that no longer exist. With shard,
+    only the questions of that sharding.Shard are converted.
+    """
     # Ensure mkdocs directory exists
-    ensure_dir(MKDOCS_DIR)
+    ensure_dir(mkdocs_dir)
     
     # Get all question directories
     question_dirs = []
-    for item in os.listdir(NORMALIZED_DIR):
-        item_path = os.path.join(NORMALIZED_DIR, item)
+    for item in os.listdir(normalized_dir):
+        item_path = os.path.join(normalized_dir, item)
         if os.path.isdir(item_path) and item.isdigit():
             question_dirs.append((int(item), item_path))
     
     # Sort by question number
     question_dirs.sort()
+    if shard is not None:
+        selected = set(sharding.select_questions([path for _, path in question_dirs], shard))
+        question_dirs = [item for item in question_dirs if item[1] in selected]
     
-    # Process each question
-    for question_num, source_dir in question_dirs:
-        print(f"Processing question {question_num:03d}")
-        target_dir = os.path.join(MKDOCS_DIR, f"{question_num:03d}")
-        create_question_md(question_num, source_dir, target_dir)
+    # Optimize all figures up front on a process pool
+    media = media or MediaPipeline()
+    report = SyncReport()
+    media.warm(iter_figure_paths(source_dir for _, source_dir in question_dirs))
     
-    print(f"Converted {len(question_dirs)} questions to markdown files in {MKDOCS_DIR}")
+    # Process each question
+    tracked = progress.track(question_dirs, "mkdocs", key=lambda item: item[0])
+    for question_num, source_dir in instrumentation.questions(tracked, key=lambda item: f"{item[0]:03d}"):
+        progress.item(f"Processing question {question_num:03d}")
+        target_dir = os.path.join(mkdocs_dir, f"{question_num:03d}")
+        create_question_md(question_num, source_dir, target_dir, media, report)
+    
+    # Remove questions that were deleted upstream (or are outside the shard)
+    question_names = {f"{question_num:03d}" for question_num, _ in question_dirs}
+    for name in sorted(os.listdir(mkdocs_dir)):
+        target_dir = os.path.join(mkdocs_dir, name)
+        if name.isdigit() and name not in question_names and os.path.isdir(target_dir):
+            media.sync_dir([], os.path.join(target_dir, "figures"), report)
+            shutil.rmtree(target_dir)
+            progress.item(f"Removed question {name}")
+    
+    # Generate the nav and the prebuilt search index from the question records
+    records = [load_question(source_dir) for _, source_dir in question_dirs]
+    write_mkdocs_site(mkdocs_dir, records, shard_size=search_shard_size)
+    
+    print(f"Converted {len(question_dirs)} questions to markdown files in {mkdocs_dir}")
+    print(f"Figures: {report.summary()}")
     return len(question_dirs)
 
 def main():
     """Main function."""
+    parser = argparse.ArgumentParser(description="Convert normalized questions to Markdown files for mkdocs")
+    parser.add_argument("--search-shard-size", type=int, default=SEARCH_SHARD_SIZE,
+                        help=f"questions per search index shard and nav section (default: {SEARCH_SHARD_SIZE})")
+    add_media_arguments(parser)
+    sharding.add_shard_argument(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+    
+    mkdocs_dir = args.shard.output_path(MKDOCS_DIR) if args.shard else MKDOCS_DIR
     print("Converting normalized questions to markdown files for mkdocs...")
-    num_converted = convert_all_questions()
+    num_converted = convert_all_questions(NORMALIZED_DIR, mkdocs_dir, media_from_args(args),
+                                          args.search_shard_size, args.shard)
     print(f"Completed! Converted {num_converted} questions.")
-    print(f"Markdown files are located at: {MKDOCS_DIR}")
+    print(f"Markdown files are located at: {mkdocs_dir}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Watch zips/ and normalized_questions/ and rebuild only the changed questions.
+監看 zips/ 與 normalized_questions/，只重建有變更的題目
+
+    python watch.py                              # deck, mdbook and mkdoc
+    python watch.py --exporters mdbook mkdocs sheet
+    python watch.py --package                    # also re-package the Anki deck
+
+Changes are debounced, then mapped to question numbers: a new or changed
+archive in zips/ is extracted into normalized_questions/NNN, and edits
+under normalized_questions/NNN rebuild question NNN. Edits rewrite only
+that question's card, chapter or page (plus the mkdocs nav and search
+index); adding or removing a question rebuilds the affected exporter.
+Exporters without per-question updates (html, sheet, columnar, anki-deck,
+md2anki) are rebuilt in full on every change.
+
+Uses watchdog for filesystem events when it is installed
+(`uv pip install watchdog`), and polls the directories otherwise.
+"""
+
+import argparse
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import instrumentation
+import progress
+from media_utils import MediaPipeline, SyncReport, add_media_arguments, media_from_args
+from output_utils import write_if_changed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ZIPS_DIR = os.path.join(BASE_DIR, "zips")
+NORMALIZED_DIR = os.path.join(BASE_DIR, "normalized_questions")
+
+DEFAULT_EXPORTERS = ("deck", "mdbook", "mkdoc")
+POLL_INTERVAL = 0.25
+DEBOUNCE = 0.15
+
+
+def scan(zips_dir, normalized_dir):
+    """Return {path: (mtime_ns, size)} for the archives and question files."""
+    snapshot = {}
+    if os.path.isdir(zips_dir):
+        for entry in os.scandir(zips_dir):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    if os.path.isdir(normalized_dir):
+        for entry in os.scandir(normalized_dir):
+            if entry.is_dir() and entry.name.isdigit():
+                scan_question(entry.path, snapshot)
+    return snapshot
+
+
+def scan_question(question_dir, snapshot):
+    """Add {path: (mtime_ns, size)} of the files of one question folder to snapshot."""
+    if not os.path.isdir(question_dir):
+        return
+    # An empty question directory still counts as a question
+    snapshot[question_dir] = (0, 0)
+    for root, dirs, files in os.walk(question_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+
+def changed_paths(before, after):
+    return sorted(path for path in set(before) | set(after) if before.get(path) != after.get(path))
+
+
+def question_names(snapshot, normalized_dir):
+    """Return the question directory names in a snapshot."""
+    prefix = os.path.join(normalized_dir, "")
+    return {path[len(prefix):].split(os.sep)[0] for path in snapshot if path.startswith(prefix)}
+
+
+class DeckExporter:
+    """medical_questions.md of convert_to_mdankideck, with one cached card per question."""
+
+    name = "deck"
+
+    def __init__(self, normalized_dir, media, package=False):
+        import convert_to_mdankideck
+        self.deck = convert_to_mdankideck
+        self.normalized_dir = Path(normalized_dir)
+        self.package = package
+        self.cards = {}
+
+    def render_card(self, question_dir):
+        try:
+            return self.deck.create_anki_card(question_dir, int(question_dir.name))
+        except Exception as e:
+            progress.warn(f"Error processing question {question_dir.name}: {e}")
+            return None
+
+    def build(self, records):
+        self.cards = {}
+        self.update(list(self.deck.list_question_dirs(self.normalized_dir)), records)
+
+    def update(self, question_dirs, records):
+        for question_dir in question_dirs:
+            self.cards[question_dir.name] = self.render_card(Path(question_dir))
+        # Same content as write_single_deck
+        cards = [f"# {self.deck.DECK_TITLE}\n"]
+        for question_dir in self.deck.list_question_dirs(self.normalized_dir):
+            if question_dir.name not in self.cards:
+                self.cards[question_dir.name] = self.render_card(question_dir)
+            if self.cards[question_dir.name] is not None:
+                cards.append(self.cards[question_dir.name])
+        self.deck.OUTPUT_DIR.mkdir(exist_ok=True)
+        write_if_changed(self.deck.OUTPUT_DIR / "medical_questions.md", "\n\n".join(cards))
+        if self.package:
+            if not self.deck.package_deck(self.deck.OUTPUT_DIR, "."):
+                raise RuntimeError("mdankideck did not write medical_questions.apkg")
+            self.deck.normalize_package(Path(".") / "medical_questions.apkg")
+
+
+class MdbookExporter:
+    name = "mdbook"
+
+    def __init__(self, normalized_dir, media, package=False):
+        import create_mdbook
+        self.mdbook = create_mdbook
+        self.normalized_dir = normalized_dir
+        self.media = media
+
+    def build(self, records):
+        self.mdbook.build_book(self.normalized_dir, self.mdbook.BOOK_DIR, self.media)
+
+    def update(self, question_dirs, records):
+        chapters, figures = self.mdbook.update_questions(self.normalized_dir, self.mdbook.BOOK_DIR,
+                                                         [str(d) for d in question_dirs], self.media)
+        progress.item(f"mdbook chapters: {chapters.summary()}")
+        progress.item(f"mdbook images: {figures.summary()}")
+
+
+class MkdocExporter:
+    name = "mkdoc"
+
+    def __init__(self, normalized_dir, media, package=False):
+        from mkdocs_index import write_mkdocs_site
+        from to_mkdoc import MkdocConverter
+        self.converter = MkdocConverter(normalized_dir, media=media)
+        self.write_site = write_mkdocs_site
+
+    def build(self, records):
+        self.converter.convert_all()
+
+    def update(self, question_dirs, records):
+        for question_dir in question_dirs:
+            self.converter.convert_single_question(Path(question_dir))
+        self.write_site(self.converter.target_dir, records, shard_size=self.converter.search_shard_size)
+
+
+class MkdocsExporter:
+    name = "mkdocs"
+
+    def __init__(self, normalized_dir, media, package=False):
+        import txt2md
+        from mkdocs_index import write_mkdocs_site
+        self.txt2md = txt2md
+        self.write_site = write_mkdocs_site
+        self.normalized_dir = normalized_dir
+        self.media = media
+
+    def build(self, records):
+        self.txt2md.convert_all_questions(self.normalized_dir, self.txt2md.MKDOCS_DIR, self.media)
+
+    def update(self, question_dirs, records):
+        report = SyncReport()
+        for question_dir in question_dirs:
+            name = os.path.basename(question_dir)
+            target_dir = os.path.join(self.txt2md.MKDOCS_DIR, name)
+            self.txt2md.create_question_md(int(name), str(question_dir), target_dir, self.media, report)
+        self.write_site(self.txt2md.MKDOCS_DIR, records)
+
+
+class FullExporter:
+    """An exporter without per-question updates, rebuilt in full on every change."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def build(self, records):
+        instrumentation.STAGES[self.name]()
+
+    def update(self, question_dirs, records):
+        self.build(records)
+
+
+INCREMENTAL_EXPORTERS = {
+    "deck": DeckExporter,
+    "mdbook": MdbookExporter,
+    "mkdoc": MkdocExporter,
+    "mkdocs": MkdocsExporter,
+}
+FULL_EXPORTERS = ("html", "sheet", "columnar", "anki-deck", "md2anki")
+
+
+class Watcher:
+    """Keeps the question records in memory and rebuilds changed questions."""
+
+    def __init__(self, exporters, zips_dir=ZIPS_DIR, normalized_dir=NORMALIZED_DIR):
+        self.exporters = exporters
+        self.zips_dir = zips_dir
+        self.normalized_dir = normalized_dir
+        self.records = {}
+        self.snapshot = {}
+        self.extracted = set()  # question folders written by the last extract()
+
+    def load_records(self, names):
+        from question_loader import load_question
+        for name in names:
+            question_dir = Path(self.normalized_dir) / name
+            if question_dir.is_dir():
+                self.records[name] = load_question(question_dir)
+            else:
+                self.records.pop(name, None)
+
+    def sorted_records(self):
+        return [self.records[name] for name in sorted(self.records, key=int)]
+
+    def build_all(self):
+        self.snapshot = scan(self.zips_dir, self.normalized_dir)
+        self.load_records(question_names(self.snapshot, self.normalized_dir))
+        for exporter in self.exporters:
+            self.run(exporter, exporter.build, self.sorted_records())
+
+    def run(self, exporter, func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            progress.warn(f"{exporter.name}: {type(e).__name__}: {e}")
+
+    def extract(self, archives):
+        """Extract changed archives. Returns the question names they produced."""
+        import extract_and_normalize
+        names = set()
+        for archive in archives:
+            question_num = extract_and_normalize.archive_question_number(archive)
+            if question_num is None:
+                continue
+            if not os.path.exists(archive):
+                print(f"{os.path.basename(archive)} was removed; normalized_questions/{question_num:03d} is kept")
+                continue
+            if extract_and_normalize.extract_archive(archive, question_num):
+                names.add(f"{question_num:03d}")
+        self.extracted = names
+        return names
+
+    def rebuild(self, paths):
+        """Rebuild the questions affected by the changed paths."""
+        archives = [path for path in paths if os.path.dirname(path) == os.path.normpath(self.zips_dir)]
+        prefix = os.path.join(self.normalized_dir, "")
+        names = {path[len(prefix):].split(os.sep)[0] for path in paths if path.startswith(prefix)}
+        names |= self.extract(archives)
+        if not names:
+            return set()
+
+        before = set(self.records)
+        self.load_records(names)
+        structural = set(self.records) != before
+        records = self.sorted_records()
+        existing = [Path(self.normalized_dir) / name for name in sorted(names) if name in self.records]
+        for exporter in self.exporters:
+            if structural:
+                self.run(exporter, exporter.build, records)
+            else:
+                self.run(exporter, exporter.update, existing, records)
+        return names
+
+    def poll(self):
+        """Scan for changes; returns the changed paths since the last build and the settled scan."""
+        current = scan(self.zips_dir, self.normalized_dir)
+        if current == self.snapshot:
+            return [], current
+        # Debounce: wait until the trees stop changing
+        while True:
+            time.sleep(DEBOUNCE)
+            settled = scan(self.zips_dir, self.normalized_dir)
+            if settled == current:
+                break
+            current = settled
+        return changed_paths(self.snapshot, current), current
+
+    def handle_changes(self):
+        paths, settled = self.poll()
+        if not paths:
+            return
+        start = time.perf_counter()
+        self.extracted = set()
+        names = self.rebuild(paths)
+        # The settled scan is the new baseline, so edits saved during the
+        # rebuild are picked up next time. Only the question folders that
+        # extraction wrote itself are re-scanned, as those are not changes
+        # to react to.
+        for name in self.extracted:
+            question_dir = os.path.join(self.normalized_dir, name)
+            prefix = os.path.join(question_dir, "")
+            for path in [path for path in settled if path == question_dir or path.startswith(prefix)]:
+                del settled[path]
+            scan_question(question_dir, settled)
+        self.snapshot = settled
+        if names:
+            exporters = ", ".join(exporter.name for exporter in self.exporters)
+            print(f"[{datetime.now():%H:%M:%S}] rebuilt {', '.join(sorted(names))} "
+                  f"({exporters}) in {time.perf_counter() - start:.2f} s")
+
+
+def start_observer(directories, wake):
+    """Start a watchdog observer that sets wake on any event. Returns None without watchdog."""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wake.set()
+
+    observer = Observer()
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+        observer.schedule(Handler(), directory, recursive=True)
+    observer.start()
+    return observer
+
+
+def watch(watcher, interval=POLL_INTERVAL, use_events=True):
+    """Rebuild changed questions until interrupted."""
+    wake = threading.Event()
+    observer = start_observer([watcher.zips_dir, watcher.normalized_dir], wake) if use_events else None
+    mode = "filesystem events" if observer else f"polling every {interval} s"
+    print(f"Watching {watcher.zips_dir} and {watcher.normalized_dir} ({mode}), Ctrl+C to stop")
+    try:
+        while True:
+            if observer:
+                # Rescan now and then too, in case an event was missed
+                wake.wait(timeout=5)
+                wake.clear()
+            else:
+                time.sleep(interval)
+            watcher.handle_changes()
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        if observer:
+            observer.stop()
+            observer.join()
+
+
+def make_exporters(names, media=None, package=False, normalized_dir=NORMALIZED_DIR):
+    media = media or MediaPipeline()
+    exporters = []
+    for name in names:
+        if name in INCREMENTAL_EXPORTERS:
+            exporters.append(INCREMENTAL_EXPORTERS[name](normalized_dir, media, package))
+        else:
+            exporters.append(FullExporter(name))
+    return exporters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch zips/ and normalized_questions/ and rebuild changed questions")
+    parser.add_argument("--exporters", nargs="+", default=list(DEFAULT_EXPORTERS), metavar="NAME",
+                        help=f"exporters to keep up to date: {', '.join(INCREMENTAL_EXPORTERS)} (per question), "
+                             f"{', '.join(FULL_EXPORTERS)} (full rebuild) (default: {' '.join(DEFAULT_EXPORTERS)})")
+    parser.add_argument("--package", action="store_true", help="re-package medical_questions.apkg after deck updates")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                        help=f"seconds between scans when polling (default: {POLL_INTERVAL})")
+    parser.add_argument("--polling", action="store_true", help="poll even when watchdog is installed")
+    parser.add_argument("--no-initial-build", action="store_true",
+                        help="do not rebuild every exporter at startup (outputs must be up to date)")
+    add_media_arguments(parser)
+    progress.add_progress_arguments(parser)
+    args = parser.parse_args()
+    progress.configure_from_args(args)
+
+    unknown = [name for name in args.exporters if name not in INCREMENTAL_EXPORTERS and name not in FULL_EXPORTERS]
+    if unknown:
+        parser.error(f"unknown exporter(s): {', '.join(unknown)}")
+
+    watcher = Watcher(make_exporters(args.exporters, media_from_args(args), args.package))
+    if args.no_initial_build:
+        watcher.snapshot = scan(watcher.zips_dir, watcher.normalized_dir)
+        watcher.load_records(question_names(watcher.snapshot, watcher.normalized_dir))
+        for exporter in watcher.exporters:
+            # The deck keeps its cards in memory
+            if isinstance(exporter, DeckExporter):
+                watcher.run(exporter, exporter.build, watcher.sorted_records())
+    else:
+        print("Building every exporter once...")
+        watcher.build_all()
+    watch(watcher, args.interval, use_events=not args.polling)
+
+
+if __name__ == "__main__":
+    main()